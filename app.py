@@ -1,18 +1,66 @@
-from flask import Flask, render_template, request, redirect, url_for, session, flash, jsonify
+from flask import (Flask, Response, g, has_request_context, render_template, request, redirect, url_for, session,
+                   flash, jsonify)
 import mysql.connector
-import random
+import gc
+import os
+import threading
+import time
 from datetime import datetime, timedelta, date
-from flask_session import Session
 import uuid
-import re # For parsing duration strings
+from db_pool import ConnectionPool, PoolTimeout
+from db_replicas import ReplicaMonitor, ReplicaSet
+from session_store import init_session
+from metrics import PROMETHEUS_MIMETYPE, init_metrics, instrument_connection, observe_connect, registry as metrics_registry
+from page_cache import init_response_cache
+from route_catalog import RouteCatalog
+from journey_metrics import journey_co2_kg
+from journey_search import (QUOTED_SORTS, SEARCH_PAGE_SIZE, InvalidCursor, build_search_query, decode_cursor,
+                            quoted_price_page, rank_by_price, split_page)
+from journey_snapshot import JourneySnapshotStore, SnapshotRefresher
+from journey_planner import JourneyPlanner, build_connection_result, connection_fare
+from search_cache import SearchResultCache
+from dataset_versions import VersionWatcher
+from seat_inventory import (HoldSweeper, SeatsUnavailable, claim_hold, place_hold, release_hold, return_seats,
+                            take_seats)
+from user_stats import read_user_stats, record_booking_change
+from booking_store import BOOKING_HISTORY_SQL, booking_page, get_booking
+from booking_export import EXPORT_MIMETYPES, export_chunks
+from booking_notifications import BOOKING_EMAIL, Mailer, booking_email_handler
+from job_queue import JobQueue, enqueue, start_workers
+from fare_calendar import build_calendar, load_route_fares, parse_window
+from quotes import (PROMO_DISCOUNT_SHARE, STUDENT_FARES_OFFERED, TRIP_TYPES, quote_journey, quote_journeys,
+                    student_fare_requested)
+from search_api import (NDJSON_MIMETYPE, SearchParamsError, build_batch_query, build_stream_query,
+                        journey_records, ndjson_line, parse_batch_pairs, parse_search_params, stream_batches)
 # import io # Removed as PDF generation is no longer needed
 
 app = Flask(__name__)
+app.jinja_env.globals['student_fares_offered'] = STUDENT_FARES_OFFERED  # the student fare options are hidden until then
+
+# --- Configuration ---
+# The settings below are defaults. load_config() (and create_app(), which calls it) overrides them from
+# FLASK_-prefixed environment variables (values parsed as JSON; '__' reaches into a dict), e.g.
+# FLASK_SECRET_KEY, FLASK_SESSION_BACKEND=redis, FLASK_DB__host=db-1, FLASK_DB_POOL__pool_size=20,
+# FLASK_DB_REPLICAS='[{"host": "replica-1"}]', FLASK_JOB_WORKERS=0, and then from the mapping passed to it.
+# Session, metrics and response-cache hooks are installed by create_app() once the config is final.
 
 # --- Flask Session Configuration ---
+# SESSION_BACKEND: 'filesystem' (Flask-Session files, swept when expired), 'cookie' (signed cookie,
+# needs a secret key), 'memory' (per-process, with expiry) or 'redis' (any Redis-protocol server)
 app.config["SESSION_PERMANENT"] = False
-app.config["SESSION_TYPE"] = "filesystem"
-Session(app)
+app.config["SESSION_BACKEND"] = "filesystem"
+app.config["SESSION_REDIS_URL"] = "redis://localhost:6379/0"
+
+# --- Instrumentation ---
+# Requests slower than SLOW_REQUEST_SECONDS are logged with their SQL and timings (None disables);
+# SLOW_REQUEST_LOG optionally sends that log to a file. Metrics are served at /metrics.
+app.config["SLOW_REQUEST_SECONDS"] = 1.0
+app.config["SLOW_REQUEST_LOG"] = None
+
+# --- Response Caching ---
+# help/about/why_us are rendered once per process and only the header's username is filled in per request;
+# static URLs carry a content hash and are served as immutable; text responses are gzip/brotli compressed.
+page_cache = compressed_body_cache = None  # set by create_app()
 
 # --- MySQL Database Configuration ---
 # IMPORTANT: Replace with your actual MySQL credentials
@@ -22,94 +70,423 @@ DB_CONFIG = {
     'password': 'root',
     'database': 'green_journey_db'
 }
-
-def get_db_connection():
+app.config["DB"] = DB_CONFIG
+
+# --- Connection Pool Configuration ---
+# Connections are reused across requests instead of reconnecting on every hit.
+DB_POOL_CONFIG = {
+    'pool_size': 10,          # Max open connections per worker process
+    'checkout_timeout': 5.0,  # Seconds to wait for a free connection
+    'recycle_seconds': 1800,  # Reopen connections older than this
+    'pre_ping': True          # Ping idle connections before handing them out
+}
+app.config["DB_POOL"] = DB_POOL_CONFIG
+
+# --- Read Replicas ---
+# Read-only queries (searches, route and fare loads, login, account pages) go round-robin to these hosts,
+# e.g. [dict(DB_CONFIG, host='replica-1'), dict(DB_CONFIG, host='replica-2')]; with none, everything uses DB_CONFIG.
+REPLICA_CONFIGS = []
+app.config["DB_REPLICAS"] = REPLICA_CONFIGS  # entries from create_app's config only need what differs from DB
+REPLICA_MAX_LAG_SECONDS = 5   # replicas further behind their primary leave the rotation
+REPLICA_CHECK_INTERVAL = 5    # seconds between health checks
+# After a user writes, their reads stay on the primary long enough for any replica in rotation to catch up
+READ_YOUR_WRITES_SECONDS = REPLICA_MAX_LAG_SECONDS + REPLICA_CHECK_INTERVAL
+
+def pin_to_primary():
+    """Call after a user's write commits: their reads go to the primary for READ_YOUR_WRITES_SECONDS."""
+    session['primary_until'] = time.time() + READ_YOUR_WRITES_SECONDS
+
+def pinned_to_primary():
+    return has_request_context() and session.get('primary_until', 0) > time.time()
+
+def get_db_connection(read_only=False):
+    # Returned connection goes back to the pool when the route calls conn.close().
+    # read_only: the caller only reads, so a replica will do unless this user has just written.
     try:
-        conn = mysql.connector.connect(**DB_CONFIG)
-        return conn
+        started = time.perf_counter()
+        conn = replica_set.connect() if read_only and not pinned_to_primary() else None
+        if conn is None:
+            conn = db_pool.connect()
+        observe_connect(time.perf_counter() - started)
+        return instrument_connection(conn)
+    except PoolTimeout as err:
+        print(f"Database pool exhausted: {err}")
+        flash("The service is busy right now. Please try again in a moment.", 'error')
+        return None
     except mysql.connector.Error as err:
         print(f"Error connecting to database: {err}")
         flash(f"Database connection error: {err}. Please check your database server.", 'error')
         return None
 
+# --- Seat Inventory ---
+# select_journey holds seats for SEAT_HOLD_SECONDS; unpaid holds are released by a background sweeper.
+SEAT_HOLD_SECONDS = 600
+HOLD_SWEEP_INTERVAL = 60
+
+# --- Background Jobs ---
+# Work a booking causes beyond its own rows (emails) is enqueued in the booking transaction and run by
+# JOB_WORKERS threads per process. Set JOB_WORKERS to 0 to run them only in `python job_queue.py work`.
+app.config["JOB_WORKERS"] = 2
+app.config["MAIL_SERVER"] = None  # SMTP host for booking emails; None prints them instead
+JOB_POLL_INTERVAL = 2  # seconds; jobs enqueued by this process wake a worker straight away
+mailer = Mailer()
+job_queue = JobQueue(lambda: db_pool.connect(), handlers={BOOKING_EMAIL: booking_email_handler(mailer)})
+
+# --- Per-Process Resources ---
+# Connection pools and background threads are created by init_worker() before the first request a process
+# serves, never at import: a pre-fork server's master then holds no connections or threads, which would not
+# survive into its workers anyway. Benchmarks and tests may assign db_pool/replica_set before that.
+db_pool = None
+replica_set = None
+replica_monitor = None
+hold_sweeper = None
+job_workers = []
+journey_snapshots = None  # JourneySnapshotStore, when JOURNEY_SNAPSHOT_PATH is set
+snapshot_refresher = None
+_worker_pid = None  # the process init_worker() last ran in
+_worker_lock = threading.Lock()
+
+def init_worker():
+    """Creates this process's connection pools and starts its background threads; a no-op once done."""
+    global db_pool, replica_set, replica_monitor, hold_sweeper, job_workers, journey_snapshots, snapshot_refresher
+    global _worker_pid
+    pid = os.getpid()
+    if _worker_pid == pid:
+        return
+    with _worker_lock:
+        if _worker_pid == pid:
+            return
+        if _worker_pid is not None:
+            # Forked after initialising: the parent's connections and threads are not this process's
+            db_pool = replica_set = journey_snapshots = None
+        if db_pool is None:
+            db_pool = ConnectionPool(lambda: mysql.connector.connect(**DB_CONFIG), **DB_POOL_CONFIG)
+        if replica_set is None:
+            replica_set = ReplicaSet([ConnectionPool(lambda config=config: mysql.connector.connect(**config),
+                                                     **DB_POOL_CONFIG) for config in REPLICA_CONFIGS],
+                                     max_lag_seconds=REPLICA_MAX_LAG_SECONDS)
+        if len(replica_set):
+            replica_monitor = ReplicaMonitor(replica_set, interval=REPLICA_CHECK_INTERVAL)
+            replica_monitor.start()
+        hold_sweeper = HoldSweeper(lambda: db_pool.connect(), interval=HOLD_SWEEP_INTERVAL)
+        hold_sweeper.start()
+        job_workers = start_workers(job_queue, app.config["JOB_WORKERS"], JOB_POLL_INTERVAL)
+        if journey_snapshots is None and app.config["JOURNEY_SNAPSHOT_PATH"]:
+            journey_snapshots = JourneySnapshotStore(app.config["JOURNEY_SNAPSHOT_PATH"])
+        if journey_snapshots is not None:
+            snapshot_refresher = SnapshotRefresher(journey_snapshots, lambda: db_pool.connect(),
+                                                   interval=JOURNEYS_VERSION_POLL_SECONDS)
+            snapshot_refresher.start()
+        _worker_pid = pid
+
+app.before_request(init_worker)
+
 def verify_password(stored_password, provided_password):
     return stored_password == provided_password
 
-def get_unique_origins():
-    origins = set()
-    conn = get_db_connection()
-    if conn:
+# Bookings per route rank the autocomplete suggestions
+ROUTE_PAIRS_SQL = ("SELECT j.origin, j.destination, COUNT(b.id) FROM journeys j"
+                   " LEFT JOIN bookings b ON b.journey_id = j.id GROUP BY j.origin, j.destination")
+
+def load_route_pairs():
+    """Loads every (origin, destination, bookings) route for the route catalog. Returns None on DB errors."""
+    conn = get_db_connection(read_only=True)
+    if not conn:
+        return None
+    cursor = conn.cursor()
+    try:
+        cursor.execute(ROUTE_PAIRS_SQL)
+        return cursor.fetchall()
+    except mysql.connector.Error as err:
+        print(f"Error loading route catalog: {err}")
+        return None
+    finally:
+        cursor.close()
+        conn.close()
+
+# Origin -> destinations map held in memory; call route_catalog.invalidate() after writing journeys
+ROUTE_CATALOG_TTL_SECONDS = 300
+route_catalog = RouteCatalog(load_route_pairs, ttl_seconds=ROUTE_CATALOG_TTL_SECONDS)
+
+def warm_up(connect=None):
+    """Loads the route catalog now, over a connection of its own that is closed again. Returns True if it did.
+
+    create_app() calls this when PREFORK_WARMUP is set, so a pre-fork server that creates the app in its
+    master loads the catalog once and every worker starts with it, sharing its memory copy-on-write until
+    the worker first reloads it. gc.freeze() moves everything loaded so far out of the collector's reach,
+    so that collections in the workers do not write to (and so copy) those pages.
+    """
+    try:
+        conn = connect() if connect else mysql.connector.connect(**DB_CONFIG)
+    except mysql.connector.Error as err:
+        print(f"Warm-up skipped, could not connect: {err}")
+        return False
+    try:
         cursor = conn.cursor()
-        try:
-            cursor.execute("SELECT DISTINCT origin FROM journeys")
-            for (city,) in cursor.fetchall():
-                origins.add(city)
-        except mysql.connector.Error as err:
-            print(f"Error fetching origins: {err}")
-            flash(f"Error loading origins: {err}", 'error')
-        finally:
-            if conn:
-                cursor.close()
-                conn.close()
-    return sorted(list(origins))
+        cursor.execute(ROUTE_PAIRS_SQL)
+        pairs = cursor.fetchall()
+        cursor.close()
+    except mysql.connector.Error as err:
+        print(f"Warm-up skipped, error loading the route catalog: {err}")
+        return False
+    finally:
+        conn.close()
+    route_catalog.load(pairs)
+    gc.freeze()
+    return True
 
 @app.route('/get_destinations/<origin_city>')
 def get_destinations(origin_city):
     """API endpoint to get destinations available from a given origin city."""
-    destinations = set()
-    conn = get_db_connection()
-    if conn:
-        cursor = conn.cursor()
-        try:
-            cursor.execute("SELECT DISTINCT destination FROM journeys WHERE origin = %s", (origin_city,))
-            for (city,) in cursor.fetchall():
-                destinations.add(city)
-        except mysql.connector.Error as err:
-            print(f"Error fetching destinations for {origin_city}: {err}")
-        finally:
-            if conn:
-                cursor.close()
-                conn.close()
-    return jsonify(sorted(list(destinations)))
-
-
-# Helper function to safely convert carbon_footprint string to float
-def parse_carbon_footprint(cf_str):
+    snapshot = current_journey_snapshot()
+    if snapshot is not None:
+        return jsonify(snapshot.destinations(origin_city))
+    return jsonify(route_catalog.destinations(origin_city))
+
+CITY_SUGGESTIONS_LIMIT = 10
+MAX_CITY_SUGGESTIONS = 50
+
+@app.route('/api/v1/cities')
+def api_cities():
+    """City autocomplete: ?q=<typed text>[&origin=<city>][&limit=N].
+
+    Without origin, suggests origin cities; with it, only cities reachable from that origin.
+    """
+    query = request.args.get('q', '')
+    origin = request.args.get('origin')
     try:
-        if cf_str is not None:
-            # Remove 'kg CO2e' and any extra spaces, then convert to float
-            return float(cf_str.replace('kg CO2e', '').strip())
-        return 0.0
-    except (ValueError, AttributeError):
-        return 0.0
-
-# Helper function to parse duration string (e.g., "1h 30m") into minutes for sorting
-def parse_duration_to_minutes(duration_str):
-    if not isinstance(duration_str, str):
-        return 0 # Or raise an error, depending on expected input
-
-    hours = 0
-    minutes = 0
-    
-    # Extract hours
-    h_match = re.search(r'(\d+)h', duration_str)
-    if h_match:
-        hours = int(h_match.group(1))
-    
-    # Extract minutes
-    m_match = re.search(r'(\d+)m', duration_str)
-    if m_match:
-        minutes = int(m_match.group(1))
-        
-    return hours * 60 + minutes
+        limit = min(int(request.args.get('limit', CITY_SUGGESTIONS_LIMIT)), MAX_CITY_SUGGESTIONS)
+    except ValueError:
+        return jsonify({'error': 'limit must be an integer'}), 400
+    if limit < 1:
+        return jsonify({'error': 'limit must be at least 1'}), 400
+    if origin:
+        return jsonify(route_catalog.complete_destinations(origin, query, limit))
+    return jsonify(route_catalog.complete_origins(query, limit))
+
+
+def load_journey_graph_rows():
+    """Loads every journey for the connection planner. Returns None on DB errors."""
+    conn = get_db_connection(read_only=True)
+    if not conn:
+        return None
+    cursor = conn.cursor(dictionary=True)
+    try:
+        cursor.execute("SELECT id, origin, destination, mode, price, duration, duration_minutes, carbon_footprint, co2_kg FROM journeys")
+        return cursor.fetchall()
+    except mysql.connector.Error as err:
+        print(f"Error loading journey graph: {err}")
+        return None
+    finally:
+        cursor.close()
+        conn.close()
+
+# Finds connecting trips when there is no direct journey; invalidate together with route_catalog
+MAX_CONNECTION_LEGS = 3
+journey_planner = JourneyPlanner(load_journey_graph_rows, ttl_seconds=ROUTE_CATALOG_TTL_SECONDS, max_legs=MAX_CONNECTION_LEGS)
+
+CONNECTION_SORT_KEYS = {
+    'cheapest': lambda x: x['cost'],
+    'fastest': lambda x: x['duration_minutes'],
+    'lowest_co2': lambda x: x['co2_emissions'],
+}
+
+def find_connections(origin, destination, selected_modes, sort_by, departure_date, journey_type, show_student_discounts):
+    """Connecting trips from origin to destination, shaped like the direct search results."""
+    plans, graph = journey_planner.connections(origin, destination, modes=selected_modes)
+    quotes = request_quotes((connection_fare(plan), departure_date, journey_type, 1, show_student_discounts)
+                            for plan in plans)
+    connections = [build_connection_result(plan, graph, departure_date, quote)
+                   for plan, quote in zip(plans, quotes)]
+    if sort_by in CONNECTION_SORT_KEYS:
+        connections.sort(key=CONNECTION_SORT_KEYS[sort_by])
+    return connections
 
 
 # --- Routes ---
 
 @app.route('/')
 def index():
-    unique_origins = get_unique_origins()
-    return render_template('index.html', user_id=session.get('user_id'), username=session.get('username'), unique_origins=unique_origins)
+    # Cities are suggested as the user types (/api/v1/cities) rather than listed in full
+    return render_template('index.html', user_id=session.get('user_id'), username=session.get('username'))
+
+def request_quotes(items):
+    """quotes.quote_journeys, memoised for the rest of the request."""
+    return quote_journeys(items, memo=g.setdefault('quotes', {}))
+
+def build_journey_result(journey, departure_date, journey_type, show_student_discounts, quote=None):
+    """Turns a journeys row into the dict results.html renders for one card.
+
+    Pass the row's quote when a batch has already been quoted (see get_search_page).
+    """
+    mode_icon = '' # This will be replaced by Lucide icons in HTML
+    if quote is None:
+        quote = quote_journey(journey, departure_date, journey_type, 1, show_student_discounts)
+
+    # One-way cards keep the timetable's own duration text
+    travel_time_display = quote['travel_time'] if journey_type == 'return' else journey['duration']
+
+    return {
+        'id': journey['id'],
+        'mode': journey['mode'],
+        'mode_icon': mode_icon, # Will be ignored by new HTML, but kept for compatibility
+        'route': f"{journey['origin']} to {journey['destination']} by {journey['mode']}",
+        'times': f"Departs: {departure_date} (Time TBD)", # Actual times from DB would be better
+        'stops': 'Direct', # Simplified for now
+        'travel_time': travel_time_display,
+        'duration_minutes': quote['duration_minutes'],
+        'cost': quote['price'],
+        'co2_emissions': quote['co2_kg'],
+        'student_discount': quote['discounted'],
+        'description': journey['description']
+    }
+
+def fetch_search_page(origin, destination, selected_modes, sort_by, after=None, limit=SEARCH_PAGE_SIZE):
+    """Fetches one page of matching journeys (every one with limit=None), ordered in SQL.
+
+    Returns (rows, next_cursor); rows is None if the database could not be queried.
+    """
+    conn = get_db_connection(read_only=True)
+    if not conn:
+        return None, None
+    cursor = conn.cursor(dictionary=True)
+    try:
+        query, params = build_search_query(origin, destination, selected_modes, sort_by, after, limit)
+        cursor.execute(query, params)
+        return split_page(cursor.fetchall(), sort_by, limit)
+    except mysql.connector.Error as err:
+        flash(f'Error fetching journeys: {err}', 'error')
+        return None, None
+    finally:
+        cursor.close()
+        conn.close()
+
+# Processed search results; cleared when journeys change, see on_journeys_changed()
+search_cache = SearchResultCache(max_entries=2048, ttl_seconds=120)
+
+# Each route's journeys as arrays for the fare calendar, keyed (origin, destination); same invalidation
+route_fares_cache = SearchResultCache(max_entries=1024, ttl_seconds=600)
+
+# Each route's journeys in quoted price order for the QUOTED_SORTS pages, keyed like search_cache without
+# the page cursor; same invalidation
+quoted_rankings_cache = SearchResultCache(max_entries=1024, ttl_seconds=120)
+
+def get_search_page(origin, destination, selected_modes, sort_by, departure_date, journey_type, show_student_discounts, after_token=None):
+    """One page of processed search results as (results, next_cursor), served from search_cache when possible.
+
+    The first page falls back to connecting trips when there is no direct journey.
+    Returns (None, None) if the database could not be queried; errors are not cached.
+    Raises InvalidCursor for a bad after_token.
+    """
+    cache_key = search_page_key(origin, destination, selected_modes, sort_by, departure_date, journey_type,
+                                show_student_discounts, after_token)
+    cached = search_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    after = decode_cursor(after_token, sort_by) if after_token else None
+    if sort_by in QUOTED_SORTS:
+        ranking = get_quoted_ranking(origin, destination, selected_modes, sort_by, departure_date, journey_type,
+                                     show_student_discounts)
+        if ranking is None:
+            return None, None
+        rows, next_cursor = quoted_price_page(ranking, after)
+    else:
+        snapshot = current_journey_snapshot()
+        if snapshot is not None:
+            rows, next_cursor = snapshot.search_page(origin, destination, selected_modes, sort_by, after)
+        else:
+            rows, next_cursor = fetch_search_page(origin, destination, selected_modes, sort_by, after)
+        if rows is None:
+            return None, None
+    return process_search_page(cache_key, rows, next_cursor, after is None, origin, destination, selected_modes,
+                               sort_by, departure_date, journey_type, show_student_discounts)
+
+def quoted_ranking_key(origin, destination, selected_modes, sort_by, departure_date, journey_type, show_student_discounts):
+    return SearchResultCache.make_key(origin, destination, selected_modes, sort_by, journey_type,
+                                      show_student_discounts, departure_date)
+
+def get_quoted_ranking(origin, destination, selected_modes, sort_by, departure_date, journey_type, show_student_discounts):
+    """The route's journeys ranked by the per-person price the results will show (journey_search.rank_by_price).
+
+    The whole route is fetched and quoted once per route, modes, date, trip type and discount flag; every
+    page after that is a slice of the cached ranking. Returns None if the database could not be queried.
+    """
+    key = quoted_ranking_key(origin, destination, selected_modes, sort_by, departure_date, journey_type,
+                             show_student_discounts)
+    ranking = quoted_rankings_cache.get(key)
+    if ranking is not None:
+        return ranking
+    snapshot = current_journey_snapshot()
+    if snapshot is not None:
+        rows, _ = snapshot.search_page(origin, destination, selected_modes, sort_by, limit=None)
+    else:
+        rows, _ = fetch_search_page(origin, destination, selected_modes, sort_by, limit=None)
+    if rows is None:
+        return None
+    ranking = rank_route(rows, departure_date, journey_type, show_student_discounts)
+    quoted_rankings_cache.put(key, ranking)
+    return ranking
+
+def rank_route(rows, departure_date, journey_type, show_student_discounts):
+    """rank_by_price over the quotes of a whole route's rows; also run off the event loop by asgi.py."""
+    quotes = quote_journeys((journey, departure_date, journey_type, 1, show_student_discounts) for journey in rows)
+    return rank_by_price(rows, [quote['price'] for quote in quotes])
+
+def search_page_key(origin, destination, selected_modes, sort_by, departure_date, journey_type, show_student_discounts, after_token=None):
+    # departure_date is part of the key because the promotional discount and the 'times' text depend on it
+    return SearchResultCache.make_key(origin, destination, selected_modes, sort_by, journey_type,
+                                      show_student_discounts, departure_date, after_token)
+
+def process_search_page(cache_key, rows, next_cursor, first_page, origin, destination, selected_modes, sort_by, departure_date, journey_type, show_student_discounts):
+    """Quotes and shapes one fetched page of journeys, caches it and returns (results, next_cursor).
+
+    Shared by get_search_page and the async search views in asgi.py.
+    """
+    quotes = request_quotes((journey, departure_date, journey_type, 1, show_student_discounts) for journey in rows)
+    results = [build_journey_result(journey, departure_date, journey_type, show_student_discounts, quote)
+               for journey, quote in zip(rows, quotes)]
+    if not results and first_page:
+        # No direct link: fall back to connecting trips from the in-memory route graph
+        results = find_connections(origin, destination, selected_modes, sort_by, departure_date, journey_type, show_student_discounts)
+
+    search_cache.put(cache_key, (results, next_cursor))
+    return results, next_cursor
+
+def on_journeys_changed():
+    """Call after writing journeys so cached routes, connections and search results are refreshed."""
+    route_catalog.invalidate()
+    journey_planner.invalidate()
+    if journey_snapshots is not None:
+        journey_snapshots.invalidate()  # map the rebuilt file as soon as it is there
+    search_cache.clear()
+    route_fares_cache.clear()
+    quoted_rankings_cache.clear()
+
+# Other processes (import_journeys.py) bump the 'journeys' dataset version after writing;
+# each worker checks it at most every JOURNEYS_VERSION_POLL_SECONDS and drops its cached copies.
+JOURNEYS_VERSION_POLL_SECONDS = 5
+# The version is read where the journeys will be reloaded from, so a replica that shows it also has the rows.
+journeys_watcher = VersionWatcher('journeys', lambda: replica_set.connect() or db_pool.connect(), on_journeys_changed,
+                                  poll_seconds=JOURNEYS_VERSION_POLL_SECONDS)
+
+@app.before_request
+def check_journeys_version():
+    journeys_watcher.poll()
+
+# --- Journey Snapshot ---
+# With JOURNEY_SNAPSHOT_PATH set (best on tmpfs, e.g. /dev/shm/green_journey/journeys.snap), search pages and
+# /get_destinations are answered from one read-only snapshot of journeys that all worker processes on the host
+# map from that file, instead of from the database or a per-process copy (see journey_snapshot.py). A worker
+# rebuilds it within JOURNEYS_VERSION_POLL_SECONDS of the journeys version moving; until then the queries go
+# to the database as before.
+app.config["JOURNEY_SNAPSHOT_PATH"] = None
+
+def current_journey_snapshot():
+    """The mapped snapshot if it is at least as new as the journeys version this process has seen, else None."""
+    if journey_snapshots is None:
+        return None
+    return journey_snapshots.current(min_version=journeys_watcher.version)
 
 @app.route('/search_results', methods=['GET', 'POST'])
 def search_results():
@@ -127,88 +504,14 @@ def search_results():
 
     selected_modes = request.args.getlist('mode')
     sort_by = request.args.get('sort', 'cheapest')
-    show_student_discounts = request.args.get('discount') == 'student'
-
-    results = []
-    conn = get_db_connection()
-    if conn:
-        cursor = conn.cursor(dictionary=True)
-        try:
-            base_query = "SELECT * FROM journeys WHERE origin = %s AND destination = %s"
-            query_params = [origin, destination]
+    show_student_discounts = student_fare_requested(request.args)
 
-            if selected_modes:
-                mode_placeholders = ', '.join(['%s'] * len(selected_modes))
-                base_query += f" AND mode IN ({mode_placeholders})"
-                query_params.extend(selected_modes)
-
-            cursor.execute(base_query, tuple(query_params))
-            db_journeys = cursor.fetchall()
-
-            processed_results = []
-            for journey in db_journeys:
-                mode_icon = '' # This will be replaced by Lucide icons in HTML
-
-                current_price = float(journey['price'])
-                student_discount_applied_to_journey = False
-                
-                # Simulate student discount logic for display
-                if show_student_discounts:
-                    current_price = round(current_price * 0.8, 2) # 20% discount
-                    student_discount_applied_to_journey = True
-                elif random.random() < 0.3: # Randomly apply discount if filter is OFF
-                    current_price = round(current_price * 0.8, 2)
-                    student_discount_applied_to_journey = True
-
-                co2_value = parse_carbon_footprint(journey['carbon_footprint'])
-
-                # For return journeys, simulate doubling cost/CO2/duration
-                if journey_type == 'return': # Use journey_type from form
-                    current_price *= 2 # Simple doubling for return
-                    co2_value *= 2
-                    # Simple duration doubling, could be more complex
-                    duration_minutes = parse_duration_to_minutes(journey['duration']) * 2
-                    hours = duration_minutes // 60
-                    minutes = duration_minutes % 60
-                    travel_time_display = f"{hours}h {minutes}m"
-                else:
-                    travel_time_display = journey['duration']
-
-
-                processed_results.append({
-                    'id': journey['id'],
-                    'mode': journey['mode'],
-                    'mode_icon': mode_icon, # Will be ignored by new HTML, but kept for compatibility
-                    'route': f"{journey['origin']} to {journey['destination']} by {journey['mode']}",
-                    'times': f"Departs: {departure_date} (Time TBD)", # Actual times from DB would be better
-                    'stops': 'Direct', # Simplified for now
-                    'travel_time': travel_time_display,
-                    'cost': current_price,
-                    'co2_emissions': co2_value,
-                    'student_discount': student_discount_applied_to_journey,
-                    'description': journey['description']
-                })
-
-            # Apply sorting
-            if sort_by == 'cheapest':
-                results = sorted(processed_results, key=lambda x: x['cost'])
-            elif sort_by == 'fastest':
-                # Sort by parsed minutes duration
-                results = sorted(processed_results, key=lambda x: parse_duration_to_minutes(x['travel_time']))
-            elif sort_by == 'lowest_co2':
-                results = sorted(processed_results, key=lambda x: x['co2_emissions'])
-            else:
-                results = processed_results # Default or no specific sort
-
-            if not results:
-                flash(f'No journeys found from {origin} to {destination}. Please try different locations or dates.', 'info')
-
-        except mysql.connector.Error as err:
-            flash(f'Error fetching journeys: {err}', 'error')
-        finally:
-            if conn:
-                cursor.close()
-                conn.close()
+    # Ordering and paging happen in SQL; only the first page is rendered here
+    results, next_cursor = get_search_page(origin, destination, selected_modes, sort_by, departure_date, journey_type, show_student_discounts)
+    if results is None:
+        results = []
+    elif not results:
+        flash(f'No journeys found from {origin} to {destination}. Please try different locations or dates.', 'info')
 
     return render_template('results.html',
                            origin=origin,
@@ -217,6 +520,7 @@ def search_results():
                            return_date=return_date,
                            passengers=passengers,
                            results=results,
+                           next_cursor=next_cursor,
                            user_id=session.get('user_id'),
                            username=session.get('username'),
                            selected_modes=selected_modes,
@@ -224,6 +528,245 @@ def search_results():
                            show_student_discounts=show_student_discounts,
                            journey_type=journey_type) # Pass journey_type to results.html
 
+@app.route('/search_results/more')
+def search_results_more():
+    """Renders the next page of result cards after the given cursor for the "Load more" button.
+
+    The cursor for the page after this one is returned in the X-Next-Cursor header.
+    """
+    origin = request.args.get('origin')
+    destination = request.args.get('destination')
+    departure_date = request.args.get('departure_date')
+    return_date = request.args.get('return_date')
+    passengers = request.args.get('passengers', 1)
+    journey_type = request.args.get('journey_type', 'one_way')
+    selected_modes = request.args.getlist('mode')
+    sort_by = request.args.get('sort', 'cheapest')
+    show_student_discounts = student_fare_requested(request.args)
+
+    after_token = request.args.get('after')
+    if not after_token:
+        return jsonify({'error': 'after cursor is required.'}), 400
+    try:
+        results, next_cursor = get_search_page(origin, destination, selected_modes, sort_by, departure_date, journey_type,
+                                               show_student_discounts, after_token=after_token)
+    except InvalidCursor as err:
+        return jsonify({'error': str(err)}), 400
+    if results is None:
+        return jsonify({'error': 'Error fetching journeys.'}), 503
+
+    response = app.make_response(render_template('results_page.html',
+                                                 results=results,
+                                                 departure_date=departure_date,
+                                                 return_date=return_date,
+                                                 passengers=passengers,
+                                                 journey_type=journey_type,
+                                                 show_student_discounts=show_student_discounts))
+    response.headers['X-Next-Cursor'] = next_cursor or ''
+    return response
+
+# --- JSON Search API (v1) ---
+
+def stream_journeys(query, params, search, per_pair_limit=None):
+    """Streams journey records as NDJSON from an unbuffered (server-side) cursor."""
+    conn = get_db_connection(read_only=True)
+    if not conn:
+        return jsonify({'error': 'Database unavailable.'}), 503
+    cursor = conn.cursor(dictionary=True) # Unbuffered: rows are read as they are sent
+    try:
+        cursor.execute(query, params)
+    except mysql.connector.Error as err:
+        cursor.close()
+        conn.close()
+        return jsonify({'error': f'Error fetching journeys: {err}'}), 500
+
+    def generate():
+        counts = {}
+        try:
+            for rows in stream_batches(cursor):
+                if per_pair_limit:
+                    rows = limit_per_pair(rows, counts, per_pair_limit)
+                for record in journey_records(rows, search):
+                    yield ndjson_line(record)
+        except mysql.connector.Error as err:
+            yield ndjson_line({'error': f'Error fetching journeys: {err}'})
+        finally:
+            try:
+                cursor.close()
+            except mysql.connector.Error:
+                pass # Client went away mid-stream; the pool discards the connection
+            conn.close()
+
+    return Response(generate(), mimetype=NDJSON_MIMETYPE)
+
+def limit_per_pair(rows, counts, per_pair_limit):
+    """The rows still within per_pair_limit for their (origin, destination); counts carries over between batches."""
+    kept = []
+    for row in rows:
+        pair = (row['origin'], row['destination'])
+        counts[pair] = counts.get(pair, 0) + 1
+        if counts[pair] <= per_pair_limit:
+            kept.append(row)
+    return kept
+
+@app.route('/api/v1/search')
+def api_search():
+    """Same parameters as search_results; streams matching journeys as NDJSON."""
+    origin = request.args.get('origin')
+    destination = request.args.get('destination')
+    if not origin or not destination:
+        return jsonify({'error': 'origin and destination are required.'}), 400
+    try:
+        search = parse_search_params(request.args)
+    except SearchParamsError as err:
+        return jsonify({'error': str(err)}), 400
+    query, params = build_stream_query(origin, destination, search)
+    return stream_journeys(query, params, search)
+
+@app.route('/api/v1/search/batch', methods=['POST'])
+def api_search_batch():
+    """Answers many origin/destination pairs with one database query.
+
+    Body: {"pairs": [["London", "Leeds"], ...], "sort": ..., "mode": [...], ...}
+    """
+    body = request.get_json(silent=True)
+    try:
+        pairs = parse_batch_pairs(body)
+        search = parse_search_params(body)
+    except SearchParamsError as err:
+        return jsonify({'error': str(err)}), 400
+    query, params = build_batch_query(pairs, search)
+    return stream_journeys(query, params, search, per_pair_limit=search['limit'])
+
+# --- Fare calendar ---
+
+CALENDAR_DAYS = 30
+
+def get_route_fares(origin, destination):
+    """The route's journeys as fare_calendar.RouteFares, from route_fares_cache when possible. None on DB errors."""
+    key = (origin, destination)
+    fares = route_fares_cache.get(key)
+    if fares is not None:
+        return fares
+    conn = get_db_connection(read_only=True)
+    if not conn:
+        return None
+    cursor = conn.cursor(dictionary=True)
+    try:
+        fares = load_route_fares(cursor, origin, destination)
+    except mysql.connector.Error as err:
+        print(f"Error loading fares for {origin} to {destination}: {err}")
+        return None
+    finally:
+        cursor.close()
+        conn.close()
+    route_fares_cache.put(key, fares)
+    return fares
+
+def get_fare_calendar(values):
+    """(calendar, params) for request values (origin, destination, start, days, journey_type, discount, mode).
+
+    calendar is None if the database could not be queried. Raises ValueError for bad parameters.
+    """
+    params = calendar_params(values)
+    fares = get_route_fares(params['origin'], params['destination'])
+    if fares is None:
+        return None, params
+    return price_calendar(fares, params), params
+
+def calendar_params(values):
+    """The calendar parameters from request values; raises ValueError for bad ones."""
+    origin = values.get('origin')
+    destination = values.get('destination')
+    if not origin or not destination:
+        raise ValueError('origin and destination are required.')
+    start, days = parse_window(values.get('start'), values.get('days', CALENDAR_DAYS))
+    params = {
+        'origin': origin,
+        'destination': destination,
+        'start': start,
+        'days': days,
+        'journey_type': 'return' if values.get('journey_type') == 'return' else 'one_way',
+        'student_discount': student_fare_requested(values),
+        'modes': values.getlist('mode'),
+    }
+    return params
+
+def price_calendar(fares, params):
+    return build_calendar(fares, params['start'], params['days'], PROMO_DISCOUNT_SHARE, params['journey_type'],
+                          params['student_discount'], params['modes'])
+
+def calendar_json(calendar, params):
+    """The /api/v1/calendar response body."""
+    days = [dict(day, date=day['date'].isoformat()) for day in calendar]
+    return {'origin': params['origin'], 'destination': params['destination'],
+            'journey_type': params['journey_type'], 'student_discount': params['student_discount'],
+            'days': days}
+
+@app.route('/api/v1/calendar')
+def api_calendar():
+    """Cheapest price, lowest CO2 and fastest duration per day for a route.
+
+    ?origin=...&destination=...[&start=YYYY-MM-DD][&days=1-90][&journey_type=return][&discount=student][&mode=...]
+    """
+    try:
+        calendar, params = get_fare_calendar(request.args)
+    except ValueError as err:
+        return jsonify({'error': str(err)}), 400
+    if calendar is None:
+        return jsonify({'error': 'Could not load journeys.'}), 503
+    return jsonify(calendar_json(calendar, params))
+
+@app.route('/calendar')
+def fare_calendar():
+    """Month-style view of the same calendar; each day links to that day's search."""
+    try:
+        calendar, params = get_fare_calendar(request.args)
+    except ValueError as err:
+        flash(f'Invalid calendar request: {err}', 'error')
+        return redirect(url_for('index'))
+    if calendar is None:
+        flash('Could not load fares for this route.', 'error')
+        return redirect(url_for('index'))
+    priced = [day for day in calendar if day['min_price'] is not None]
+    return render_template('calendar.html',
+                           calendar=calendar,
+                           leading_blanks=params['start'].weekday(),
+                           cheapest_price=min((day['min_price'] for day in priced), default=None),
+                           user_id=session.get('user_id'),
+                           username=session.get('username'),
+                           **params)
+
+# --- Metrics ---
+
+# Lambdas so the current module-level objects are read at scrape time
+metrics_registry.register_stats('db_pool', lambda: db_pool.stats(),
+                                counters=('checkouts', 'waits', 'timeouts', 'created', 'recycled',
+                                          'ping_failures', 'wait_seconds'))
+metrics_registry.register_stats('replicas', lambda: replica_set.stats(),
+                                counters=('replica_checkouts', 'primary_fallbacks', 'checkout_failures',
+                                          'check_failures'))
+metrics_registry.register_stats('job_queue', job_queue.stats,
+                                counters=('completed', 'retried', 'dead', 'lost_leases', 'errors'))
+metrics_registry.register_stats('route_catalog', lambda: route_catalog.stats(),
+                                counters=('hits', 'misses', 'refreshes', 'load_errors', 'invalidations'))
+metrics_registry.register_stats('journey_snapshot', lambda: journey_snapshots.stats() if journey_snapshots else {},
+                                counters=('hits', 'stale', 'missing', 'remaps', 'builds', 'build_errors'))
+metrics_registry.register_stats('search_cache', lambda: search_cache.stats(),
+                                counters=('hits', 'misses', 'evictions', 'expirations', 'invalidations'))
+metrics_registry.register_stats('route_fares_cache', lambda: route_fares_cache.stats(),
+                                counters=('hits', 'misses', 'evictions', 'expirations', 'invalidations'))
+metrics_registry.register_stats('quoted_rankings_cache', lambda: quoted_rankings_cache.stats(),
+                                counters=('hits', 'misses', 'evictions', 'expirations', 'invalidations'))
+metrics_registry.register_stats('compressed_body_cache',
+                                lambda: compressed_body_cache.stats() if compressed_body_cache else {},
+                                counters=('hits', 'misses', 'evictions'))
+
+@app.route('/metrics')
+def metrics():
+    """Prometheus text exposition of request, DB, template, pool and cache metrics."""
+    return Response(metrics_registry.render(), mimetype=PROMETHEUS_MIMETYPE)
+
 @app.route('/register', methods=['GET', 'POST'])
 def register():
     if request.method == 'POST':
@@ -243,6 +786,7 @@ def register():
                     cursor.execute("INSERT INTO users (username, password_hash, email) VALUES (%s, %s, %s)",
                                    (username, password, email))
                     conn.commit()
+                    pin_to_primary()
                     flash('Registration successful! Please log in.', 'success')
                     return redirect(url_for('login'))
             except mysql.connector.Error as err:
@@ -260,7 +804,7 @@ def login():
         username = request.form.get('username')
         password = request.form.get('password')
 
-        conn = get_db_connection()
+        conn = get_db_connection(read_only=True)
         if conn:
             cursor = conn.cursor(dictionary=True)
             try:
@@ -305,44 +849,53 @@ def select_journey(journey_id):
             if selected_journey_db:
                 departure_date = request.form.get('departure_date')
                 return_date = request.form.get('return_date')
-                passengers = int(request.form.get('passengers'))
+                passengers = int(request.form.get('passengers', ''))
+                if passengers < 1:
+                    raise ValueError(f'Invalid number of passengers: {passengers}')
                 journey_type = request.form.get('journey_type', 'one_way') # Get journey type from form
+                if journey_type not in TRIP_TYPES:
+                    journey_type = 'one_way'
+                student_discount = student_fare_requested(request.form)
 
-                # Recalculate cost, co2, and duration based on return_date for display on booking details
-                current_price = float(selected_journey_db['price'])
-                co2_value = parse_carbon_footprint(selected_journey_db['carbon_footprint'])
-                travel_time_display = selected_journey_db['duration']
-
-                if journey_type == 'return': # Use journey_type for calculation
-                    current_price *= 2
-                    co2_value *= 2
-                    duration_minutes = parse_duration_to_minutes(selected_journey_db['duration']) * 2
-                    hours = duration_minutes // 60
-                    minutes = duration_minutes % 60
-                    travel_time_display = f"{hours}h {minutes}m"
+                # The same quote the search results showed, for the chosen trip type and passengers
+                quote = request_quotes([(selected_journey_db, departure_date, journey_type, passengers, student_discount)])[0]
+                travel_time_display = quote['travel_time'] if journey_type == 'return' else selected_journey_db['duration']
 
-                # Calculate total_price here before storing in session
-                total_price_for_booking = current_price * passengers
+                # Hold the seats until payment; an earlier unpaid selection gives its seats back
+                previous_hold = (session.get('selected_journey') or {}).get('hold_token')
+                if previous_hold:
+                    release_hold(conn, previous_hold)
+                hold_token, hold_expires_at = place_hold(conn, journey_id, departure_date, passengers,
+                                                         hold_seconds=SEAT_HOLD_SECONDS)
 
                 session['selected_journey'] = {
                     'id': selected_journey_db['id'],
                     'origin': selected_journey_db['origin'],
                     'destination': selected_journey_db['destination'],
                     'mode': selected_journey_db['mode'],
-                    'carbon_footprint': co2_value, # Store the potentially doubled CO2
-                    'price': current_price, # Store the potentially doubled price (per person)
-                    'total_price': total_price_for_booking, # Add total_price to session
+                    'carbon_footprint': quote['co2_kg'], # Store the potentially doubled CO2
+                    'journey_co2_kg': journey_co2_kg(selected_journey_db), # Per-journey CO2 counted in /account stats
+                    'price': quote['price'], # Store the potentially doubled price (per person)
+                    'total_price': quote['total_price'], # Add total_price to session
                     'duration': travel_time_display, # Store the potentially doubled duration
                     'description': selected_journey_db['description'],
                     'departure_date': departure_date,
                     'return_date': return_date,
                     'passengers': passengers,
-                    'journey_type': journey_type # Store journey_type in session
+                    'journey_type': journey_type, # Store journey_type in session
+                    'hold_token': hold_token
                 }
+                flash(f'Your seats are held until {hold_expires_at:%H:%M}. Please complete payment before then.', 'info')
                 return redirect(url_for('booking_details'))
             else:
                 flash('Journey not found.', 'error')
                 return redirect(url_for('index'))
+        except SeatsUnavailable as err:
+            flash(f'Sorry, this journey is full. {err}', 'error')
+            return redirect(url_for('index'))
+        except ValueError:
+            flash('Please choose a valid departure date and number of passengers.', 'error')
+            return redirect(url_for('index'))
         except mysql.connector.Error as err:
             flash(f'Error selecting journey: {err}', 'error')
             return redirect(url_for('index'))
@@ -428,8 +981,11 @@ def payment():
                 # Note: booking_date in DB is DATETIME, but we're storing just the date part from HTML input
                 booking_date_for_db = selected_journey['departure_date']
 
+                # Seats held at select_journey become the booking's; if the hold expired they are taken again
+                claim_hold(conn, selected_journey.get('hold_token'), selected_journey['id'],
+                           booking_date_for_db, selected_journey['passengers'])
                 cursor.execute(
-                    "INSERT INTO bookings (user_id, journey_id, passengers, total_price, booking_date, payment_method, payment_status, transaction_id) VALUES (%s, %s, %s, %s, %s, %s, %s, %s)",
+                    "INSERT INTO bookings (user_id, journey_id, passengers, total_price, booking_date, payment_method, payment_status, transaction_id, journey_type) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)",
                     (session['user_id'],
                      selected_journey['id'],
                      selected_journey['passengers'],
@@ -437,13 +993,29 @@ def payment():
                      booking_date_for_db,
                      'simulated-card', # Payment method is hardcoded as simulated
                      'completed',
-                     booking_ref)
+                     booking_ref,
+                     selected_journey.get('journey_type', 'one_way')) # The trip type the booking was quoted for
                 )
+                # Account totals are updated in the same transaction as the booking
+                journey_co2 = selected_journey.get('journey_co2_kg')
+                if journey_co2 is None: # Sessions created before journey_co2_kg was stored
+                    journey_co2 = selected_journey['carbon_footprint'] / (2 if selected_journey.get('journey_type') == 'return' else 1)
+                record_booking_change(conn, session['user_id'],
+                                      new=(booking_date_for_db, journey_co2, selected_journey['total_price']))
+                enqueue(conn, BOOKING_EMAIL,
+                        {'event': 'confirmed', 'transaction_id': booking_ref, 'user_id': session['user_id']})
                 conn.commit()
+                job_queue.wake()
+                pin_to_primary()
                 flash('Payment successful and booking confirmed!', 'success')
                 session['last_booking_ref'] = booking_ref
                 session.pop('selected_journey', None) # Clear selected journey from session after successful booking
                 return redirect(url_for('confirmation'))
+            except SeatsUnavailable as err:
+                conn.rollback()
+                flash(f'Sorry, your seat hold expired and the journey has since sold out. {err}', 'error')
+                session.pop('selected_journey', None)
+                return redirect(url_for('index'))
             except mysql.connector.Error as err:
                 flash(f'Database error during booking: {err}', 'error')
                 conn.rollback()
@@ -468,27 +1040,14 @@ def confirmation():
     booking_ref = session.get('last_booking_ref')
     booking_details = None
     if booking_ref:
-        conn = get_db_connection()
+        conn = get_db_connection(read_only=True)
         if conn:
-            cursor = conn.cursor(dictionary=True)
             try:
-                query = """
-                SELECT b.*, j.origin, j.destination, j.mode, j.duration, j.carbon_footprint, j.description AS journey_description
-                FROM bookings b
-                JOIN journeys j ON b.journey_id = j.id
-                WHERE b.transaction_id = %s AND b.user_id = %s
-                """
-                cursor.execute(query, (booking_ref, session['user_id']))
-                booking_details = cursor.fetchone()
-                if booking_details:
-                    # Ensure carbon_footprint is parsed to float for display
-                    booking_details['carbon_footprint'] = parse_carbon_footprint(booking_details.get('carbon_footprint', '0.0kg CO2e'))
+                booking_details = get_booking(conn, booking_ref, session['user_id'])
             except mysql.connector.Error as err:
                 flash(f'Error fetching booking details: {err}', 'error')
             finally:
-                if conn:
-                    cursor.close()
-                    conn.close()
+                conn.close()
 
     if not booking_details:
         flash('Could not find your booking details.', 'error')
@@ -505,75 +1064,92 @@ def account():
         flash('Please log in to view your account.', 'info')
         return redirect(url_for('login'))
 
-    user_bookings = []
+    upcoming_bookings = []
+    past_bookings = []
+    upcoming_next = past_next = None
     total_co2_saved = 0.0
     total_money_saved = 0.0
-    conn = get_db_connection()
+    # Each list pages on its own: ?upcoming_after=<cursor> / ?past_after=<cursor> from the "More" links
+    upcoming_after = request.args.get('upcoming_after')
+    past_after = request.args.get('past_after')
+    today = date.today()
+    conn = get_db_connection(read_only=True)
     if conn:
-        cursor = conn.cursor(dictionary=True)
         try:
-            query = """
-            SELECT b.*, j.origin, j.destination, j.mode, j.duration, j.carbon_footprint, j.price AS journey_base_price
-            FROM bookings b
-            JOIN journeys j ON b.journey_id = j.id
-            WHERE b.user_id = %s
-            ORDER BY b.booking_date DESC
-            """
-            cursor.execute(query, (session['user_id'],))
-            user_bookings = cursor.fetchall()
-
-            upcoming_bookings = []
-            past_bookings = []
-            today = date.today()
-
-            for booking in user_bookings:
-                # Ensure booked_at is a datetime object for strftime
-                if isinstance(booking.get('booked_at'), date) and not isinstance(booking.get('booked_at'), datetime):
-                    booking['booked_at'] = datetime.combine(booking['booked_at'], datetime.min.time())
-
-                # Ensure booking_date is a datetime object for strftime
-                if isinstance(booking.get('booking_date'), date) and not isinstance(booking.get('booking_date'), datetime):
-                    booking['booking_date'] = datetime.combine(booking['booking_date'], datetime.min.time())
-
-                booking_departure_date = booking.get('booking_date')
-
-                if booking_departure_date is None:
-                    dep_date_for_comparison = date.min
-                elif isinstance(booking_departure_date, datetime):
-                    dep_date_for_comparison = booking_departure_date.date()
-                elif isinstance(booking_departure_date, date):
-                    dep_date_for_comparison = booking_departure_date
-                else:
-                    try:
-                        dep_date_for_comparison = datetime.strptime(str(booking_departure_date), '%Y-%m-%d').date()
-                    except ValueError:
-                        dep_date_for_comparison = date.min
-
-                parsed_carbon_footprint = parse_carbon_footprint(booking.get('carbon_footprint', '0.0kg CO2e'))
-                booking['carbon_footprint'] = parsed_carbon_footprint
-
-                if dep_date_for_comparison >= today:
-                    upcoming_bookings.append(booking)
-                else:
-                    past_bookings.append(booking)
-                    total_co2_saved += parsed_carbon_footprint
-                    total_money_saved += float(booking['total_price']) * 0.10 # Simulated saving
-
+            upcoming_bookings, upcoming_next = booking_page(conn, session['user_id'], today, upcoming=True,
+                                                            after=upcoming_after)
+            past_bookings, past_next = booking_page(conn, session['user_id'], today, upcoming=False, after=past_after)
+        except InvalidCursor:
+            flash('That page of bookings is no longer available.', 'error')
+            return redirect(url_for('account'))
         except mysql.connector.Error as err:
             flash(f'Error fetching your bookings: {err}', 'error')
         finally:
-            if conn:
-                cursor.close()
-                conn.close()
+            conn.close()
+
+    # Totals are maintained incrementally by payment/cancel/modify (see user_stats.py). Reading them
+    # can roll settled_through forward, which is a write, so this one goes to the primary.
+    conn = get_db_connection()
+    if conn:
+        try:
+            stats = read_user_stats(conn, session['user_id'], today)
+            total_co2_saved = stats['total_co2_saved']
+            total_money_saved = stats['total_money_saved']
+        except mysql.connector.Error as err:
+            flash(f'Error fetching your travel totals: {err}', 'error')
+        finally:
+            conn.close()
 
     return render_template('account.html',
                            user_id=session.get('user_id'),
                            username=session.get('username'),
                            upcoming_bookings=upcoming_bookings,
                            past_bookings=past_bookings,
+                           upcoming_after=upcoming_after,
+                           past_after=past_after,
+                           upcoming_next=upcoming_next,
+                           past_next=past_next,
                            total_co2_saved=round(total_co2_saved, 2),
                            total_money_saved=round(total_money_saved, 2))
 
+@app.route('/account/bookings.<fmt>')
+def export_bookings(fmt):
+    """The user's whole booking history as CSV or JSON Lines, streamed from an unbuffered cursor."""
+    if 'user_id' not in session:
+        flash('Please log in to export your bookings.', 'info')
+        return redirect(url_for('login'))
+    if fmt not in EXPORT_MIMETYPES:
+        flash('Bookings can be exported as CSV or JSON Lines.', 'error')
+        return redirect(url_for('account'))
+
+    conn = get_db_connection(read_only=True)
+    if not conn:
+        return redirect(url_for('account'))
+    cursor = conn.cursor() # Unbuffered: rows are read as they are sent
+    try:
+        cursor.execute(BOOKING_HISTORY_SQL, (session['user_id'],))
+    except mysql.connector.Error as err:
+        cursor.close()
+        conn.close()
+        flash(f'Error exporting your bookings: {err}', 'error')
+        return redirect(url_for('account'))
+
+    def generate():
+        try:
+            yield from export_chunks(cursor, fmt)
+        except mysql.connector.Error as err:
+            print(f"Error streaming booking export: {err}") # Headers are sent; the file just ends early
+        finally:
+            try:
+                cursor.close()
+            except mysql.connector.Error:
+                pass # Client went away mid-stream; the pool discards the connection
+            conn.close()
+
+    filename = f"bookings-{date.today().isoformat()}.{fmt}"
+    return Response(generate(), mimetype=EXPORT_MIMETYPES[fmt],
+                    headers={'Content-Disposition': f'attachment; filename="{filename}"'})
+
 # New routes for booking actions
 @app.route('/view_booking_details/<string:transaction_id>')
 def view_booking_details(transaction_id):
@@ -582,33 +1158,14 @@ def view_booking_details(transaction_id):
         return redirect(url_for('login'))
 
     booking_details = None
-    conn = get_db_connection()
+    conn = get_db_connection(read_only=True)
     if conn:
-        cursor = conn.cursor(dictionary=True)
         try:
-            query = """
-            SELECT b.*, j.origin, j.destination, j.mode, j.duration, j.carbon_footprint, j.description AS journey_description
-            FROM bookings b
-            JOIN journeys j ON b.journey_id = j.id
-            WHERE b.transaction_id = %s AND b.user_id = %s
-            """
-            cursor.execute(query, (transaction_id, session['user_id']))
-            booking_details = cursor.fetchone()
-            if booking_details:
-                booking_details['carbon_footprint'] = parse_carbon_footprint(booking_details.get('carbon_footprint', '0.0kg CO2e'))
-                # Ensure booking_date is a datetime object for strftime in booking_view.html
-                if isinstance(booking_details.get('booking_date'), date) and not isinstance(booking_details.get('booking_date'), datetime):
-                    booking_details['booking_date'] = datetime.combine(booking_details['booking_date'], datetime.min.time())
-                # Ensure booked_at is a datetime object for strftime in booking_view.html
-                if isinstance(booking_details.get('booked_at'), date) and not isinstance(booking_details.get('booked_at'), datetime):
-                    booking_details['booked_at'] = datetime.combine(booking_details['booked_at'], datetime.min.time())
-
+            booking_details = get_booking(conn, transaction_id, session['user_id'])
         except mysql.connector.Error as err:
             flash(f'Error fetching booking details: {err}', 'error')
         finally:
-            if conn:
-                cursor.close()
-                conn.close()
+            conn.close()
 
     if not booking_details:
         flash('Booking details not found or you do not have permission to view it.', 'error')
@@ -630,13 +1187,29 @@ def cancel_booking(transaction_id):
 
     conn = get_db_connection()
     if conn:
-        cursor = conn.cursor()
+        cursor = conn.cursor(dictionary=True)
         try:
-            # Update status to 'cancelled'
-            cursor.execute("UPDATE bookings SET payment_status = %s WHERE transaction_id = %s AND user_id = %s",
-                           ('cancelled', transaction_id, session['user_id']))
+            cursor.execute(
+                "SELECT b.journey_id, b.passengers, b.booking_date, b.total_price, j.co2_kg, j.carbon_footprint FROM bookings b"
+                " JOIN journeys j ON b.journey_id = j.id"
+                " WHERE b.transaction_id = %s AND b.user_id = %s AND b.payment_status <> %s FOR UPDATE",
+                (transaction_id, session['user_id'], 'cancelled'))
+            booking = cursor.fetchone()
+            cancelled = 0
+            if booking:
+                # Update status to 'cancelled'
+                cursor.execute("UPDATE bookings SET payment_status = %s WHERE transaction_id = %s AND user_id = %s",
+                               ('cancelled', transaction_id, session['user_id']))
+                cancelled = cursor.rowcount
+                return_seats(conn, booking['journey_id'], booking['booking_date'], booking['passengers'])
+                record_booking_change(conn, session['user_id'],
+                                      old=(booking['booking_date'], journey_co2_kg(booking), booking['total_price']))
+                enqueue(conn, BOOKING_EMAIL,
+                        {'event': 'cancelled', 'transaction_id': transaction_id, 'user_id': session['user_id']})
             conn.commit()
-            if cursor.rowcount > 0:
+            if cancelled > 0:
+                job_queue.wake()
+                pin_to_primary()
                 flash(f'Booking {transaction_id} has been cancelled. (Refund simulated)', 'success')
             else:
                 flash('Booking not found or already cancelled.', 'error')
@@ -658,37 +1231,14 @@ def modify_booking(transaction_id):
     booking_details = None
     conn = get_db_connection()
     if conn:
-        cursor = conn.cursor(dictionary=True)
         try:
-            query = """
-            SELECT b.*, j.origin, j.destination, j.mode, j.duration, j.carbon_footprint, j.description AS journey_description, j.price AS journey_base_price
-            FROM bookings b
-            JOIN journeys j ON b.journey_id = j.id
-            WHERE b.transaction_id = %s AND b.user_id = %s
-            """
-            cursor.execute(query, (transaction_id, session['user_id']))
-            booking_details = cursor.fetchone()
-            
-            if booking_details:
-                # Ensure booking_date is a datetime object for strftime
-                if isinstance(booking_details.get('booking_date'), date) and not isinstance(booking_details.get('booking_date'), datetime):
-                    booking_details['booking_date'] = datetime.combine(booking_details['booking_date'], datetime.min.time())
-                
-                # Attempt to infer journey_type if not explicitly stored (e.g., from total_price vs base_price)
-                # This is a heuristic and might not be perfectly accurate if discounts/complex pricing exist.
-                is_return_journey = False
-                expected_one_way_price = float(booking_details['journey_base_price']) * booking_details['passengers']
-                if booking_details['total_price'] > (expected_one_way_price * 1.5): # Heuristic check
-                    is_return_journey = True
-                
-                booking_details['journey_type'] = 'return' if is_return_journey else 'one_way'
-
+            booking_details = get_booking(conn, transaction_id, session['user_id'])
         except mysql.connector.Error as err:
             flash(f'Error fetching booking details for modification: {err}', 'error')
-            if conn: # Ensure connection is closed on early exit
-                cursor.close()
-                conn.close()
             return redirect(url_for('account')) # Redirect early on error
+        finally:
+            # Hand the connection back to the pool; the POST branch checks out a fresh one
+            conn.close()
 
     if not booking_details:
         flash('Booking details not found for modification or you do not have permission to view it.', 'error')
@@ -697,56 +1247,80 @@ def modify_booking(transaction_id):
     if request.method == 'POST':
         new_departure_date = request.form.get('departure_date')
         new_return_date = request.form.get('return_date')
-        new_passengers = int(request.form.get('passengers'))
+        try:
+            new_passengers = int(request.form.get('passengers', ''))
+        except ValueError:
+            new_passengers = 0
         new_journey_type = request.form.get('journey_type', 'one_way')
+        if new_journey_type not in TRIP_TYPES:
+            new_journey_type = 'one_way'
 
         # Basic validation (more robust validation should be done client-side and server-side)
         if not new_departure_date or new_passengers < 1:
             flash('Invalid input for date or passengers.', 'error')
-            if conn: # Ensure connection is closed on early exit
-                cursor.close()
-                conn.close()
             return redirect(url_for('modify_booking', transaction_id=transaction_id))
         
-        # Recalculate total_price based on new passengers and journey type
-        # Convert to float for arithmetic operations to avoid TypeError
-        recalculated_price_per_person = float(booking_details['journey_base_price'])
-        if new_journey_type == 'return':
-            recalculated_price_per_person *= 2 # Double for return journey
-        
-        new_total_price = recalculated_price_per_person * new_passengers
-
+        conn = get_db_connection()
+        if not conn:
+            flash('Database connection lost during update.', 'error')
+            return redirect(url_for('account'))
+        cursor = conn.cursor(dictionary=True)
         try:
-            # Re-establish connection and cursor if it was closed due to an earlier error
-            if not conn or not conn.is_connected():
-                conn = get_db_connection()
-                if not conn:
-                    flash('Database connection lost during update.', 'error')
-                    return redirect(url_for('account'))
-
-            cursor = conn.cursor() # Get a new cursor for the update
-            update_query = """
-            UPDATE bookings
-            SET booking_date = %s, passengers = %s, total_price = %s
-            WHERE transaction_id = %s AND user_id = %s
-            """
-            update_params = (new_departure_date, new_passengers, new_total_price, transaction_id, session['user_id'])
-            
+            # Lock the booking as it is now: the page above was read outside this transaction, and a
+            # concurrent cancel or modify may have changed it since
+            cursor.execute(
+                "SELECT b.journey_id, b.passengers, b.booking_date, b.total_price, j.price, j.duration, j.co2_kg,"
+                " j.carbon_footprint FROM bookings b JOIN journeys j ON b.journey_id = j.id"
+                " WHERE b.transaction_id = %s AND b.user_id = %s AND b.payment_status <> %s FOR UPDATE",
+                (transaction_id, session['user_id'], 'cancelled'))
+            booking = cursor.fetchone()
+            if not booking:
+                conn.rollback()
+                flash('Booking not found or already cancelled.', 'error')
+                return redirect(url_for('account'))
+            journey_co2 = journey_co2_kg(booking)
+
+            # Re-quote for the new date, passengers and trip type; bookings are charged the standard fare
+            journey_fare = {'id': booking['journey_id'], 'price': booking['price'], 'co2_kg': journey_co2,
+                            'duration': booking['duration']}
+            new_total_price = request_quotes([(journey_fare, new_departure_date, new_journey_type,
+                                               new_passengers, False)])[0]['total_price']
+
+            # Seats move with the booking: give back the old date's seats, then take the new ones
+            return_seats(conn, booking['journey_id'], booking['booking_date'], booking['passengers'])
+            take_seats(conn, booking['journey_id'], new_departure_date, new_passengers)
             # If return date is relevant and changed, you might need to store it.
             # Currently, return_date is not stored in the bookings table.
             # For this modification, we'll just update the main booking fields.
-
-            cursor.execute(update_query, update_params)
+            cursor.execute(
+                "UPDATE bookings SET booking_date = %s, passengers = %s, total_price = %s, journey_type = %s"
+                " WHERE transaction_id = %s AND user_id = %s AND payment_status <> %s",
+                (new_departure_date, new_passengers, new_total_price, new_journey_type, transaction_id,
+                 session['user_id'], 'cancelled'))
+            record_booking_change(conn, session['user_id'],
+                                  old=(booking['booking_date'], journey_co2, booking['total_price']),
+                                  new=(new_departure_date, journey_co2, new_total_price))
+            enqueue(conn, BOOKING_EMAIL,
+                    {'event': 'modified', 'transaction_id': transaction_id, 'user_id': session['user_id']})
             conn.commit()
+            job_queue.wake()
+            pin_to_primary()
             flash(f'Booking {transaction_id} updated successfully!', 'success')
             return redirect(url_for('account')) # Redirect back to account page
+        except SeatsUnavailable as err:
+            conn.rollback()
+            flash(f'Not enough seats for this change. {err}', 'error')
+            return redirect(url_for('modify_booking', transaction_id=transaction_id))
+        except ValueError:
+            conn.rollback()
+            flash('Invalid input for date or passengers.', 'error')
+            return redirect(url_for('modify_booking', transaction_id=transaction_id))
         except mysql.connector.Error as err:
             flash(f'Error updating booking: {err}', 'error')
             conn.rollback()
         finally:
-            if conn:
-                cursor.close()
-                conn.close()
+            cursor.close()
+            conn.close()
     
     # For GET request, render the form with current booking details
     return render_template('modify_booking.html',
@@ -768,18 +1342,73 @@ def rebook_journey(journey_id):
 
 @app.route('/help')
 def help():
-    return render_template('help.html', user_id=session.get('user_id'), username=session.get('username'))
+    return page_cache.render('help.html', session.get('user_id'), session.get('username'))
 
 # New routes for About Us and Why Us
 @app.route('/about')
 def about():
-    return render_template('about.html', user_id=session.get('user_id'), username=session.get('username'))
+    return page_cache.render('about.html', session.get('user_id'), session.get('username'))
 
 @app.route('/why_us')
 def why_us():
-    return render_template('why_us.html', user_id=session.get('user_id'), username=session.get('username'))
+    return page_cache.render('why_us.html', session.get('user_id'), session.get('username'))
+
+
+# --- App Factory ---
+app.config["PREFORK_WARMUP"] = False  # load the route catalog in create_app(); see warm_up()
+
+_app_created = False
+
+def load_config(config=None):
+    """Applies FLASK_* environment variables, then ``config``, to app.config and returns it.
+
+    For the CLIs, which need the database settings but not the web app; create_app() calls it first.
+    """
+    app.config.from_prefixed_env()
+    if config:
+        app.config.update(config)
+    # CLIs and asgi.py import these objects, so overrides go into them rather than replacing them
+    DB_CONFIG.update(app.config["DB"])
+    DB_POOL_CONFIG.update(app.config["DB_POOL"])
+    REPLICA_CONFIGS[:] = [dict(DB_CONFIG, **replica) for replica in app.config["DB_REPLICAS"]]
+    app.config.update(DB=DB_CONFIG, DB_POOL=DB_POOL_CONFIG, DB_REPLICAS=REPLICA_CONFIGS)
+    mailer.server = app.config["MAIL_SERVER"]
+    return app.config
+
+def create_app(config=None):
+    """Configures the app (see load_config), installs its session, metrics and response-cache hooks, returns it.
+
+        gunicorn --preload --workers 4 'app:create_app({"PREFORK_WARMUP": true})'
+        uvicorn asgi:application
+
+    The routes are registered on the module's one ``app`` at import, so this configures that app rather
+    than building a new one: the first call does the work, a later call without ``config`` returns the
+    same app (asgi.py makes one) and a later call with ``config`` raises RuntimeError. It also raises
+    RuntimeError if no SECRET_KEY is configured; only ``python app.py`` falls back to a development key.
+
+    Neither this nor importing the module connects to anything or starts a thread (see init_worker()),
+    so it is safe to call in a pre-fork server's master; with PREFORK_WARMUP it loads the route catalog
+    there for the workers to share.
+    """
+    global _app_created, page_cache, compressed_body_cache
+    if _app_created:
+        if config:
+            raise RuntimeError("create_app() has already configured this process's app")
+        return app
+    load_config(config)
+    if not app.secret_key:
+        raise RuntimeError("No SECRET_KEY configured: set FLASK_SECRET_KEY or pass SECRET_KEY to create_app()")
+    init_session(app) # the backend itself is created in each process on first use
+    init_metrics(app)
+    page_cache, compressed_body_cache = init_response_cache(app)
+    _app_created = True
+    if app.config["PREFORK_WARMUP"]:
+        warm_up()
+    return app
 
 
 if __name__ == '__main__':
-    app.secret_key = 'your_very_secret_key_here' # **IMPORTANT: CHANGE THIS TO A LONG, RANDOM STRING IN PRODUCTION**
+    # FLASK_SECRET_KEY overrides this; **IMPORTANT: SET IT TO A LONG, RANDOM STRING IN PRODUCTION**
+    app.secret_key = 'your_very_secret_key_here'
+    create_app()
     app.run(debug=True)
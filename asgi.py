@@ -0,0 +1,551 @@
+"""ASGI entry point: the read-heavy endpoints on asyncio, everything else through the Flask app.
+
+    uvicorn asgi:application --workers 4
+
+The homepage, destination and city lookups, search results (and "Load
+more"), the NDJSON search API and the fare calendar API are served by the
+coroutines below. Their database reads go through ``async_db_pool`` (or
+the replica pools, routed as app.get_db_connection(read_only=True) routes)
+on mysql.connector.aio connections, so a request waiting on MySQL is a pending
+coroutine rather than a blocked worker thread. Each coroutine runs inside a
+Flask request context, so sessions, flashed messages, templates, url_for and
+the /metrics hooks behave exactly as they do under a WSGI server.
+
+Every other route, the booking flow included, is the unchanged Flask view,
+run on a pool of WSGI_THREADS threads with the sync connection pool. Route
+catalog reloads, the journeys version check and connecting-trip planning
+(which can reload the route graph) run on those threads too, never on the
+event loop.
+
+``python benchmarks/loadtest_async.py`` compares this with the WSGI setup.
+"""
+import asyncio
+import contextvars
+import io
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import mysql.connector
+import mysql.connector.aio
+from flask import Response, flash, jsonify, redirect, render_template, request, request_started, session, url_for
+from werkzeug.exceptions import HTTPException
+
+import app as journey_app
+from app import DB_CONFIG, DB_POOL_CONFIG, REPLICA_CONFIGS
+from async_db_pool import AsyncConnectionPool
+from db_pool import PoolTimeout
+from fare_calendar import ROUTE_FARES_SQL, RouteFares
+from journey_search import (QUOTED_SORTS, SEARCH_PAGE_SIZE, InvalidCursor, build_search_query, decode_cursor,
+                            quoted_price_page, split_page)
+from metrics import instrument_async_connection, observe_connect
+from quotes import student_fare_requested
+from search_api import (NDJSON_MIMETYPE, SearchParamsError, build_batch_query, build_stream_query, journey_records,
+                        ndjson_line, parse_batch_pairs, parse_search_params, stream_batches_async)
+
+# Environment overrides apply before the pools below read DB_CONFIG, DB_POOL_CONFIG and REPLICA_CONFIGS
+flask_app = journey_app.create_app()
+
+# --- Async Connection Pool ---
+# Same limits as the sync pool (DB_POOL_CONFIG); only the async views below use it.
+async_db_pool = AsyncConnectionPool(lambda: mysql.connector.aio.connect(**DB_CONFIG), **DB_POOL_CONFIG)
+
+journey_app.metrics_registry.register_stats('async_db_pool', lambda: async_db_pool.stats(),
+                                            counters=('checkouts', 'waits', 'timeouts', 'created', 'recycled',
+                                                      'ping_failures', 'wait_seconds'))
+
+# One per app.REPLICA_CONFIGS entry, in the same order: app.replica_set (and its health checks) decides
+# which are in rotation, and its counters cover the checkouts from these too.
+async_replica_pools = [AsyncConnectionPool(lambda config=config: mysql.connector.aio.connect(**config),
+                                           **DB_POOL_CONFIG) for config in REPLICA_CONFIGS]
+
+# --- Sync fallback ---
+# Threads for the Flask views without an async version and for blocking cache reloads.
+WSGI_THREADS = 10
+wsgi_executor = ThreadPoolExecutor(max_workers=WSGI_THREADS, thread_name_prefix='wsgi')
+
+async def run_sync(func, *args):
+    """Runs a blocking call on the WSGI threads, inside the current request context if there is one."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(wsgi_executor, contextvars.copy_context().run, func, *args)
+
+async def connect_replica():
+    """A connection from the next replica in rotation, or None to use the primary (see app.replica_set)."""
+    replica_set = journey_app.replica_set
+    for index in replica_set.candidates():
+        try:
+            conn = await async_replica_pools[index].connect()
+        except PoolTimeout:
+            continue
+        except mysql.connector.Error as err:
+            replica_set.checkout_failed(index, err)
+            continue
+        replica_set.checked_out(index)
+        return conn
+    if async_replica_pools:
+        replica_set.fell_back()
+    return None
+
+async def get_db_connection():
+    # Async counterpart of app.get_db_connection; release with `await conn.close()`.
+    # The async views only read, so they use a replica unless this user has just written.
+    try:
+        started = time.perf_counter()
+        conn = await connect_replica() if not journey_app.pinned_to_primary() else None
+        if conn is None:
+            conn = await async_db_pool.connect()
+        observe_connect(time.perf_counter() - started)
+        return instrument_async_connection(conn)
+    except PoolTimeout as err:
+        print(f"Database pool exhausted: {err}")
+        flash("The service is busy right now. Please try again in a moment.", 'error')
+        return None
+    except mysql.connector.Error as err:
+        print(f"Error connecting to database: {err}")
+        flash(f"Database connection error: {err}. Please check your database server.", 'error')
+        return None
+
+async def ensure_route_catalog():
+    """Reloads a stale route catalog on the WSGI threads so its lookups are answered from memory."""
+    if not journey_app.route_catalog.is_fresh():
+        await run_sync(journey_app.route_catalog.origins)
+
+
+# --- Async views ---
+# Keyed by the Flask endpoint they replace, so app.url_map stays the one list of routes.
+ASYNC_VIEWS = {}
+
+def async_view(endpoint):
+    def register(view):
+        ASYNC_VIEWS[endpoint] = view
+        return view
+    return register
+
+@async_view('index')
+async def index():
+    # No database work: the Flask view renders straight away
+    return journey_app.index()
+
+@async_view('get_destinations')
+async def get_destinations(origin_city):
+    if journey_app.current_journey_snapshot() is None:
+        await ensure_route_catalog()
+    return journey_app.get_destinations(origin_city)
+
+@async_view('api_cities')
+async def api_cities():
+    await ensure_route_catalog()
+    return journey_app.api_cities()
+
+async def fetch_search_page(origin, destination, selected_modes, sort_by, after=None, limit=SEARCH_PAGE_SIZE):
+    """app.fetch_search_page over the async pool."""
+    conn = await get_db_connection()
+    if not conn:
+        return None, None
+    cursor = await conn.cursor(dictionary=True)
+    try:
+        query, params = build_search_query(origin, destination, selected_modes, sort_by, after, limit)
+        await cursor.execute(query, params)
+        return split_page(await cursor.fetchall(), sort_by, limit)
+    except mysql.connector.Error as err:
+        flash(f'Error fetching journeys: {err}', 'error')
+        return None, None
+    finally:
+        await cursor.close()
+        await conn.close()
+
+async def get_quoted_ranking(origin, destination, selected_modes, sort_by, departure_date, journey_type, show_student_discounts):
+    """app.get_quoted_ranking with the route fetched over the async pool; shares quoted_rankings_cache with it.
+
+    Building a ranking reads and quotes the whole route, so it runs on the WSGI threads, not the event loop.
+    """
+    key = journey_app.quoted_ranking_key(origin, destination, selected_modes, sort_by, departure_date, journey_type,
+                                         show_student_discounts)
+    ranking = journey_app.quoted_rankings_cache.get(key)
+    if ranking is not None:
+        return ranking
+    if journey_app.current_journey_snapshot() is not None:
+        return await run_sync(journey_app.get_quoted_ranking, origin, destination, selected_modes, sort_by,
+                              departure_date, journey_type, show_student_discounts)
+    rows, _ = await fetch_search_page(origin, destination, selected_modes, sort_by, limit=None)
+    if rows is None:
+        return None
+    ranking = await run_sync(journey_app.rank_route, rows, departure_date, journey_type, show_student_discounts)
+    journey_app.quoted_rankings_cache.put(key, ranking)
+    return ranking
+
+async def get_search_page(origin, destination, selected_modes, sort_by, departure_date, journey_type, show_student_discounts, after_token=None):
+    """app.get_search_page with the page fetched over the async pool; shares search_cache with it.
+
+    Like app.get_search_page, it reads the page from the journey snapshot instead when there is one.
+    """
+    cache_key = journey_app.search_page_key(origin, destination, selected_modes, sort_by, departure_date,
+                                            journey_type, show_student_discounts, after_token)
+    cached = journey_app.search_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    after = decode_cursor(after_token, sort_by) if after_token else None
+    if sort_by in QUOTED_SORTS:
+        ranking = await get_quoted_ranking(origin, destination, selected_modes, sort_by, departure_date, journey_type,
+                                           show_student_discounts)
+        if ranking is None:
+            return None, None
+        rows, next_cursor = quoted_price_page(ranking, after)
+    else:
+        snapshot = journey_app.current_journey_snapshot()
+        if snapshot is not None:
+            # A few array lookups in shared memory: quicker than handing the page to another thread
+            rows, next_cursor = snapshot.search_page(origin, destination, selected_modes, sort_by, after)
+        else:
+            rows, next_cursor = await fetch_search_page(origin, destination, selected_modes, sort_by, after)
+        if rows is None:
+            return None, None
+    args = (cache_key, rows, next_cursor, after is None, origin, destination, selected_modes, sort_by,
+            departure_date, journey_type, show_student_discounts)
+    if not rows and after is None:
+        # Planning connecting trips can take tens of milliseconds (and may reload the route graph):
+        # run it on the WSGI threads, where it shares the CPU instead of stalling the event loop
+        return await run_sync(journey_app.process_search_page, *args)
+    return journey_app.process_search_page(*args)
+
+@async_view('search_results')
+async def search_results():
+    origin = request.values.get('origin')
+    destination = request.values.get('destination')
+    departure_date = request.values.get('departure_date')
+    return_date = request.values.get('return_date')
+    passengers = request.values.get('passengers', 1)
+    journey_type = request.values.get('journey_type', 'one_way')
+
+    if origin == destination:
+        flash('Origin and Destination cannot be the same. Please select different locations.', 'error')
+        return redirect(url_for('index'))
+
+    selected_modes = request.args.getlist('mode')
+    sort_by = request.args.get('sort', 'cheapest')
+    show_student_discounts = student_fare_requested(request.args)
+
+    results, next_cursor = await get_search_page(origin, destination, selected_modes, sort_by, departure_date,
+                                                 journey_type, show_student_discounts)
+    if results is None:
+        results = []
+    elif not results:
+        flash(f'No journeys found from {origin} to {destination}. Please try different locations or dates.', 'info')
+
+    return render_template('results.html',
+                           origin=origin,
+                           destination=destination,
+                           departure_date=departure_date,
+                           return_date=return_date,
+                           passengers=passengers,
+                           results=results,
+                           next_cursor=next_cursor,
+                           user_id=session.get('user_id'),
+                           username=session.get('username'),
+                           selected_modes=selected_modes,
+                           sort_by=sort_by,
+                           show_student_discounts=show_student_discounts,
+                           journey_type=journey_type)
+
+@async_view('search_results_more')
+async def search_results_more():
+    departure_date = request.args.get('departure_date')
+    journey_type = request.args.get('journey_type', 'one_way')
+    sort_by = request.args.get('sort', 'cheapest')
+    show_student_discounts = student_fare_requested(request.args)
+
+    after_token = request.args.get('after')
+    if not after_token:
+        return jsonify({'error': 'after cursor is required.'}), 400
+    try:
+        results, next_cursor = await get_search_page(request.args.get('origin'), request.args.get('destination'),
+                                                     request.args.getlist('mode'), sort_by, departure_date,
+                                                     journey_type, show_student_discounts, after_token=after_token)
+    except InvalidCursor as err:
+        return jsonify({'error': str(err)}), 400
+    if results is None:
+        return jsonify({'error': 'Error fetching journeys.'}), 503
+
+    response = flask_app.make_response(render_template('results_page.html',
+                                                       results=results,
+                                                       departure_date=departure_date,
+                                                       return_date=request.args.get('return_date'),
+                                                       passengers=request.args.get('passengers', 1),
+                                                       journey_type=journey_type,
+                                                       show_student_discounts=show_student_discounts))
+    response.headers['X-Next-Cursor'] = next_cursor or ''
+    return response
+
+class AsyncStreamResponse(Response):
+    """A response whose body is an async generator of text chunks, each sent as soon as it is produced.
+
+    ``on_close`` is awaited once the response is done with, sent in full or not.
+    """
+
+    def __init__(self, chunks, on_close=None, **kwargs):
+        super().__init__(iter(()), **kwargs)  # a streamed body, so after_request hooks leave it alone
+        self.chunks = chunks
+        self.on_close = on_close
+
+    async def aclose(self):
+        try:
+            await self.chunks.aclose()
+        finally:
+            if self.on_close is not None:
+                await self.on_close()
+
+async def stream_journeys(query, params, search, per_pair_limit=None):
+    """app.stream_journeys over the async pool: one NDJSON chunk per fetched batch."""
+    conn = await get_db_connection()
+    if not conn:
+        return jsonify({'error': 'Database unavailable.'}), 503
+    cursor = await conn.cursor(dictionary=True)
+    try:
+        await cursor.execute(query, params)
+    except mysql.connector.Error as err:
+        await cursor.close()
+        await conn.close()
+        return jsonify({'error': f'Error fetching journeys: {err}'}), 500
+
+    async def generate():
+        counts = {}
+        try:
+            async for rows in stream_batches_async(cursor):
+                if per_pair_limit:
+                    rows = journey_app.limit_per_pair(rows, counts, per_pair_limit)
+                yield ''.join(ndjson_line(record) for record in journey_records(rows, search))
+        except mysql.connector.Error as err:
+            yield ndjson_line({'error': f'Error fetching journeys: {err}'})
+
+    async def close():
+        # Also runs when the body was never read (HEAD, client gone before the first chunk)
+        try:
+            await cursor.close()
+        except mysql.connector.Error:
+            pass  # Client went away mid-stream; the pool discards the connection
+        await conn.close()
+
+    return AsyncStreamResponse(generate(), close, mimetype=NDJSON_MIMETYPE)
+
+@async_view('api_search')
+async def api_search():
+    origin = request.args.get('origin')
+    destination = request.args.get('destination')
+    if not origin or not destination:
+        return jsonify({'error': 'origin and destination are required.'}), 400
+    try:
+        search = parse_search_params(request.args)
+    except SearchParamsError as err:
+        return jsonify({'error': str(err)}), 400
+    query, params = build_stream_query(origin, destination, search)
+    return await stream_journeys(query, params, search)
+
+@async_view('api_search_batch')
+async def api_search_batch():
+    body = request.get_json(silent=True)
+    try:
+        pairs = parse_batch_pairs(body)
+        search = parse_search_params(body)
+    except SearchParamsError as err:
+        return jsonify({'error': str(err)}), 400
+    query, params = build_batch_query(pairs, search)
+    return await stream_journeys(query, params, search, per_pair_limit=search['limit'])
+
+async def get_route_fares(origin, destination):
+    """app.get_route_fares over the async pool; shares route_fares_cache with it."""
+    key = (origin, destination)
+    fares = journey_app.route_fares_cache.get(key)
+    if fares is not None:
+        return fares
+    conn = await get_db_connection()
+    if not conn:
+        return None
+    cursor = await conn.cursor(dictionary=True)
+    try:
+        await cursor.execute(ROUTE_FARES_SQL, (origin, destination))
+        fares = RouteFares(await cursor.fetchall())
+    except mysql.connector.Error as err:
+        print(f"Error loading fares for {origin} to {destination}: {err}")
+        return None
+    finally:
+        await cursor.close()
+        await conn.close()
+    journey_app.route_fares_cache.put(key, fares)
+    return fares
+
+@async_view('api_calendar')
+async def api_calendar():
+    try:
+        params = journey_app.calendar_params(request.args)
+    except ValueError as err:
+        return jsonify({'error': str(err)}), 400
+    fares = await get_route_fares(params['origin'], params['destination'])
+    if fares is None:
+        return jsonify({'error': 'Could not load journeys.'}), 503
+    return jsonify(journey_app.calendar_json(journey_app.price_calendar(fares, params), params))
+
+
+# --- ASGI plumbing ---
+
+def build_environ(scope, body):
+    """The WSGI environ (PEP 3333) for an ASGI HTTP scope and its request body."""
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+    root_path = scope.get('root_path', '')
+    path = scope['path']
+    if root_path and path.startswith(root_path):
+        path = path[len(root_path):]
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': root_path.encode('utf-8').decode('latin-1'),
+        'PATH_INFO': path.encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1] or 80),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': client[0],
+        'REMOTE_PORT': str(client[1]),
+        'CONTENT_LENGTH': str(len(body)),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope.get('headers', ()):
+        name, value = name.decode('latin-1'), value.decode('latin-1')
+        if name == 'content-length':
+            continue  # the body has already been read in full
+        key = 'CONTENT_TYPE' if name == 'content-type' else 'HTTP_' + name.upper().replace('-', '_')
+        if key in environ:
+            value = environ[key] + ('; ' if key == 'HTTP_COOKIE' else ',') + value
+        environ[key] = value
+    return environ
+
+async def read_body(receive):
+    chunks = []
+    while True:
+        message = await receive()
+        if message['type'] != 'http.request':
+            break
+        chunks.append(message.get('body', b''))
+        if not message.get('more_body'):
+            break
+    return b''.join(chunks)
+
+def start_message(status, headers):
+    return {
+        'type': 'http.response.start',
+        'status': int(status.split(' ', 1)[0]),
+        'headers': [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers],
+    }
+
+def match_async_view(environ):
+    """(coroutine, view args) for requests an async view serves, else (None, None)."""
+    adapter = flask_app.url_map.bind_to_environ(environ)
+    try:
+        endpoint, view_args = adapter.match()
+    except HTTPException:
+        return None, None  # 404s, 405s and slash redirects are left to Flask
+    return ASYNC_VIEWS.get(endpoint), view_args
+
+async def call_async_view(view, view_args, environ, send):
+    """Runs an async view the way Flask's full_dispatch_request runs a sync one, then sends the response."""
+    ctx = flask_app.request_context(environ)
+    error = None
+    ctx.push()
+    try:
+        try:
+            try:
+                journey_app.init_worker()  # before the watcher below needs the pools
+                if journey_app.journeys_watcher.due():
+                    # Off the event loop; check_journeys_version then finds nothing to do
+                    await run_sync(journey_app.journeys_watcher.poll)
+                request_started.send(flask_app, _async_wrapper=flask_app.ensure_sync)
+                rv = flask_app.preprocess_request()
+                if rv is None:
+                    rv = await view(**view_args)
+            except Exception as err:
+                rv = flask_app.handle_user_exception(err)
+            response = flask_app.finalize_request(rv)
+        except Exception as err:
+            error = err
+            response = flask_app.handle_exception(err)
+
+        started = []
+        body = response(environ, lambda status, headers, exc_info=None: started.extend((status, headers)))
+        await send(start_message(*started))
+        for chunk in body:
+            await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+        if isinstance(response, AsyncStreamResponse):
+            try:
+                if environ['REQUEST_METHOD'] != 'HEAD':
+                    async for chunk in response.chunks:
+                        await send({'type': 'http.response.body', 'body': chunk.encode(), 'more_body': True})
+            finally:
+                await response.aclose()
+        await send({'type': 'http.response.body', 'body': b''})
+    finally:
+        ctx.pop(error)
+
+async def call_wsgi(environ, send):
+    """Runs the Flask app for one request on the WSGI threads, sending the response as it is produced."""
+    loop = asyncio.get_running_loop()
+
+    def send_from_thread(message):
+        asyncio.run_coroutine_threadsafe(send(message), loop).result()
+
+    def run():
+        started = []
+
+        def start_response(status, headers, exc_info=None):
+            started[:] = [status, headers]
+
+        body = flask_app(environ, start_response)
+        try:
+            sent_start = False
+            for chunk in body:
+                if not chunk:
+                    continue
+                if not sent_start:
+                    send_from_thread(start_message(*started))
+                    sent_start = True
+                send_from_thread({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+            if not sent_start:
+                send_from_thread(start_message(*started))
+            send_from_thread({'type': 'http.response.body', 'body': b''})
+        finally:
+            if hasattr(body, 'close'):
+                body.close()
+
+    await loop.run_in_executor(wsgi_executor, run)
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            journey_app.init_worker()
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await async_db_pool.dispose()
+            for pool in async_replica_pools:
+                await pool.dispose()
+            wsgi_executor.shutdown(wait=False)
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+async def application(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        await lifespan(receive, send)
+        return
+    if scope['type'] != 'http':
+        raise ValueError(f"Unsupported ASGI scope type: {scope['type']}")
+    environ = build_environ(scope, await read_body(receive))
+    view, view_args = match_async_view(environ)
+    if view is None:
+        await call_wsgi(environ, send)
+    else:
+        await call_async_view(view, view_args, environ, send)
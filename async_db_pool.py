@@ -0,0 +1,211 @@
+"""Asyncio connection pool for the ASGI serving path (asgi.py).
+
+The same bounded pool as db_pool.ConnectionPool, for mysql.connector.aio
+connections: checking out, pinging, rolling back and closing are awaited, so
+a request waiting on the database gives the event loop back to the others
+instead of holding a worker thread. The pool belongs to the event loop it is
+first used on; each ASGI worker process creates its own.
+"""
+import asyncio
+import collections
+import time
+
+from db_pool import PoolTimeout
+
+
+class AsyncPooledConnection:
+    """Wraps a raw async connection so that ``await close()`` returns it to the pool.
+
+    Every other attribute is forwarded, so ``await conn.cursor()`` and the
+    cursor's awaited ``execute``/``fetch*`` calls work as on the raw connection.
+    """
+
+    def __init__(self, pool, raw, created_at):
+        self._pool = pool
+        self._raw = raw
+        self._created_at = created_at
+        self._released = False
+
+    def __getattr__(self, name):
+        return getattr(self._raw, name)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    @property
+    def raw_connection(self):
+        """The underlying connection; it outlives this checkout."""
+        return self._raw
+
+    async def is_connected(self):
+        return not self._released and await self._raw.is_connected()
+
+    async def close(self):
+        if self._released:
+            return
+        self._released = True
+        await self._pool._release(self._raw, self._created_at)
+
+
+class AsyncConnectionPool:
+    """A bounded pool of connections created by the coroutine function ``connect_func``.
+
+    Takes the same settings as db_pool.ConnectionPool (pool_size,
+    checkout_timeout, recycle_seconds, pre_ping) and raises the same PoolTimeout.
+    """
+
+    def __init__(self, connect_func, pool_size=10, checkout_timeout=5.0,
+                 recycle_seconds=1800, pre_ping=True):
+        if pool_size < 1:
+            raise ValueError("pool_size must be at least 1")
+        self._connect_func = connect_func
+        self.pool_size = pool_size
+        self.checkout_timeout = checkout_timeout
+        self.recycle_seconds = recycle_seconds
+        self.pre_ping = pre_ping
+
+        self._waiters = collections.deque()  # futures of checkouts waiting for a connection, oldest first
+        self._idle = []  # list of (raw_connection, created_at)
+        self._open = 0
+        self._in_use = 0
+        self._stats = {
+            'checkouts': 0,
+            'waits': 0,
+            'timeouts': 0,
+            'created': 0,
+            'recycled': 0,
+            'ping_failures': 0,
+            'wait_seconds': 0.0,
+        }
+
+    # --- Checkout / release ---
+
+    async def connect(self):
+        """Check out a connection, waiting up to ``checkout_timeout`` seconds.
+
+        Waiting checkouts are served first come, first served: a released
+        connection is handed straight to the oldest waiter rather than left
+        for whichever coroutine asks next.
+        """
+        if self._idle and not self._waiters:
+            raw, created_at = self._idle.pop()
+        elif self._open < self.pool_size:
+            raw, created_at = None, None
+            self._open += 1
+        else:
+            raw, created_at = await self._wait()
+        self._in_use += 1
+        self._stats['checkouts'] += 1
+
+        try:
+            if raw is not None:
+                raw, created_at = await self._validate(raw, created_at)
+            if raw is None:
+                raw = await self._connect_func()
+                created_at = time.monotonic()
+                self._stats['created'] += 1
+        except BaseException:
+            self._in_use -= 1
+            self._free_slot()
+            raise
+        return AsyncPooledConnection(self, raw, created_at)
+
+    async def _wait(self):
+        """(raw, created_at) handed over by _release, or (None, None) for a free slot to connect in."""
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        self._stats['waits'] += 1
+        wait_started = time.monotonic()
+        try:
+            return await asyncio.wait_for(waiter, self.checkout_timeout)
+        except asyncio.TimeoutError:
+            self._stats['timeouts'] += 1
+            raise PoolTimeout(
+                f"No database connection available within {self.checkout_timeout}s "
+                f"(pool_size={self.pool_size})") from None
+        finally:
+            self._stats['wait_seconds'] += time.monotonic() - wait_started
+            if not waiter.done():
+                waiter.cancel()
+            try:
+                self._waiters.remove(waiter)
+            except ValueError:
+                pass
+
+    def _hand_over(self, raw, created_at):
+        """Gives a connection (or with raw None, an open slot) to the oldest waiter. False if nobody waits."""
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result((raw, created_at))
+                return True
+        return False
+
+    def _free_slot(self):
+        if not self._hand_over(None, None):
+            self._open -= 1
+
+    async def _validate(self, raw, created_at):
+        """Return (raw, created_at), or (None, None) if it must be replaced."""
+        if self.recycle_seconds and time.monotonic() - created_at > self.recycle_seconds:
+            await self._discard(raw)
+            self._stats['recycled'] += 1
+            return None, None
+        if self.pre_ping:
+            try:
+                await raw.ping(reconnect=False)
+            except Exception:
+                await self._discard(raw)
+                self._stats['ping_failures'] += 1
+                return None, None
+        return raw, created_at
+
+    async def _release(self, raw, created_at):
+        healthy = True
+        try:
+            # A streaming cursor abandoned mid-way leaves rows on the wire;
+            # such a connection cannot be reused.
+            if getattr(raw, 'unread_result', False):
+                healthy = False
+            # Never hand the next request a half-finished transaction.
+            elif getattr(raw, 'in_transaction', False):
+                await raw.rollback()
+        except Exception:
+            healthy = False
+        self._in_use -= 1
+        if not healthy:
+            await self._discard(raw)
+            self._free_slot()
+        elif not self._hand_over(raw, created_at):
+            self._idle.append((raw, created_at))
+
+    @staticmethod
+    async def _discard(raw):
+        try:
+            await raw.close()
+        except Exception:
+            pass
+
+    # --- Maintenance ---
+
+    async def dispose(self):
+        """Close every idle connection; checked-out ones close when released."""
+        idle, self._idle = self._idle, []
+        self._open -= len(idle)
+        for raw, _ in idle:
+            await self._discard(raw)
+
+    def stats(self):
+        """Snapshot of pool usage counters."""
+        snapshot = dict(self._stats)
+        snapshot.update({
+            'pool_size': self.pool_size,
+            'open': self._open,
+            'in_use': self._in_use,
+            'idle': len(self._idle),
+        })
+        snapshot['wait_seconds'] = round(snapshot['wait_seconds'], 6)
+        return snapshot
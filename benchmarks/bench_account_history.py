@@ -0,0 +1,116 @@
+"""/account cost against booking history size: whole-history load versus keyset pages and the streamed export.
+
+    python benchmarks/bench_account_history.py --sqlite /tmp/history.sqlite --sizes 1000 10000 50000
+
+For each size a user is given that many bookings, then:
+
+- "whole history": what /account used to do, every booking fetched and
+  turned into a record (time and peak Python memory);
+- "first page" / "deep page": booking_store.booking_page for the first page
+  and for one half-way through the past bookings;
+- "export": the CSV export (booking_export.export_chunks) consumed chunk by
+  chunk, with its peak Python memory.
+
+The SQLite file is created from scratch on each run.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+import tracemalloc
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import sqlite_standin  # noqa: E402
+from booking_export import export_chunks  # noqa: E402
+from booking_store import (BOOKING_COLUMNS, BOOKING_HISTORY_SQL, BookingRecord, booking_page,  # noqa: E402
+                           encode_booking_cursor)
+
+WHOLE_HISTORY_SQL = (f"SELECT {BOOKING_COLUMNS} FROM bookings b JOIN journeys j ON b.journey_id = j.id"
+                     " WHERE b.user_id = %s ORDER BY b.booking_date DESC")
+
+
+def add_user_with_bookings(conn, count, rng):
+    cursor = conn.cursor()
+    cursor.execute("INSERT INTO users (username, email, password_hash) VALUES (%s, %s, %s)",
+                   (f"corporate{count}", f"corporate{count}@example.com", 'x'))
+    user_id = cursor.lastrowid
+    cursor.execute("SELECT id FROM journeys")
+    journey_ids = [journey_id for (journey_id,) in cursor.fetchall()]
+    today = date.today()
+    cursor.executemany(
+        "INSERT INTO bookings (user_id, journey_id, passengers, total_price, booking_date, payment_method,"
+        " payment_status, transaction_id) VALUES (%s, %s, %s, %s, %s, %s, %s, %s)",
+        [(user_id, rng.choice(journey_ids), 1, round(rng.uniform(5, 150), 2),
+          today + timedelta(days=rng.randint(-1500, 200)), 'simulated-card', 'completed', f"H{count}-{i}")
+         for i in range(count)])
+    conn.commit()
+    cursor.close()
+    return user_id
+
+
+def timed(func, rounds=3):
+    """(result, best seconds over rounds, peak traced bytes of one more run); tracing is too slow to time under."""
+    best = float('inf')
+    for _ in range(rounds):
+        started = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - started)
+    tracemalloc.start()
+    func()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, best, peak
+
+
+def whole_history(conn, user_id):
+    cursor = conn.cursor()
+    cursor.execute(WHOLE_HISTORY_SQL, (user_id,))
+    records = [BookingRecord(row) for row in cursor.fetchall()]
+    cursor.close()
+    return records
+
+
+def export_size(conn, user_id):
+    cursor = conn.cursor()
+    cursor.execute(BOOKING_HISTORY_SQL, (user_id,))
+    size = sum(len(chunk) for chunk in export_chunks(cursor, 'csv'))
+    cursor.close()
+    return size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sqlite', metavar='PATH', required=True)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 50000])
+    args = parser.parse_args()
+
+    from seed import seed
+    if os.path.exists(args.sqlite):
+        os.remove(args.sqlite)
+    sqlite_standin.create_schema(args.sqlite)
+    conn = sqlite_standin.connect(args.sqlite)
+    seed(conn, bookings=0)
+    rng = random.Random(7)
+    today = date.today()
+
+    print(f"{'bookings':>9} {'whole history':>22} {'first page':>11} {'deep page':>10} {'export':>22}")
+    for size in args.sizes:
+        user_id = add_user_with_bookings(conn, size, rng)
+        _, whole_seconds, whole_peak = timed(lambda: whole_history(conn, user_id))
+        _, first_seconds, _ = timed(lambda: booking_page(conn, user_id, today, upcoming=False))
+        # A cursor half-way down the past bookings, as if "Older journeys" had been followed that far
+        middle = whole_history(conn, user_id)[size // 2]
+        after = encode_booking_cursor(middle)
+        _, deep_seconds, _ = timed(lambda: booking_page(conn, user_id, today, upcoming=False, after=after))
+        exported, export_seconds, export_peak = timed(lambda: export_size(conn, user_id))
+        print(f"{size:>9} {whole_seconds * 1000:9.1f} ms {whole_peak / 1e6:7.1f} MB"
+              f" {first_seconds * 1000:8.2f} ms {deep_seconds * 1000:7.2f} ms"
+              f" {export_seconds * 1000:9.1f} ms {export_peak / 1e6:7.1f} MB  ({exported / 1e6:.1f} MB of CSV)")
+    conn.close()
+
+
+if __name__ == '__main__':
+    main()
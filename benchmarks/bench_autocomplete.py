@@ -0,0 +1,88 @@
+"""Latency of city autocomplete (city_index.CityIndex) on a large synthetic station list.
+
+    python benchmarks/bench_autocomplete.py --cities 5000 --queries 20000
+
+Builds an index of made-up multi-word station names with skewed popularity,
+then times completions for prefixes of 1-8 characters, half of them with a
+typo (swapped, dropped or replaced letter) so the trigram/edit-distance
+fallback is exercised. Reports build time and p50/p95/p99/max per lookup;
+the target is well under a millisecond.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from city_index import CityIndex, normalise  # noqa: E402
+
+SYLLABLES = ['ash', 'bar', 'bri', 'ches', 'dar', 'ford', 'glen', 'ham', 'ing', 'kirk', 'lin', 'ley', 'man',
+             'mouth', 'new', 'nor', 'ock', 'pen', 'ric', 'sal', 'ston', 'tor', 'wick', 'worth', 'york']
+SUFFIXES = ['', '', '', ' Central', ' Parkway', ' Junction', ' upon Tyne', " St Mary's", ' Airport', ' Road']
+
+
+def station_names(count, rng):
+    names = set()
+    while len(names) < count:
+        name = ''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 3))).capitalize()
+        names.add(name + rng.choice(SUFFIXES))
+    return sorted(names)
+
+
+def typo(text, rng):
+    if len(text) < 4:
+        return text
+    i = rng.randrange(1, len(text) - 1)
+    kind = rng.choice(('swap', 'drop', 'replace'))
+    if kind == 'swap':
+        return text[:i] + text[i + 1] + text[i] + text[i + 2:]
+    if kind == 'drop':
+        return text[:i] + text[i + 1:]
+    return text[:i] + rng.choice('abcdefghijklmnopqrstuvwxyz') + text[i + 1:]
+
+
+def percentile(sorted_values, pct):
+    return sorted_values[min(len(sorted_values) - 1, int(pct / 100.0 * len(sorted_values)))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--cities', type=int, default=5000)
+    parser.add_argument('--queries', type=int, default=20000)
+    parser.add_argument('--limit', type=int, default=10)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    names = station_names(args.cities, rng)
+    scores = {name: int(rng.paretovariate(1.2) * 10) for name in names}  # a few very popular stations
+
+    started = time.perf_counter()
+    index = CityIndex(scores)
+    build_seconds = time.perf_counter() - started
+
+    queries = []
+    for _ in range(args.queries):
+        key = normalise(rng.choice(names))
+        prefix = key[:rng.randint(1, 8)]
+        queries.append(typo(prefix, rng) if rng.random() < 0.5 else prefix)
+
+    latencies = []
+    empty = 0
+    for query in queries:
+        started = time.perf_counter()
+        results = index.complete(query, args.limit)
+        latencies.append(time.perf_counter() - started)
+        empty += not results
+    latencies.sort()
+
+    print(f"{len(index)} cities indexed in {build_seconds * 1000:.1f} ms")
+    print(f"{len(queries)} lookups (limit {args.limit}, ~half with a typo), {empty} with no suggestions")
+    print("latency us: " + "  ".join(f"p{pct} {percentile(latencies, pct) * 1e6:.1f}" for pct in (50, 95, 99))
+          + f"  max {latencies[-1] * 1e6:.1f}")
+
+
+if __name__ == '__main__':
+    main()
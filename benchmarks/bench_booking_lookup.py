@@ -0,0 +1,129 @@
+"""Per-call cost of the booking lookup behind confirmation/view/modify, before and after booking_store.
+
+"before" is what the routes used to do on every request: open a dictionary
+cursor, send ``SELECT b.*, ...`` as text, then patch the dates with
+``datetime.combine``. "after" is ``booking_store.get_booking``: a prepared
+statement reused across checkouts of the pooled connection, the needed
+columns only, and a ``__slots__`` record.
+
+    python benchmarks/bench_booking_lookup.py --sqlite /tmp/bench.sqlite --calls 20000
+    python benchmarks/bench_booking_lookup.py --mysql --calls 20000    # seeded with benchmarks/seed.py
+
+Each call checks a connection out of a one-connection pool and hands it back,
+like a request does. On the SQLite stand-in both paths hit sqlite3's own
+statement cache, so the difference there is the Python-side work (cursor
+set-up, row dicts, date fix-ups); the parse/plan saving shows up on MySQL.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import date, datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from booking_store import get_booking  # noqa: E402
+from db_pool import ConnectionPool  # noqa: E402
+from journey_metrics import journey_co2_kg  # noqa: E402
+
+LEGACY_QUERY = """
+SELECT b.*, j.origin, j.destination, j.mode, j.duration, j.carbon_footprint, j.co2_kg, j.description AS journey_description
+FROM bookings b
+JOIN journeys j ON b.journey_id = j.id
+WHERE b.transaction_id = %s AND b.user_id = %s
+"""
+
+
+def legacy_get_booking(conn, transaction_id, user_id):
+    cursor = conn.cursor(dictionary=True)
+    try:
+        cursor.execute(LEGACY_QUERY, (transaction_id, user_id))
+        booking = cursor.fetchone()
+        if booking:
+            booking['carbon_footprint'] = journey_co2_kg(booking)
+            if isinstance(booking.get('booking_date'), date) and not isinstance(booking.get('booking_date'), datetime):
+                booking['booking_date'] = datetime.combine(booking['booking_date'], datetime.min.time())
+            if isinstance(booking.get('booked_at'), date) and not isinstance(booking.get('booked_at'), datetime):
+                booking['booked_at'] = datetime.combine(booking['booked_at'], datetime.min.time())
+        return booking
+    finally:
+        cursor.close()
+
+
+def warm_up(lookup, pool, keys):
+    for transaction_id, user_id in keys[:100]:  # and prepare the statement
+        conn = pool.connect()
+        lookup(conn, transaction_id, user_id)
+        conn.close()
+
+
+def timed_calls(lookup, pool, keys, calls, rng):
+    """Seconds per call over ``calls`` lookups of random bookings."""
+    started = time.perf_counter()
+    for _ in range(calls):
+        transaction_id, user_id = rng.choice(keys)
+        conn = pool.connect()
+        try:
+            if lookup(conn, transaction_id, user_id) is None:
+                raise SystemExit(f"booking {transaction_id} not found")
+        finally:
+            conn.close()
+    return (time.perf_counter() - started) / calls
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument('--sqlite', metavar='PATH', help="SQLite stand-in database (seeded if missing)")
+    target.add_argument('--mysql', action='store_true', help="use app.DB_CONFIG")
+    parser.add_argument('--calls', type=int, default=20000, help="per path, split across rounds")
+    parser.add_argument('--rounds', type=int, default=5)
+    args = parser.parse_args()
+
+    if args.mysql:
+        import mysql.connector
+        from app import load_config
+        DB_CONFIG = load_config()['DB']
+
+        def connect():
+            return mysql.connector.connect(**DB_CONFIG)
+    else:
+        import sqlite_standin
+        from seed import seed
+        if not os.path.exists(args.sqlite):
+            sqlite_standin.create_schema(args.sqlite)
+            conn = sqlite_standin.connect(args.sqlite)
+            seed(conn)
+            conn.close()
+
+        def connect():
+            return sqlite_standin.connect(args.sqlite)
+
+    pool = ConnectionPool(connect, pool_size=1, pre_ping=False)
+    conn = pool.connect()
+    cursor = conn.cursor()
+    cursor.execute("SELECT transaction_id, user_id FROM bookings ORDER BY id LIMIT 5000")
+    keys = cursor.fetchall()
+    cursor.close()
+    conn.close()
+
+    paths = {'before': legacy_get_booking, 'after': get_booking}
+    for lookup in paths.values():
+        warm_up(lookup, pool, keys)
+    # Alternate the two paths and keep each one's best round, so drift and noise hit both alike
+    best = dict.fromkeys(paths, float('inf'))
+    rng = random.Random(1)
+    for _ in range(args.rounds):
+        for label, lookup in paths.items():
+            best[label] = min(best[label], timed_calls(lookup, pool, keys, args.calls // args.rounds, rng))
+    for label, per_call in best.items():
+        print(f"{label:<7} {per_call * 1e6:8.1f} us/call  {1 / per_call:9.0f} calls/s")
+    saved = best['before'] - best['after']
+    print(f"per-call overhead saved {saved * 1e6:+.1f} us ({saved / best['before'] * 100:+.0f}%)")
+    pool.dispose()
+
+
+if __name__ == '__main__':
+    main()
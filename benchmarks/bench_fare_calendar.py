@@ -0,0 +1,117 @@
+"""Cost of a route's fare calendar: one search per day versus fare_calendar.build_calendar.
+
+"per-day" is what building the calendar from the search page would take:
+for each day, query the route's journeys and run every row through
+``app.build_journey_result``, then take the minimums. "vectorised" loads
+the route once into ``RouteFares`` and computes every day at once;
+"cached" is the same with the route already loaded, as it is for repeat
+requests until the route's journeys change.
+
+    python benchmarks/bench_fare_calendar.py --sqlite /tmp/bench.sqlite --days 90
+    python benchmarks/bench_fare_calendar.py --mysql --days 90    # seeded with benchmarks/seed.py
+
+Both builds are checked against each other before timing.
+"""
+import argparse
+import os
+import sys
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app import PROMO_DISCOUNT_SHARE, build_journey_result  # noqa: E402
+from fare_calendar import build_calendar, load_route_fares  # noqa: E402
+
+
+def per_day_calendar(conn, origin, destination, start, days):
+    calendar = []
+    for offset in range(days):
+        day = start + timedelta(days=offset)
+        cursor = conn.cursor(dictionary=True)
+        cursor.execute("SELECT * FROM journeys WHERE origin = %s AND destination = %s", (origin, destination))
+        results = [build_journey_result(row, day.isoformat(), 'one_way', False) for row in cursor.fetchall()]
+        cursor.close()
+        calendar.append({
+            'date': day,
+            'min_price': min(result['cost'] for result in results),
+            'min_co2_kg': min(result['co2_emissions'] for result in results),
+            'fastest_minutes': min(result['duration_minutes'] for result in results),
+        })
+    return calendar
+
+
+def vectorised_calendar(conn, origin, destination, start, days):
+    cursor = conn.cursor(dictionary=True)
+    try:
+        fares = load_route_fares(cursor, origin, destination)
+    finally:
+        cursor.close()
+    return build_calendar(fares, start, days, PROMO_DISCOUNT_SHARE)
+
+
+def best_of(func, rounds):
+    best = float('inf')
+    for _ in range(rounds):
+        started = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument('--sqlite', metavar='PATH', help="SQLite stand-in database (seeded if missing)")
+    target.add_argument('--mysql', action='store_true', help="use app.DB_CONFIG")
+    parser.add_argument('--days', type=int, default=90)
+    parser.add_argument('--rounds', type=int, default=5)
+    args = parser.parse_args()
+
+    if args.mysql:
+        import mysql.connector
+        from app import load_config
+        DB_CONFIG = load_config()['DB']
+        conn = mysql.connector.connect(**DB_CONFIG)
+    else:
+        import sqlite_standin
+        from seed import seed
+        if not os.path.exists(args.sqlite):
+            sqlite_standin.create_schema(args.sqlite)
+            conn = sqlite_standin.connect(args.sqlite)
+            seed(conn)
+            conn.close()
+        conn = sqlite_standin.connect(args.sqlite)
+
+    cursor = conn.cursor()
+    cursor.execute("SELECT origin, destination, COUNT(*) FROM journeys GROUP BY origin, destination"
+                   " ORDER BY COUNT(*) DESC LIMIT 1")
+    origin, destination, journeys = cursor.fetchone()
+    cursor.close()
+    start = date.today()
+
+    slow = per_day_calendar(conn, origin, destination, start, args.days)
+    fast = vectorised_calendar(conn, origin, destination, start, args.days)
+    for before, after in zip(slow, fast):
+        if (abs(before['min_price'] - after['min_price']) > 0.011 or before['fastest_minutes'] != after['fastest_minutes']
+                or abs(before['min_co2_kg'] - after['min_co2_kg']) > 0.001):
+            raise SystemExit(f"calendars differ on {before['date']}: {before} vs {after}")
+
+    cursor = conn.cursor(dictionary=True)
+    fares = load_route_fares(cursor, origin, destination)
+    cursor.close()
+
+    timings = {
+        'per-day': best_of(lambda: per_day_calendar(conn, origin, destination, start, args.days), args.rounds),
+        'vectorised': best_of(lambda: vectorised_calendar(conn, origin, destination, start, args.days), args.rounds),
+        'cached': best_of(lambda: build_calendar(fares, start, args.days, PROMO_DISCOUNT_SHARE), args.rounds),
+    }
+    print(f"{origin} to {destination}: {journeys} journeys, {args.days} days")
+    for label, seconds in timings.items():
+        print(f"{label:<11} {seconds * 1000:8.2f} ms  ({timings['per-day'] / seconds:5.1f}x)")
+    conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,322 @@
+"""Shared journey snapshot: same answers as SQL, query latency, memory per worker, and the atomic swap.
+
+    python benchmarks/bench_journey_snapshot.py
+    python benchmarks/bench_journey_snapshot.py --journeys 200000 --cities 60 --workers 8 --snapshot /dev/shm/j.snap
+
+Against a seeded SQLite stand-in file (a seventh of the journeys lose their
+co2_kg and an eleventh their duration_minutes, so NULL sort keys are covered):
+
+- equivalence: for ``--routes`` routes, every sort order, with and without a
+  mode filter, all pages are walked through build_search_query's SQL and
+  through JourneySnapshot.search_page, each with its own cursors and with the
+  other's; rows, order and cursors must match, and so must the destinations
+  from every origin. Through Flask's test client, /search_results and
+  /get_destinations must render the same bytes from the snapshot as from SQL;
+- latency of ``--queries`` first pages and destination lookups, from SQL
+  (``--latency-ms`` adds a simulated round trip) and from the snapshot;
+- memory: ``--workers`` forked processes each load the journeys, as Python
+  rows (a per-process cache), as a private copy of the snapshot's arrays, or
+  by mapping the shared file, all at once; each then reports the private
+  memory it added and its PSS (shared pages divided among the processes
+  mapping them), from ``/proc/self/smaps_rollup`` (Linux only);
+- swap: after a journey changes and its version is bumped, refresh() from
+  four threads at once rebuilds the file exactly once, current() maps the new
+  file, and a snapshot mapped before still answers from the old data.
+
+Exits 1 if a check fails.
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_startup import smaps_rollup  # noqa: E402
+from loadtest import percentile  # noqa: E402
+
+SORTS = ('cheapest', 'fastest', 'lowest_co2', 'relevance')
+
+failures = []
+
+
+def expect(condition, message):
+    print(f"{'ok  ' if condition else 'FAIL'} {message}")
+    if not condition:
+        failures.append(message)
+
+
+def comparable(row):
+    """A row with DECIMAL columns as floats, as the snapshot returns them."""
+    return {key: float(value) if key in ('price', 'co2_kg') and value is not None else value
+            for key, value in row.items()}
+
+
+def sql_page(conn, origin, destination, modes, sort_by, after):
+    from journey_search import build_search_query, split_page
+    cursor = conn.cursor(dictionary=True)
+    try:
+        cursor.execute(*build_search_query(origin, destination, modes, sort_by, after))
+        return split_page(cursor.fetchall(), sort_by)
+    finally:
+        cursor.close()
+
+
+def sql_destinations(conn, origin):
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT DISTINCT destination FROM journeys WHERE origin = %s ORDER BY destination", (origin,))
+        return [destination for (destination,) in cursor.fetchall()]
+    finally:
+        cursor.close()
+
+
+def check_equivalence(args, conn, snapshot, routes, rng):
+    from journey_search import decode_cursor
+
+    mismatches, pages = [], 0
+    for origin, destination in routes:
+        for sort_by in SORTS:
+            for modes in ([], [rng.choice(snapshot.modes)]):
+                sql_after = snapshot_after = None
+                while True:
+                    sql_rows, sql_next = sql_page(conn, origin, destination, modes, sort_by, sql_after)
+                    rows, next_cursor = snapshot.search_page(origin, destination, modes, sort_by, snapshot_after)
+                    pages += 1
+                    if [comparable(row) for row in sql_rows] != rows or sql_next != next_cursor:
+                        mismatches.append((origin, destination, sort_by, modes, pages))
+                        break
+                    if next_cursor is None:
+                        break
+                    # Cross over: each path continues from the other's cursor
+                    sql_after = decode_cursor(next_cursor, sort_by)
+                    snapshot_after = decode_cursor(sql_next, sort_by)
+    expect(not mismatches, f"{pages} search pages match SQL row for row, cursors included {mismatches[:3]}")
+
+    origins = sorted({origin for origin, _ in routes})
+    wrong = [origin for origin in origins if sql_destinations(conn, origin) != snapshot.destinations(origin)]
+    expect(not wrong and snapshot.destinations('Nowhere') == [] and snapshot.search_page('Nowhere', 'X', [], 'cheapest')
+           == ([], None), f"destinations from {len(origins)} origins match SQL {wrong[:3]}")
+
+
+def check_app(args, path, routes):
+    import sqlite_standin
+    import app as journey_app
+    from db_pool import ConnectionPool
+
+    flask_app = journey_app.create_app({'SESSION_BACKEND': 'memory', 'SECRET_KEY': 'snapshot-check', 'JOB_WORKERS': 0,
+                                        'SLOW_REQUEST_SECONDS': None, 'JOURNEY_SNAPSHOT_PATH': args.snapshot})
+    journey_app.db_pool = ConnectionPool(lambda: sqlite_standin.connect(path))
+    if not os.path.isdir(os.path.join(ROOT, 'templates')):
+        flask_app.template_folder = ROOT
+    client = flask_app.test_client()
+    client.get('/')  # init_worker(): maps the snapshot and starts this process's refresher
+
+    def pages():
+        journey_app.search_cache.clear()
+        bodies = []
+        for origin, destination in routes[:10]:
+            for sort_by in SORTS:
+                bodies.append(client.get('/search_results', query_string={
+                    'origin': origin, 'destination': destination, 'departure_date': '2030-05-01',
+                    'journey_type': 'return', 'sort': sort_by}).get_data())
+            bodies.append(client.get(f'/get_destinations/{origin}').get_data())
+        return bodies
+
+    hits = journey_app.journey_snapshots.stats()['hits']
+    from_snapshot = pages()
+    served = journey_app.journey_snapshots.stats()['hits'] - hits
+    store, journey_app.journey_snapshots = journey_app.journey_snapshots, None
+    from_sql = pages()
+    journey_app.journey_snapshots = store
+    expect(served == len(from_snapshot) and from_snapshot == from_sql,
+           f"{len(from_sql)} pages render identically from the snapshot ({served} snapshot lookups) and from SQL")
+    metrics = client.get('/metrics').get_data(as_text=True)
+    expect('journey_snapshot_hits_total' in metrics and 'journey_snapshot_bytes' in metrics,
+           "snapshot counters are exported at /metrics")
+
+
+def time_calls(func, calls):
+    timings = []
+    for call in calls:
+        started = time.perf_counter()
+        func(*call)
+        timings.append(time.perf_counter() - started)
+    timings.sort()
+    return timings
+
+
+def report_latency(args, path, snapshot, routes, rng):
+    import sqlite_standin
+    conn = sqlite_standin.connect(path, latency=args.latency_ms / 1000.0)
+    searches = [(origin, destination, [], rng.choice(SORTS), None)
+                for origin, destination in (rng.choice(routes) for _ in range(args.queries))]
+    origins = [(origin,) for origin, _ in (rng.choice(routes) for _ in range(args.queries))]
+    results = [
+        ('search page, SQL', time_calls(lambda *call: sql_page(conn, *call), searches)),
+        ('search page, snapshot', time_calls(snapshot.search_page, searches)),
+        ('destinations, SQL', time_calls(lambda origin: sql_destinations(conn, origin), origins)),
+        ('destinations, snapshot', time_calls(snapshot.destinations, origins)),
+    ]
+    conn.close()
+    print(f"Latency over {args.queries} lookups (simulated round trip {args.latency_ms:g} ms), microseconds:")
+    print(f"  {'':<24} {'p50':>9} {'p99':>9}")
+    for label, timings in results:
+        print(f"  {label:<24} {percentile(timings, 50) * 1e6:9.1f} {percentile(timings, 99) * 1e6:9.1f}")
+
+
+def load_in_worker(mode, path, snapshot_path, barrier, results):
+    """Runs in a forked worker: loads journeys the ``mode`` way, waits for the others, reports memory."""
+    import numpy as np
+    import sqlite_standin
+    from journey_snapshot import SNAPSHOT_SQL, JourneySnapshot
+
+    before = smaps_rollup()
+    if mode == 'rows':
+        conn = sqlite_standin.connect(path)
+        cursor = conn.cursor(dictionary=True)
+        cursor.execute(SNAPSHOT_SQL)
+        data = cursor.fetchall()
+        cursor.close()
+        conn.close()
+    else:
+        snapshot = JourneySnapshot(snapshot_path)
+        if mode == 'copy':
+            data = {name: np.array(array) for name, array in snapshot._arrays.items()}
+        else:
+            data = snapshot
+            for array in snapshot._arrays.values():
+                array.sum()  # touch every page, as queries over all routes eventually do
+    barrier.wait()
+    after = smaps_rollup()
+    private = sum(after.get(key, 0) - before.get(key, 0) for key in ('Private_Clean', 'Private_Dirty'))
+    results.put((private, after.get('Pss', 0), after.get('Pss', 0) - before.get('Pss', 0)))
+    barrier.wait()  # keep every mapping alive until all have measured
+    del data
+
+
+def report_memory(args, path):
+    if not os.path.exists('/proc/self/smaps_rollup'):
+        print("No /proc/self/smaps_rollup here; skipping the memory comparison")
+        return
+    ctx = multiprocessing.get_context('fork')
+    print(f"Memory with {args.workers} workers holding the journeys at once, median per worker (kB):")
+    print(f"  {'':<28} {'added private':>14} {'PSS':>9} {'PSS added':>10}")
+    for mode, label in (('rows', 'rows in each process'), ('copy', 'snapshot arrays copied'),
+                        ('mmap', 'snapshot mapped (shared)')):
+        barrier = ctx.Barrier(args.workers)
+        results = ctx.Queue()
+        workers = [ctx.Process(target=load_in_worker, args=(mode, path, args.snapshot, barrier, results))
+                   for _ in range(args.workers)]
+        for worker in workers:
+            worker.start()
+        reports = sorted(results.get(timeout=300) for _ in workers)
+        for worker in workers:
+            worker.join()
+        private, pss, pss_added = (sorted(values)[len(values) // 2] for values in zip(*reports))
+        print(f"  {label:<28} {private:14d} {pss:9d} {pss_added:10d}")
+
+
+def check_swap(args, path):
+    import sqlite_standin
+    from dataset_versions import bump_version
+    from journey_snapshot import JourneySnapshotStore
+
+    store = JourneySnapshotStore(args.snapshot, check_seconds=0)
+    old = store.current()
+    conn = sqlite_standin.connect(path)
+    cursor = conn.cursor()
+    cursor.execute("SELECT id, origin, destination, price FROM journeys ORDER BY id LIMIT 1")
+    journey_id, origin, destination, price = cursor.fetchone()
+    cursor.execute("UPDATE journeys SET price = price + 1000 WHERE id = %s", (journey_id,))
+    conn.commit()
+    bump_version(conn, 'journeys')
+    cursor.close()
+    conn.close()
+    expect(store.current(min_version=old.version + 1) is None, "a snapshot older than the version seen is not used")
+
+    built = []
+
+    def refresh():
+        conn = sqlite_standin.connect(path)
+        try:
+            built.append(store.refresh(conn))
+        finally:
+            conn.close()
+
+    threads = [threading.Thread(target=refresh) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    new = store.current(min_version=old.version + 1)
+    expect(built.count(True) == 1, f"four concurrent refreshes rebuilt the file once {built}")
+    expect(new is not None and new.version == old.version + 1, "current() maps the rebuilt file")
+
+    def price_in(snapshot):
+        rows, _ = snapshot.search_page(origin, destination, [], 'relevance')
+        return next(row['price'] for row in rows if row['id'] == journey_id)
+
+    expect(price_in(old) == float(price) and price_in(new) == float(price) + 1000,
+           "the snapshot mapped before the swap still answers from the old file, the new one from the new")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--cities', type=int, default=40, help="fewer cities, longer routes: ~journeys / cities² per route")
+    parser.add_argument('--journeys', type=int, default=50000)
+    parser.add_argument('--routes', type=int, default=40, help="routes walked page by page for the equivalence check")
+    parser.add_argument('--queries', type=int, default=1000)
+    parser.add_argument('--latency-ms', type=float, default=0.0, help="simulated round trip added to every query")
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--snapshot', metavar='PATH', help="snapshot file (default: a temp file; try /dev/shm)")
+    args = parser.parse_args()
+
+    import sqlite_standin
+    from journey_snapshot import JourneySnapshot, build_snapshot
+    from seed import seed
+
+    workdir = tempfile.mkdtemp()
+    path = os.path.join(workdir, 'journeys.sqlite')
+    args.snapshot = args.snapshot or os.path.join(workdir, 'journeys.snap')
+    sqlite_standin.create_schema(path)
+    conn = sqlite_standin.connect(path)
+    try:
+        seed(conn, cities=args.cities, journeys=args.journeys, users=5, bookings=0)
+        cursor = conn.cursor()
+        cursor.execute("UPDATE journeys SET co2_kg = NULL WHERE id % 7 = 0")
+        cursor.execute("UPDATE journeys SET duration_minutes = NULL WHERE id % 11 = 0")
+        conn.commit()
+        cursor.execute("SELECT DISTINCT origin, destination FROM journeys")
+        all_routes = sorted(cursor.fetchall())
+        cursor.close()
+
+        started = time.perf_counter()
+        build_snapshot(conn, args.snapshot)
+        elapsed = time.perf_counter() - started
+        snapshot = JourneySnapshot(args.snapshot)
+        print(f"Snapshot of {len(snapshot)} journeys on {len(all_routes)} routes: {snapshot.nbytes / 1024:.0f} kB,"
+              f" built in {elapsed:.2f}s")
+
+        rng = random.Random(7)
+        routes = rng.sample(all_routes, min(args.routes, len(all_routes)))
+        check_equivalence(args, conn, snapshot, routes, rng)
+    finally:
+        conn.close()
+    check_app(args, path, routes)
+    report_latency(args, path, snapshot, all_routes, rng)
+    report_memory(args, path)
+    check_swap(args, path)
+
+    print("FAILED" if failures else "All checks passed")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,92 @@
+"""Latency of the multi-leg planner on a synthetic route network.
+
+    python benchmarks/bench_planner.py --cities 500 --edges 10000 --queries 200
+
+Builds a random network of ``--edges`` journeys between ``--cities`` cities
+(several modes per city pair, like the real corridors) and times
+RouteGraph.plan() for random origin/destination pairs.
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from journey_planner import RouteGraph  # noqa: E402
+
+MODES = [
+    # mode, price per unit distance, minutes per unit distance, kg CO2 per unit distance
+    ('Electric Train', 0.20, 0.45, 0.035),
+    ('Diesel Train', 0.18, 0.55, 0.060),
+    ('Coach', 0.08, 0.90, 0.027),
+    ('Car Share', 0.12, 0.70, 0.090),
+    ('Domestic Flight', 0.45, 0.15, 0.250),
+]
+
+
+def synthetic_rows(cities, edges, seed):
+    rng = random.Random(seed)
+    coords = [(rng.uniform(0, 600), rng.uniform(0, 900)) for _ in range(cities)]
+    nearest = [sorted(range(cities), key=lambda c: abs(coords[c][0] - x) + abs(coords[c][1] - y))[1:13]
+               for x, y in coords]
+    rows = []
+    while len(rows) < edges:
+        a = rng.randrange(cities)
+        # Mostly short regional hops with the occasional long-distance link.
+        b = rng.choice(nearest[a]) if rng.random() < 0.8 else rng.randrange(cities)
+        if a == b:
+            continue
+        distance = ((coords[a][0] - coords[b][0]) ** 2 + (coords[a][1] - coords[b][1]) ** 2) ** 0.5 + 5
+        mode, price, minutes, co2 = rng.choice(MODES)
+        rows.append({
+            'id': len(rows) + 1,
+            'origin': f"City{a}",
+            'destination': f"City{b}",
+            'mode': mode,
+            'price': round(distance * price * rng.uniform(0.8, 1.3), 2),
+            'duration': None,
+            'duration_minutes': int(distance * minutes * rng.uniform(0.9, 1.2)) + 10,
+            'carbon_footprint': None,
+            'co2_kg': round(distance * co2, 3),
+        })
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--cities', type=int, default=500)
+    parser.add_argument('--edges', type=int, default=10000)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--max-legs', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    rows = synthetic_rows(args.cities, args.edges, args.seed)
+    started = time.perf_counter()
+    graph = RouteGraph(rows)
+    build_ms = (time.perf_counter() - started) * 1000
+    print(f"graph: {args.cities} cities, {len(rows)} journeys, {graph.edge_count} edges after pruning, "
+          f"built in {build_ms:.1f} ms")
+
+    rng = random.Random(args.seed + 1)
+    timings = []
+    found = 0
+    for _ in range(args.queries):
+        origin, destination = rng.sample(range(args.cities), 2)
+        started = time.perf_counter()
+        plans = graph.plan(f"City{origin}", f"City{destination}", max_legs=args.max_legs)
+        timings.append((time.perf_counter() - started) * 1000)
+        found += bool(plans)
+
+    timings.sort()
+    print(f"queries: {args.queries}, with a connection: {found}")
+    print(f"latency ms  p50={statistics.median(timings):.2f}  "
+          f"p95={timings[int(len(timings) * 0.95) - 1]:.2f}  max={timings[-1]:.2f}  "
+          f"mean={statistics.mean(timings):.2f}")
+
+
+if __name__ == '__main__':
+    main()
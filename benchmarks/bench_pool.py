@@ -0,0 +1,119 @@
+"""Requests per second with and without the connection pool.
+
+Each simulated request checks out a connection, runs the homepage query
+(``SELECT DISTINCT origin FROM journeys``) and closes the connection, which
+is exactly what the routes in app.py do.
+
+    python benchmarks/bench_pool.py --threads 16 --seconds 10
+
+Without a MySQL server, ``--simulate`` swaps in an in-process connection that
+sleeps for ``--connect-ms`` on connect and ``--query-ms`` per query, which is
+enough to show the shape of the difference.
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import mysql.connector  # noqa: E402
+
+from db_pool import ConnectionPool  # noqa: E402
+
+QUERY = "SELECT DISTINCT origin FROM journeys"
+
+
+class SimulatedConnection:
+    def __init__(self, connect_ms, query_ms):
+        time.sleep(connect_ms / 1000.0)
+        self.query_ms = query_ms
+        self.in_transaction = False
+
+    def cursor(self, **kwargs):
+        return self
+
+    def execute(self, query, params=None):
+        time.sleep(self.query_ms / 1000.0)
+
+    def fetchall(self):
+        return []
+
+    def ping(self, reconnect=False):
+        pass
+
+    def is_connected(self):
+        return True
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def run(label, get_conn, threads, seconds):
+    done = [0] * threads
+    errors = [0] * threads
+    stop_at = time.perf_counter() + seconds
+
+    def worker(idx):
+        while time.perf_counter() < stop_at:
+            try:
+                conn = get_conn()
+                cursor = conn.cursor()
+                cursor.execute(QUERY)
+                cursor.fetchall()
+                cursor.close()
+                conn.close()
+                done[idx] += 1
+            except Exception:
+                errors[idx] += 1
+
+    started = time.perf_counter()
+    pool = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    elapsed = time.perf_counter() - started
+    total = sum(done)
+    print(f"{label:<12} {total:>8} requests  {total / elapsed:>10.1f} req/s  errors={sum(errors)}")
+    return total / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--seconds', type=float, default=5.0)
+    parser.add_argument('--pool-size', type=int, default=10)
+    parser.add_argument('--simulate', action='store_true', help="use an in-process connection instead of MySQL")
+    parser.add_argument('--connect-ms', type=float, default=5.0)
+    parser.add_argument('--query-ms', type=float, default=0.5)
+    args = parser.parse_args()
+
+    if args.simulate:
+        def connect():
+            return SimulatedConnection(args.connect_ms, args.query_ms)
+    else:
+        from app import load_config
+        DB_CONFIG = load_config()['DB']
+
+        def connect():
+            return mysql.connector.connect(**DB_CONFIG)
+
+    print(f"threads={args.threads} seconds={args.seconds} pool_size={args.pool_size} "
+          f"{'simulated' if args.simulate else 'mysql'}")
+    unpooled = run('unpooled', connect, args.threads, args.seconds)
+
+    pool = ConnectionPool(connect, pool_size=args.pool_size, checkout_timeout=30)
+    pooled = run('pooled', pool.connect, args.threads, args.seconds)
+    pool.dispose()
+
+    print(f"speedup      {pooled / unpooled:.2f}x")
+    print(f"pool stats   {pool.stats()}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+"""Cost of quoting many journeys: row by row versus quotes.quote_journeys.
+
+"row by row" is the pricing the routes used to repeat inline: the student or
+promotional discount with one crc32 per row, then return doubling and the
+passenger multiply. "batch" is one quote_journeys call over every input;
+"memoised" is the same inputs again through a per-request memo, as a
+second lookup within one request sees them.
+
+    python benchmarks/bench_quotes.py --rows 10000
+
+Inputs are synthetic journey rows over 90 departure dates with mixed trip
+types, passenger counts and student fares. Both paths are checked against
+each other before timing.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+import zlib
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from journey_metrics import format_duration, journey_co2_kg, journey_duration_minutes  # noqa: E402
+from quotes import PROMO_DISCOUNT_SHARE, quote_journeys  # noqa: E402
+
+
+def quote_row_by_row(journey, departure_date, journey_type, passengers, student_discount):
+    price = float(journey['price'])
+    discounted = False
+    if student_discount:
+        price = round(price * 0.8, 2)
+        discounted = True
+    elif zlib.crc32(f"{journey['id']}:{departure_date}".encode()) / 0xFFFFFFFF < PROMO_DISCOUNT_SHARE:
+        price = round(price * 0.8, 2)
+        discounted = True
+    co2_value = journey_co2_kg(journey)
+    duration_minutes = journey_duration_minutes(journey)
+    if journey_type == 'return':
+        price *= 2
+        co2_value *= 2
+        duration_minutes *= 2
+    return {'price': price, 'total_price': round(price * passengers, 2), 'co2_kg': co2_value,
+            'duration_minutes': duration_minutes, 'travel_time': format_duration(duration_minutes),
+            'discounted': discounted}
+
+
+def synthetic_inputs(count, rng):
+    journeys = [{'id': journey_id, 'price': round(rng.uniform(5, 150), 2), 'co2_kg': round(rng.uniform(0.5, 60), 3),
+                 'duration_minutes': rng.randint(20, 600)} for journey_id in range(1, count // 4 + 2)]
+    start = date.today()
+    return [(rng.choice(journeys), (start + timedelta(days=rng.randrange(90))).isoformat(),
+             'return' if rng.random() < 0.3 else 'one_way', rng.randint(1, 4), rng.random() < 0.2)
+            for _ in range(count)]
+
+
+def best_of(func, rounds):
+    best = float('inf')
+    for _ in range(rounds):
+        started = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=10000)
+    parser.add_argument('--rounds', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    items = synthetic_inputs(args.rows, random.Random(args.seed))
+    expected = [quote_row_by_row(*item) for item in items]
+    for i, (before, after) in enumerate(zip(expected, quote_journeys(items))):
+        if abs(before['price'] - after['price']) > 1e-9 or before['total_price'] != after['total_price'] \
+                or before['discounted'] != after['discounted'] or before['duration_minutes'] != after['duration_minutes']:
+            raise SystemExit(f"quotes differ for input {i}: {before} vs {after}")
+
+    memo = {}
+    quote_journeys(items, memo)
+    timings = {
+        'row by row': best_of(lambda: [quote_row_by_row(*item) for item in items], args.rounds),
+        'batch': best_of(lambda: quote_journeys(items), args.rounds),
+        'memoised': best_of(lambda: quote_journeys(items, memo), args.rounds),
+    }
+    print(f"{len(items)} quotes, {sum(item[4] for item in items)} student, "
+          f"{sum(item[2] == 'return' for item in items)} return")
+    for label, seconds in timings.items():
+        print(f"{label:<11} {seconds * 1000:8.2f} ms  {seconds / len(items) * 1e6:6.2f} us/quote"
+              f"  ({timings['row by row'] / seconds:4.1f}x)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+"""Per-request session overhead for each SESSION_BACKEND.
+
+Each backend gets a minimal Flask app whose /select view stores a
+``selected_journey`` payload like app.py does and whose /read view reads it
+back, i.e. the booking_details/payment pattern. Times are compared with a
+view that never touches the session.
+
+    python benchmarks/bench_sessions.py --requests 2000
+
+The redis backend runs against benchmarks/resp_standin.py unless
+``--redis-url`` points at a real server.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from flask import Flask, session  # noqa: E402
+
+from resp_standin import RespStandIn  # noqa: E402
+from session_store import init_session  # noqa: E402
+
+SELECTED_JOURNEY = {
+    'id': 42, 'origin': 'London', 'destination': 'Edinburgh', 'mode': 'Electric Train',
+    'carbon_footprint': 48.6, 'journey_co2_kg': 24.3, 'price': 118.0, 'total_price': 236.0,
+    'duration': '9h 10m', 'description': 'Direct LNER service along the East Coast Main Line, via York and Newcastle.',
+    'departure_date': '2030-06-01', 'return_date': '2030-06-08', 'passengers': 2, 'journey_type': 'return',
+}
+
+
+def make_app(backend, redis_url, file_dir):
+    app = Flask(__name__)
+    app.secret_key = 'benchmark-secret'
+    app.config.update(SESSION_PERMANENT=False, SESSION_BACKEND=backend, SESSION_REDIS_URL=redis_url,
+                      SESSION_FILE_DIR=file_dir, SESSION_SWEEP_INTERVAL=0)
+    init_session(app)
+
+    @app.route('/select')
+    def select():
+        session['user_id'] = 7
+        session['username'] = 'bench'
+        session['selected_journey'] = dict(SELECTED_JOURNEY)
+        return 'ok'
+
+    @app.route('/read')
+    def read():
+        return str(session.get('selected_journey', {}).get('total_price'))
+
+    @app.route('/plain')
+    def plain():
+        return 'ok'
+
+    return app
+
+
+def time_requests(client, path, count):
+    started = time.perf_counter()
+    for _ in range(count):
+        client.get(path)
+    return (time.perf_counter() - started) / count * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--redis-url', help="real Redis server; default starts a local stand-in")
+    parser.add_argument('--backends', default='cookie,memory,redis,filesystem')
+    args = parser.parse_args()
+
+    standin = None
+    redis_url = args.redis_url
+    if not redis_url:
+        standin = RespStandIn().start()
+        redis_url = standin.url
+
+    print(f"{'backend':<12}{'write us':>10}{'read us':>10}{'overhead us':>13}{'cookie bytes':>14}")
+    with tempfile.TemporaryDirectory() as file_dir:
+        for backend in args.backends.split(','):
+            app = make_app(backend, redis_url, file_dir)
+            client = app.test_client()
+            baseline = time_requests(client, '/plain', args.requests)
+            write = time_requests(client, '/select', args.requests)
+            read = time_requests(client, '/read', args.requests)
+            cookie = client.get_cookie(app.config.get('SESSION_COOKIE_NAME', 'session'))
+            cookie_bytes = len(cookie.value) if cookie else 0
+            print(f"{backend:<12}{write:>10.1f}{read:>10.1f}{read - baseline:>13.1f}{cookie_bytes:>14}")
+
+    if standin:
+        standin.stop()
+
+
+if __name__ == '__main__':
+    main()
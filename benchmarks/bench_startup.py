@@ -0,0 +1,243 @@
+"""Startup cost: import time, time to first request, and pre-fork warm-up of the route catalog.
+
+    python benchmarks/bench_startup.py
+    python benchmarks/bench_startup.py --runs 10 --workers 8 --journeys 50000 --latency-ms 1
+
+Against a seeded SQLite stand-in file (``--latency-ms`` adds a simulated
+round trip to every query):
+
+- cold start, in ``--runs`` fresh interpreters: importing app.py,
+  create_app(), the first request (GET /get_destinations/<city>, which loads
+  the route catalog) and a second one, through Flask's test client. Importing
+  the app must not start a thread; the slowest top-level imports are listed
+  from ``python -X importtime``;
+- pre-fork: a master process creates the app and forks ``--workers`` workers,
+  as ``gunicorn --preload`` does, once as is and once with warm_up() in the
+  master. Each worker reports its first /get_destinations request and its
+  private dirty memory afterwards (``/proc/self/smaps_rollup``, Linux only).
+  Warmed workers must answer it without reloading the catalog.
+
+Exits 1 if a check fails.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+BENCH_CONFIG = {'SESSION_BACKEND': 'memory', 'SECRET_KEY': 'bench-startup', 'SLOW_REQUEST_SECONDS': None,
+                'JOB_WORKERS': 0}
+
+
+def busiest_origin(path):
+    import sqlite_standin
+    conn = sqlite_standin.connect(path)
+    cursor = conn.cursor()
+    cursor.execute("SELECT origin FROM journeys GROUP BY origin ORDER BY COUNT(*) DESC LIMIT 1")
+    (origin,) = cursor.fetchone()
+    cursor.close()
+    conn.close()
+    return origin
+
+
+def smaps_rollup():
+    """{'Pss': kB, 'Private_Dirty': kB, ...} for this process, or {} where /proc has no smaps_rollup."""
+    try:
+        with open('/proc/self/smaps_rollup') as f:
+            lines = f.readlines()[1:]
+    except OSError:
+        return {}
+    fields = {}
+    for line in lines:
+        name, value = line.split(':', 1)
+        fields[name] = int(value.split()[0])
+    return fields
+
+
+def setup_app(journey_app, args):
+    """Points the created app at the stand-in database; no connection is opened until the first checkout."""
+    import sqlite_standin
+    from db_pool import ConnectionPool
+
+    journey_app.db_pool = ConnectionPool(lambda: sqlite_standin.connect(args.sqlite, latency=args.latency_ms / 1000.0))
+    if not os.path.isdir(os.path.join(ROOT, 'templates')):
+        journey_app.app.template_folder = ROOT
+
+
+def timed_get(client, path):
+    started = time.perf_counter()
+    response = client.get(path)
+    elapsed = time.perf_counter() - started
+    if response.status_code != 200:
+        raise SystemExit(f"GET {path} returned {response.status_code}")
+    return elapsed
+
+
+def child_cold(args):
+    """One cold start in this (fresh) interpreter; prints its timings as JSON."""
+    import threading
+    import sqlite_standin  # noqa: F401  (harness, not part of the app's import time)
+
+    started = time.perf_counter()
+    import app as journey_app
+    imported = time.perf_counter()
+    threads = threading.active_count()
+    journey_app.create_app(BENCH_CONFIG)
+    created = time.perf_counter()
+    setup_app(journey_app, args)
+    client = journey_app.app.test_client()
+    first = timed_get(client, f'/get_destinations/{args.origin}')
+    second = timed_get(client, f'/get_destinations/{args.origin}')
+    print(json.dumps({'import': imported - started, 'create_app': created - imported, 'first': first,
+                      'second': second, 'threads_after_import': threads}))
+
+
+def child_prefork(args):
+    """A pre-fork master: creates the app (warming it up if asked), forks workers, prints their reports as JSON."""
+    import sqlite_standin
+    import app as journey_app
+
+    journey_app.create_app(BENCH_CONFIG)
+    warmed = args.warm and journey_app.warm_up(
+        lambda: sqlite_standin.connect(args.sqlite, latency=args.latency_ms / 1000.0))
+    setup_app(journey_app, args)
+    refreshes = journey_app.route_catalog.stats()['refreshes']
+
+    readers = []
+    for _ in range(args.workers):
+        read_fd, write_fd = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(read_fd)
+            client = journey_app.app.test_client()
+            first = timed_get(client, f'/get_destinations/{args.origin}')
+            report = {'first': first, 'reloaded': journey_app.route_catalog.stats()['refreshes'] > refreshes,
+                      'memory': smaps_rollup()}
+            with os.fdopen(write_fd, 'w') as out:
+                json.dump(report, out)
+            os._exit(0)
+        os.close(write_fd)
+        readers.append((pid, read_fd))
+    reports = []
+    for pid, read_fd in readers:
+        with os.fdopen(read_fd) as f:
+            reports.append(json.load(f))
+        os.waitpid(pid, 0)
+    print(json.dumps({'warmed': bool(warmed), 'workers': reports}))
+
+
+def run_child(args, mode, *extra):
+    command = [sys.executable, os.path.abspath(__file__), '--child', mode, '--sqlite', args.sqlite,
+               '--origin', args.origin, '--latency-ms', str(args.latency_ms), '--workers', str(args.workers), *extra]
+    started = time.perf_counter()
+    output = subprocess.run(command, check=True, capture_output=True, text=True, cwd=tempfile.gettempdir()).stdout
+    return json.loads(output.strip().splitlines()[-1]), time.perf_counter() - started
+
+
+def slowest_imports(count):
+    """The ``count`` slowest modules app.py imports directly, as (module, cumulative ms), from -X importtime."""
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import app'], capture_output=True,
+                            text=True, cwd=ROOT)
+    imports = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or '|' not in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        if not cumulative.strip().isdigit():
+            continue  # the header
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        if depth == 0:
+            if name.strip() == 'app':  # a module's line follows those of everything it imported
+                break
+            imports = []
+        elif depth == 1:
+            imports.append((name.strip(), int(cumulative) / 1000.0))
+    return sorted(imports, key=lambda item: -item[1])[:count]
+
+
+def ms(values):
+    return f"{statistics.median(values) * 1000:8.1f}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sqlite', metavar='PATH', help="SQLite stand-in database (default: a seeded temp file)")
+    parser.add_argument('--cities', type=int, default=150)
+    parser.add_argument('--journeys', type=int, default=20000)
+    parser.add_argument('--bookings', type=int, default=20000)
+    parser.add_argument('--latency-ms', type=float, default=0.0, help="simulated round trip added to every query")
+    parser.add_argument('--runs', type=int, default=5, help="cold starts to take the median of")
+    parser.add_argument('--workers', type=int, default=4, help="workers forked by the pre-fork master")
+    parser.add_argument('--child', choices=('cold', 'prefork'), help=argparse.SUPPRESS)
+    parser.add_argument('--origin', help=argparse.SUPPRESS)
+    parser.add_argument('--warm', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child == 'cold':
+        child_cold(args)
+        return 0
+    if args.child == 'prefork':
+        child_prefork(args)
+        return 0
+
+    import sqlite_standin
+    from seed import seed
+
+    if not args.sqlite or not os.path.exists(args.sqlite):
+        args.sqlite = args.sqlite or os.path.join(tempfile.mkdtemp(), 'startup.sqlite')
+        sqlite_standin.create_schema(args.sqlite)
+        conn = sqlite_standin.connect(args.sqlite)
+        try:
+            seed(conn, cities=args.cities, journeys=args.journeys, users=50, bookings=args.bookings)
+        finally:
+            conn.close()
+    args.origin = busiest_origin(args.sqlite)
+    failures = []
+
+    runs = [run_child(args, 'cold') for _ in range(args.runs)]
+    results = [result for result, _ in runs]
+    print(f"Cold start, median of {args.runs} fresh processes (ms):")
+    print(f"  process wall     {ms([wall for _, wall in runs])}")
+    print(f"  import app       {ms([r['import'] for r in results])}")
+    print(f"  create_app()     {ms([r['create_app'] for r in results])}")
+    print(f"  first request    {ms([r['first'] for r in results])}   (loads the route catalog)")
+    print(f"  second request   {ms([r['second'] for r in results])}")
+    threads = max(r['threads_after_import'] for r in results)
+    print(f"  threads after import: {threads}")
+    if threads != 1:
+        failures.append("importing the app started a thread")
+    print("Slowest imports of app.py (cumulative ms, one run):")
+    for name, cumulative in slowest_imports(8):
+        print(f"  {name:<24} {cumulative:8.1f}")
+
+    if not hasattr(os, 'fork'):
+        print("No os.fork here; skipping the pre-fork comparison")
+    else:
+        print(f"Pre-fork master with {args.workers} workers, first /get_destinations per worker:")
+        print(f"  {'master':<10} {'median ms':>10} {'max ms':>8} {'reloads':>8} {'private dirty kB':>17}")
+        for warm in (False, True):
+            result, _ = run_child(args, 'prefork', *(['--warm'] if warm else []))
+            workers = result['workers']
+            firsts = [worker['first'] for worker in workers]
+            reloads = sum(worker['reloaded'] for worker in workers)
+            dirty = [worker['memory'].get('Private_Dirty') for worker in workers]
+            dirty = f"{statistics.median(dirty):17.0f}" if None not in dirty else f"{'n/a':>17}"
+            label = 'warm_up()' if warm else 'as is'
+            print(f"  {label:<10} {ms(firsts):>10} {max(firsts) * 1000:8.1f} {reloads:8d} {dirty}")
+            if warm and (not result['warmed'] or reloads):
+                failures.append("warmed workers reloaded the route catalog")
+
+    for failure in failures:
+        print(f"FAIL {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
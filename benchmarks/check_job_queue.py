@@ -0,0 +1,265 @@
+"""Background job queue check: transactional enqueue, retries, dead jobs, lease expiry, and booking emails.
+
+    python benchmarks/check_job_queue.py
+    python benchmarks/check_job_queue.py --mail-ms 300 --bookings 40 --jobs 2000 --workers 4
+
+Runs against SQLite stand-in files:
+
+- a job enqueued in a transaction that rolls back never runs; one that
+  commits runs once and is deleted;
+- a handler that fails is retried (with backoff) until it succeeds, and one
+  that always fails ends up ``dead`` with its last error after max_attempts;
+- a job whose worker stops mid-way is taken by another worker once the lease
+  expires, and the first worker's late finish is rolled back (lost lease);
+- through Flask's test client, each payment queues a booking email that a
+  worker sends after the response; with the mailer slowed by ``--mail-ms``
+  the payment latency is reported next to the email's job latency;
+- ``--jobs`` no-op jobs are drained by ``--workers`` workers for throughput.
+
+Exits 1 if a check fails.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from loadtest import percentile  # noqa: E402
+
+CARD = {'card_number': '4111111111111111', 'expiry_date': '12/39', 'cvv': '123', 'cardholder_name': 'Job Check'}
+
+failures = []
+
+
+def expect(condition, message):
+    print(f"{'ok  ' if condition else 'FAIL'} {message}")
+    if not condition:
+        failures.append(message)
+
+
+def wait_until(condition, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+def job_rows(connect, where="1 = 1"):
+    conn = connect()
+    cursor = conn.cursor()
+    cursor.execute(f"SELECT id, kind, status, attempts, last_error FROM jobs WHERE {where} ORDER BY id")
+    rows = cursor.fetchall()
+    cursor.close()
+    conn.close()
+    return rows
+
+
+def check_queue(connect):
+    from job_queue import JobQueue, enqueue
+
+    # Enqueue follows the caller's transaction
+    conn = connect()
+    enqueue(conn, 'noop', {'n': 1})
+    conn.rollback()
+    enqueue(conn, 'noop', {'n': 2})
+    conn.commit()
+    conn.close()
+    ran = []
+    queue = JobQueue(connect, handlers={'noop': lambda conn, payload: ran.append(payload['n'])})
+    while queue.run_pending():
+        pass
+    expect(ran == [2], f"only the committed job ran {ran}")
+    expect(job_rows(connect) == [], "finished jobs are deleted")
+
+    # Handler writes commit with the job's completion
+    def write(conn, payload):
+        cursor = conn.cursor()
+        cursor.execute("INSERT INTO dataset_versions (name, version) VALUES (%s, %s)", (payload['name'], 1))
+        cursor.close()
+        if payload.get('fail'):
+            raise RuntimeError("failed after writing")
+
+    queue = JobQueue(connect, handlers={'write': write}, max_attempts=3, retry_seconds=0.05)
+    conn = connect()
+    enqueue(conn, 'write', {'name': 'job-check', 'fail': True})
+    conn.commit()
+    conn.close()
+    deadline = time.monotonic() + 5
+    while job_rows(connect, "status = 'queued'") and time.monotonic() < deadline:
+        queue.run_pending()
+        time.sleep(0.02)
+    rows = job_rows(connect)
+    expect(len(rows) == 1 and rows[0][2] == 'dead' and rows[0][3] == 3 and 'failed after writing' in rows[0][4],
+           f"an always-failing job is dead after 3 attempts {rows}")
+    stats = queue.stats()
+    expect(stats['retried'] == 2 and stats['dead'] == 1 and stats['queued'] == 0,
+           f"two retries, then dead {stats}")
+    conn = connect()
+    cursor = conn.cursor()
+    cursor.execute("SELECT COUNT(*) FROM dataset_versions WHERE name = 'job-check'")
+    expect(cursor.fetchone()[0] == 0, "the failed attempts' writes were rolled back")
+    cursor.execute("DELETE FROM jobs")
+    conn.commit()
+    cursor.close()
+    conn.close()
+
+    # Flaky handler: fails twice, then succeeds
+    attempts = []
+
+    def flaky(conn, payload):
+        attempts.append(time.monotonic())
+        if len(attempts) < 3:
+            raise OSError("mail server unavailable")
+
+    queue = JobQueue(connect, handlers={'flaky': flaky}, retry_seconds=0.1)
+    conn = connect()
+    enqueue(conn, 'flaky', {})
+    conn.commit()
+    conn.close()
+    wait_until(lambda: queue.run_pending() == 0 and not job_rows(connect), timeout=5)
+    gaps = [round(b - a, 2) for a, b in zip(attempts, attempts[1:])]
+    expect(len(attempts) == 3 and not job_rows(connect), "a flaky job succeeds on its third attempt")
+    expect(len(gaps) == 2 and gaps[0] >= 0.1 and gaps[1] >= 0.2, f"retries back off {gaps}s")
+
+    # Lease expiry: a worker claims a job and stalls; another takes it over
+    done = []
+    queue = JobQueue(connect, handlers={'lease': write}, lease_seconds=0.2)
+    other = JobQueue(connect, handlers={'lease': lambda conn, payload: done.append('other')})
+    conn = connect()
+    enqueue(conn, 'lease', {'name': 'lease-check'})
+    conn.commit()
+    conn.close()
+    stalled = connect()
+    jobs = queue._claim(stalled, 1)
+    expect(other.run_pending() == 0, "a claimed job is not handed out again during its lease")
+    time.sleep(0.25)
+    expect(other.run_pending() == 1 and done == ['other'], "after the lease expires another worker runs it")
+    queue._run(stalled, jobs[0])  # the stalled worker finally finishes
+    stalled.close()
+    conn = connect()
+    cursor = conn.cursor()
+    cursor.execute("SELECT COUNT(*) FROM dataset_versions WHERE name = 'lease-check'")
+    expect(cursor.fetchone()[0] == 0 and queue.stats()['lost_leases'] == 1,
+           "the stalled worker's late run is rolled back as a lost lease")
+    cursor.close()
+    conn.close()
+
+
+def check_booking_emails(args, path):
+    import sqlite_standin
+    import app as journey_app
+    from booking_notifications import BOOKING_EMAIL, booking_email_handler
+    from db_pool import ConnectionPool
+
+    sent = {}
+
+    class SlowMailer:
+        def send(self, to, subject, body):
+            time.sleep(args.mail_ms / 1000.0)
+            sent[subject.split()[4]] = time.perf_counter()
+
+    journey_app.db_pool = ConnectionPool(lambda: sqlite_standin.connect(path), pool_size=16)
+    journey_app.job_queue.handlers[BOOKING_EMAIL] = booking_email_handler(SlowMailer())
+    flask_app = journey_app.create_app({'SESSION_BACKEND': 'memory', 'SECRET_KEY': 'job-check',
+                                        'SLOW_REQUEST_SECONDS': None})
+    if not os.path.isdir(os.path.join(ROOT, 'templates')):
+        flask_app.template_folder = ROOT
+
+    conn = sqlite_standin.connect(path)
+    cursor = conn.cursor()
+    cursor.execute("SELECT id FROM journeys ORDER BY id LIMIT %s", (args.bookings,))
+    journey_ids = [journey_id for (journey_id,) in cursor.fetchall()]
+    cursor.close()
+    conn.close()
+
+    client = flask_app.test_client()
+    client.post('/login', data={'username': 'user1', 'password': 'password'})
+    travel_date = date.today() + timedelta(days=10)
+    payments, finished_at = [], {}
+    for journey_id in journey_ids:
+        client.post(f'/select_journey/{journey_id}', data={
+            'departure_date': travel_date.isoformat(), 'return_date': '', 'passengers': '1',
+            'journey_type': 'one_way'})
+        started = time.perf_counter()
+        response = client.post('/payment', data=CARD)
+        finished = time.perf_counter()
+        payments.append(finished - started)
+        with client.session_transaction() as sess:
+            finished_at[sess.get('last_booking_ref')] = finished
+        if not response.headers.get('Location', '').endswith('/confirmation'):
+            failures.append(f"payment for journey {journey_id} failed")
+
+    expect(wait_until(lambda: len(sent) == len(journey_ids), timeout=30 + len(journey_ids) * args.mail_ms / 1000),
+           f"every booking's email was sent by a worker ({len(sent)}/{len(journey_ids)})")
+    after = sorted(sent[ref] - finished_at[ref] for ref in sent if ref in finished_at)
+    payments.sort()
+    print(f"     payment request: p50 {percentile(payments, 50) * 1000:.1f} ms, max {payments[-1] * 1000:.1f} ms"
+          f" (mail takes {args.mail_ms:.0f} ms)")
+    if after:
+        print(f"     email sent after the response: p50 {percentile(after, 50) * 1000:.1f} ms,"
+              f" max {after[-1] * 1000:.1f} ms")
+    expect(percentile(payments, 50) < args.mail_ms / 1000.0 or args.mail_ms == 0,
+           "payment does not wait for the email")
+    metrics = client.get('/metrics').get_data(as_text=True)
+    expect('job_latency_seconds_count{kind="booking_email"}' in metrics and 'job_queue_queued ' in metrics,
+           "job latency and queue depth are exported at /metrics")
+
+
+def check_throughput(args, connect):
+    from job_queue import JobQueue, enqueue, start_workers
+
+    queue = JobQueue(connect, handlers={'noop': lambda conn, payload: None})
+    conn = connect()
+    for n in range(args.jobs):
+        enqueue(conn, 'noop', {'n': n})
+    conn.commit()
+    conn.close()
+    started = time.perf_counter()
+    workers = start_workers(queue, args.workers, poll_interval=0.05)
+    drained = wait_until(lambda: queue.stats()['completed'] >= args.jobs, timeout=120)
+    elapsed = time.perf_counter() - started
+    for worker in workers:
+        worker.stop()
+    expect(drained and queue.stats()['queued'] == 0,
+           f"{args.workers} workers drained {args.jobs} jobs in {elapsed:.2f}s ({args.jobs / elapsed:.0f} jobs/s)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--mail-ms', type=float, default=200.0, help="simulated time to send one email")
+    parser.add_argument('--bookings', type=int, default=20)
+    parser.add_argument('--jobs', type=int, default=1000, help="no-op jobs for the throughput run")
+    parser.add_argument('--workers', type=int, default=4)
+    args = parser.parse_args()
+
+    import sqlite_standin
+    from seed import seed
+
+    workdir = tempfile.mkdtemp()
+    queue_db = os.path.join(workdir, 'queue.sqlite')
+    app_db = os.path.join(workdir, 'app.sqlite')
+    for path in (queue_db, app_db):
+        sqlite_standin.create_schema(path)
+    conn = sqlite_standin.connect(app_db)
+    try:
+        seed(conn, cities=20, journeys=500, users=5, bookings=0)
+    finally:
+        conn.close()
+
+    check_queue(lambda: sqlite_standin.connect(queue_db))
+    check_throughput(args, lambda: sqlite_standin.connect(queue_db))
+    check_booking_emails(args, app_db)
+
+    print("FAILED" if failures else "All checks passed")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,228 @@
+"""Query-plan regression check: EXPLAIN every route's queries against a seeded database.
+
+    python benchmarks/check_query_plans.py --sqlite /tmp/plans.sqlite --seed-db
+    python benchmarks/check_query_plans.py --mysql          # app.DB_CONFIG, migrated and seeded
+
+Fails (exit 1) when a query falls back to a full table scan or sorts rows
+outside an index (MySQL ``type=ALL`` / ``Using filesort``; SQLite ``SCAN
+<table>`` / ``USE TEMP B-TREE FOR ORDER BY``). The few queries that read a
+whole table on purpose are marked as such and only reported.
+
+Search queries come from the same builders the routes use
+(journey_search.build_search_query, search_api.build_stream_query and
+build_batch_query), so a change to those shows up here; the remaining SQL
+mirrors the statements in app.py, user_stats.py and seat_inventory.py.
+Seed enough rows (the defaults of benchmarks/seed.py) that the optimizer
+prefers indexes where they exist; small tables are often scanned regardless.
+"""
+import argparse
+import os
+import sys
+from datetime import date, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from booking_store import (BOOKING_HISTORY_SQL, PAST_BOOKINGS_AFTER_SQL, PAST_BOOKINGS_SQL,  # noqa: E402
+                           UPCOMING_BOOKINGS_AFTER_SQL, UPCOMING_BOOKINGS_SQL)
+from fare_calendar import ROUTE_FARES_SQL  # noqa: E402
+from journey_search import SORT_COLUMNS, build_search_query  # noqa: E402
+from search_api import build_batch_query, build_stream_query  # noqa: E402
+
+FULL_SCAN = 'full_scan'    # whole table read on purpose
+INDEX_SCAN = 'index_scan'  # whole covering index read on purpose
+
+
+def sample_values(cursor):
+    """Real keys from the seeded data, so the optimizer sees realistic selectivity."""
+    cursor.execute("SELECT origin, destination, COUNT(*) AS n FROM journeys GROUP BY origin, destination"
+                   " ORDER BY n DESC LIMIT 2")
+    pairs = [(origin, destination) for origin, destination, _ in cursor.fetchall()]
+    cursor.execute("SELECT DISTINCT mode FROM journeys ORDER BY mode LIMIT 2")
+    modes = [mode for (mode,) in cursor.fetchall()]
+    cursor.execute("SELECT user_id, transaction_id, journey_id, booking_date FROM bookings ORDER BY id LIMIT 1")
+    user_id, transaction_id, journey_id, booking_date = cursor.fetchone()
+    cursor.execute("SELECT username, email FROM users WHERE id = %s", (user_id,))
+    username, email = cursor.fetchone()
+    return {
+        'origin': pairs[0][0], 'destination': pairs[0][1], 'pairs': pairs, 'modes': modes,
+        'user_id': user_id, 'transaction_id': transaction_id, 'journey_id': journey_id,
+        'day': str(booking_date)[:10], 'username': username, 'email': email,
+    }
+
+
+def route_queries(v):
+    """(label, sql, params, allowance) for every query the routes issue."""
+    day = date.fromisoformat(v['day'])
+    queries = [
+        ('route catalog: routes by popularity',
+         "SELECT j.origin, j.destination, COUNT(b.id) FROM journeys j"
+         " LEFT JOIN bookings b ON b.journey_id = j.id GROUP BY j.origin, j.destination", (), INDEX_SCAN),
+        ('planner graph load', "SELECT id, origin, destination, mode, price, duration, duration_minutes,"
+                               " carbon_footprint, co2_kg FROM journeys", (), FULL_SCAN),
+    ]
+    for sort_by in SORT_COLUMNS:
+        for modes in ((), tuple(v['modes'])):
+            suffix = f"{sort_by}{' + modes' if modes else ''}"
+            sql, params = build_search_query(v['origin'], v['destination'], list(modes), sort_by)
+            queries.append((f"search_results: {suffix}", sql, params, None))
+            sql, params = build_search_query(v['origin'], v['destination'], list(modes), sort_by, after=(1, 1))
+            queries.append((f"search_results/more: {suffix}", sql, params, None))
+        search = {'modes': [], 'sort_by': sort_by, 'limit': 50}
+        sql, params = build_stream_query(v['origin'], v['destination'], search)
+        queries.append((f"api/v1/search: {sort_by}", sql, params, None))
+        sql, params = build_batch_query(v['pairs'], search)
+        queries.append((f"api/v1/search/batch: {sort_by}", sql, params, None))
+
+    queries += [
+        ('register: existing user', "SELECT id FROM users WHERE username = %s OR email = %s",
+         (v['username'], v['email']), None),
+        ('login', "SELECT id, username, password_hash FROM users WHERE username = %s", (v['username'],), None),
+        ('select_journey', "SELECT * FROM journeys WHERE id = %s", (v['journey_id'],), None),
+        ('calendar: route fares', ROUTE_FARES_SQL, (v['origin'], v['destination']), None),
+        ('confirmation / view / modify booking',
+         "SELECT b.*, j.origin, j.destination, j.mode, j.duration, j.carbon_footprint, j.co2_kg,"
+         " j.description AS journey_description FROM bookings b JOIN journeys j ON b.journey_id = j.id"
+         " WHERE b.transaction_id = %s AND b.user_id = %s", (v['transaction_id'], v['user_id']), None),
+        ('cancel_booking',
+         "SELECT b.journey_id, b.passengers, b.booking_date, b.total_price, j.co2_kg, j.carbon_footprint"
+         " FROM bookings b JOIN journeys j ON b.journey_id = j.id"
+         " WHERE b.transaction_id = %s AND b.user_id = %s AND b.payment_status <> %s",
+         (v['transaction_id'], v['user_id'], 'cancelled'), None),
+        ('account: upcoming bookings', UPCOMING_BOOKINGS_SQL, (v['user_id'], day, 11), None),
+        ('account: upcoming bookings, next page', UPCOMING_BOOKINGS_AFTER_SQL,
+         (v['user_id'], day.isoformat(), day.isoformat(), day.isoformat(), 1, 11), None),
+        ('account: past bookings', PAST_BOOKINGS_SQL, (v['user_id'], day, 11), None),
+        ('account: past bookings, next page', PAST_BOOKINGS_AFTER_SQL,
+         (v['user_id'], day.isoformat(), day.isoformat(), day.isoformat(), 1, 11), None),
+        ('account: booking export', BOOKING_HISTORY_SQL, (v['user_id'],), None),
+        ('account: stats roll-forward',
+         "SELECT COUNT(*), SUM(COALESCE(j.co2_kg, 0)), SUM(b.total_price),"
+         " SUM(CASE WHEN j.co2_kg IS NULL THEN 1 ELSE 0 END)"
+         " FROM bookings b JOIN journeys j ON b.journey_id = j.id"
+         " WHERE b.user_id = %s AND b.booking_date >= %s AND b.booking_date < %s"
+         " AND b.payment_status <> 'cancelled'", (v['user_id'], day - timedelta(days=30), day), None),
+        ('seat inventory: booked seats for a day',
+         "SELECT COALESCE(SUM(b.passengers), 0) FROM bookings b WHERE b.journey_id = %s"
+         " AND b.booking_date >= %s AND b.booking_date < %s AND b.payment_status <> 'cancelled'",
+         (v['journey_id'], day, day + timedelta(days=1)), None),
+        ('seat holds: expired', "SELECT hold_token FROM seat_holds WHERE expires_at <= %s ORDER BY expires_at LIMIT %s",
+         (date.today(), 500), None),
+        ('job queue: due jobs',
+         "SELECT id, kind, payload, attempts, created_at FROM jobs"
+         " WHERE status = %s AND run_at <= %s ORDER BY run_at LIMIT %s", ('queued', date.today(), 1), None),
+        ('job queue: depth', "SELECT status, COUNT(*) FROM jobs GROUP BY status", (), INDEX_SCAN),
+    ]
+    return queries
+
+
+# --- Plan inspection ---
+
+def explain_mysql(conn, sql, params):
+    cursor = conn.cursor(dictionary=True)
+    try:
+        cursor.execute("EXPLAIN " + sql, params)
+        rows = cursor.fetchall()
+    finally:
+        cursor.close()
+    steps, problems = [], []
+    for row in rows:
+        extra = row.get('Extra') or ''
+        steps.append(f"{row.get('table')}: type={row.get('type')} key={row.get('key')} {extra}".strip())
+        if row.get('type') == 'ALL':
+            problems.append((FULL_SCAN, f"full table scan of {row.get('table')}"))
+        elif row.get('type') == 'index':
+            problems.append((INDEX_SCAN, f"full index scan of {row.get('table')}"))
+        if 'Using filesort' in extra:
+            problems.append(('filesort', f"filesort on {row.get('table')}"))
+    return steps, problems
+
+
+def explain_sqlite(conn, sql, params):
+    import sqlite_standin
+    cursor = conn._conn.cursor()
+    try:
+        cursor.execute("EXPLAIN QUERY PLAN " + sqlite_standin.translate(sql), tuple(params))
+        details = [row[3] for row in cursor.fetchall()]
+    finally:
+        cursor.close()
+    problems = []
+    for detail in details:
+        if detail.startswith('SCAN ') and 'COVERING INDEX' in detail:
+            problems.append((INDEX_SCAN, detail))
+        elif detail.startswith('SCAN ') and 'CONSTANT ROW' not in detail:
+            problems.append((FULL_SCAN, detail))
+        if 'TEMP B-TREE' in detail and 'ORDER BY' in detail:
+            problems.append(('filesort', detail))
+    return details, problems
+
+
+def check(conn, explain, verbose=False):
+    cursor = conn.cursor()
+    try:
+        values = sample_values(cursor)
+    finally:
+        cursor.close()
+    failures = 0
+    for label, sql, params, allowance in route_queries(values):
+        steps, problems = explain(conn, sql, params)
+        allowed = {FULL_SCAN, INDEX_SCAN} if allowance == FULL_SCAN else {allowance}
+        unexpected = [message for kind, message in problems if kind not in allowed]
+        status = 'FAIL' if unexpected else 'ok'
+        failures += bool(unexpected)
+        print(f"[{status:>4}] {label}" + (f"  ({allowance.replace('_', ' ')} allowed)" if allowance else ''))
+        for message in unexpected:
+            print(f"         {message}")
+        if verbose or unexpected:
+            for step in steps:
+                print(f"         | {step}")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument('--sqlite', metavar='PATH', help="SQLite stand-in database")
+    target.add_argument('--mysql', action='store_true', help="use app.DB_CONFIG")
+    parser.add_argument('--seed-db', action='store_true', help="recreate and seed the SQLite database first")
+    parser.add_argument('--verbose', '-v', action='store_true', help="print every plan")
+    args = parser.parse_args()
+
+    if args.mysql:
+        import mysql.connector
+        from app import load_config
+        DB_CONFIG = load_config()['DB']
+        conn = mysql.connector.connect(**DB_CONFIG)
+        cursor = conn.cursor()
+        for table in ('journeys', 'bookings', 'users'):
+            cursor.execute(f"ANALYZE TABLE {table}")  # fresh statistics for the optimizer
+            cursor.fetchall()
+        cursor.close()
+        explain = explain_mysql
+    else:
+        import sqlite_standin
+        from seed import seed
+        if args.seed_db or not os.path.exists(args.sqlite):
+            if os.path.exists(args.sqlite):
+                os.remove(args.sqlite)
+            sqlite_standin.create_schema(args.sqlite)
+            conn = sqlite_standin.connect(args.sqlite)
+            seed(conn)
+            conn._conn.execute("ANALYZE")
+            conn.close()
+        conn = sqlite_standin.connect(args.sqlite)
+        explain = explain_sqlite
+
+    try:
+        failures = check(conn, explain, args.verbose)
+    finally:
+        conn.close()
+    if failures:
+        print(f"{failures} query plan(s) regressed")
+        raise SystemExit(1)
+    print("All query plans use indexes")
+
+
+if __name__ == '__main__':
+    main()
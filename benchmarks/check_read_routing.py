@@ -0,0 +1,165 @@
+"""Read-replica routing check: reads go to replicas, a user's reads after a write go to the primary.
+
+    python benchmarks/check_read_routing.py
+    python benchmarks/check_read_routing.py --primary /tmp/primary.sqlite --replica /tmp/replica.sqlite
+
+Two SQLite stand-in files play the primary and a replica. The replica is a
+copy of the seeded primary that never receives another write, i.e. a replica
+that has fallen behind by everything written during the check. Through
+Flask's test client, a user:
+
+1. logs in and searches: both served by the replica;
+2. selects a journey and pays: the booking is written to the primary;
+3. opens /confirmation and /account: both must show the new booking, so they
+   must have been read from the primary (the replica has never seen it);
+4. once the read-your-writes window has passed, opens /account again: served
+   by the replica, without the booking. That is the stale read the window
+   exists to prevent, and shows the replica really is behind.
+
+Then a second replica whose connections fail is added: searches must still
+succeed, the broken replica must leave the rotation on its first failed
+checkout, and ReplicaSet.check() must put it back once it is reachable again.
+
+Exits 1 if any step does not behave as described.
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+from datetime import date, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+CARD = {'card_number': '4111111111111111', 'expiry_date': '12/39', 'cvv': '123', 'cardholder_name': 'Replica Check'}
+
+failures = []
+
+
+def expect(condition, message):
+    print(f"{'ok  ' if condition else 'FAIL'} {message}")
+    if not condition:
+        failures.append(message)
+
+
+def busiest_route(path):
+    import sqlite_standin
+    conn = sqlite_standin.connect(path)
+    cursor = conn.cursor()
+    cursor.execute("SELECT origin, destination, MIN(id) FROM journeys WHERE mode <> 'flight'"
+                   " GROUP BY origin, destination ORDER BY COUNT(*) DESC LIMIT 1")
+    route = cursor.fetchone()
+    cursor.close()
+    conn.close()
+    return route
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--primary', metavar='PATH', help="SQLite file for the primary (default: a temp file)")
+    parser.add_argument('--replica', metavar='PATH', help="SQLite file for the replica (default: a temp file)")
+    args = parser.parse_args()
+
+    import mysql.connector
+    import sqlite_standin
+    import app as journey_app
+    from db_pool import ConnectionPool
+    from db_replicas import ReplicaSet
+    from seed import seed
+
+    workdir = tempfile.mkdtemp()
+    primary = args.primary or os.path.join(workdir, 'primary.sqlite')
+    replica = args.replica or os.path.join(workdir, 'replica.sqlite')
+    for path in (primary, replica):
+        if os.path.exists(path):
+            os.remove(path)
+    sqlite_standin.create_schema(primary)
+    conn = sqlite_standin.connect(primary)
+    try:
+        seed(conn, cities=20, journeys=500, users=5, bookings=0)
+    finally:
+        conn.close()
+    shutil.copyfile(primary, replica)  # the replica as of now; it is never written to again
+
+    journey_app.db_pool = ConnectionPool(lambda: sqlite_standin.connect(primary))
+    replica_set = ReplicaSet([ConnectionPool(lambda: sqlite_standin.connect(replica))])
+    journey_app.replica_set = replica_set
+    flask_app = journey_app.create_app({'SESSION_BACKEND': 'memory', 'SECRET_KEY': 'replica-check'})
+    if not os.path.isdir(os.path.join(ROOT, 'templates')):
+        flask_app.template_folder = ROOT
+
+    origin, destination, journey_id = busiest_route(primary)
+    travel_date = date.today() + timedelta(days=7)
+    search = {'origin': origin, 'destination': destination, 'departure_date': travel_date.isoformat(),
+              'journey_type': 'one_way'}
+
+    def replica_reads(func):
+        """(response, checkouts from the replica pools while func ran)"""
+        before = replica_set.stats()['replica_checkouts']
+        response = func()
+        return response, replica_set.stats()['replica_checkouts'] - before
+
+    client = flask_app.test_client()
+
+    # 1. Nothing written yet: reads go to the replica
+    response, reads = replica_reads(
+        lambda: client.post('/login', data={'username': 'user1', 'password': 'password'}))
+    expect(response.status_code == 302 and reads >= 1, f"login read from the replica ({reads} replica checkouts)")
+    response, reads = replica_reads(lambda: client.get('/search_results', query_string=search))
+    expect(response.status_code == 200 and reads >= 1, f"search served by the replica ({reads} replica checkouts)")
+
+    # 2. Book: the write goes to the primary and pins this user's reads there
+    client.post(f'/select_journey/{journey_id}', data={
+        'departure_date': travel_date.isoformat(), 'return_date': '', 'passengers': '1',
+        'journey_type': 'one_way'})
+    response = client.post('/payment', data=CARD)
+    expect(response.headers.get('Location', '').endswith('/confirmation'), "payment confirmed the booking")
+    with client.session_transaction() as sess:
+        booking_ref = sess.get('last_booking_ref')
+    expect(bool(booking_ref), f"booking reference {booking_ref}")
+    booking_ref = booking_ref or 'missing'
+
+    # 3. Read-your-writes: /confirmation and /account come from the primary
+    response, reads = replica_reads(lambda: client.get('/confirmation'))
+    expect(response.status_code == 200 and booking_ref in response.get_data(as_text=True) and reads == 0,
+           f"/confirmation shows the booking, read from the primary ({reads} replica checkouts)")
+    response, reads = replica_reads(lambda: client.get('/account'))
+    expect(booking_ref in response.get_data(as_text=True) and reads == 0,
+           f"/account shows the booking, read from the primary ({reads} replica checkouts)")
+
+    # 4. Window over: reads return to the (stale) replica
+    with client.session_transaction() as sess:
+        sess['primary_until'] = 0
+    response, reads = replica_reads(lambda: client.get('/account'))
+    expect(booking_ref not in response.get_data(as_text=True) and reads == 1,
+           f"after the window /account is read from the replica, which lacks the booking ({reads} replica checkouts)")
+
+    # Failover: a second replica whose connections fail
+    broken = {'down': True}
+
+    def connect_flaky():
+        if broken['down']:
+            raise mysql.connector.errors.InterfaceError("Can't connect to MySQL server on 'replica-2'")
+        return sqlite_standin.connect(replica)
+
+    replica_set = ReplicaSet([ConnectionPool(lambda: sqlite_standin.connect(replica)), ConnectionPool(connect_flaky)])
+    journey_app.replica_set = replica_set
+    journey_app.search_cache.clear()
+    statuses = [client.get('/search_results', query_string=dict(search, sort=sort)).status_code
+                for sort in ('cheapest', 'fastest', 'lowest_co2', 'cheapest')]
+    stats = replica_set.stats()
+    expect(statuses == [200] * 4, f"searches succeed with one replica unreachable {statuses}")
+    expect(stats['checkout_failures'] == 1 and stats['in_rotation'] == 1,
+           f"unreachable replica left the rotation after one failed checkout {stats}")
+    expect(replica_set.check() == 1, "health check keeps it out while unreachable")
+    broken['down'] = False
+    expect(replica_set.check() == 2, "health check puts it back once reachable")
+
+    print("FAILED" if failures else "All checks passed")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
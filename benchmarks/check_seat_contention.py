@@ -0,0 +1,238 @@
+"""Concurrency check for seat inventory: many parallel bookings of one journey.
+
+    python benchmarks/check_seat_contention.py --buyers 300 --capacity 50
+    python benchmarks/check_seat_contention.py --flow direct --buyers 500 --capacity 120
+    python benchmarks/check_seat_contention.py --mysql --buyers 300 --capacity 50   # seeded with benchmarks/seed.py
+
+``--flow app`` (default) drives the real routes through Flask's test client:
+each buyer logs in, runs select_journey (which places the seat hold) and pays.
+``--flow direct`` skips holds and runs payment's booking transaction straight
+away (claim_hold without a token, INSERT booking, commit), which is what a
+payment whose hold had already expired does.
+
+Afterwards it checks that the seats sold plus the seats still held never
+exceed the capacity and that ``journey_inventory.seats_left`` agrees with the
+bookings, and reports throughput and latency. Exits 1 on overbooking.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from datetime import date, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+CARD = {'card_number': '4111111111111111', 'expiry_date': '12/39', 'cvv': '123', 'cardholder_name': 'Seat Check'}
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(pct / 100.0 * len(sorted_values)))]
+
+
+def prepare(connect, journey_id, travel_date, capacity):
+    """Gives the journey a fixed capacity and clears earlier runs' bookings/holds for that date."""
+    conn = connect()
+    try:
+        cursor = conn.cursor()
+        cursor.execute("UPDATE journeys SET seat_capacity = %s WHERE id = %s", (capacity, journey_id))
+        cursor.execute("DELETE FROM journey_inventory WHERE journey_id = %s AND travel_date = %s",
+                       (journey_id, travel_date))
+        cursor.execute("DELETE FROM seat_holds WHERE journey_id = %s AND travel_date = %s", (journey_id, travel_date))
+        cursor.execute("DELETE FROM bookings WHERE journey_id = %s AND booking_date >= %s AND booking_date < %s",
+                       (journey_id, travel_date, travel_date + timedelta(days=1)))
+        conn.commit()
+        cursor.close()
+    finally:
+        conn.close()
+
+
+def verify(connect, journey_id, travel_date, capacity):
+    conn = connect()
+    try:
+        cursor = conn.cursor()
+        cursor.execute(
+            "SELECT COUNT(*), COALESCE(SUM(passengers), 0) FROM bookings"
+            " WHERE journey_id = %s AND booking_date >= %s AND booking_date < %s AND payment_status <> 'cancelled'",
+            (journey_id, travel_date, travel_date + timedelta(days=1)))
+        bookings, sold = (int(v) for v in cursor.fetchone())
+        cursor.execute("SELECT COALESCE(SUM(seats), 0) FROM seat_holds WHERE journey_id = %s AND travel_date = %s",
+                       (journey_id, travel_date))
+        held = int(cursor.fetchone()[0])
+        cursor.execute("SELECT seats_left FROM journey_inventory WHERE journey_id = %s AND travel_date = %s",
+                       (journey_id, travel_date))
+        row = cursor.fetchone()
+        cursor.close()
+    finally:
+        conn.close()
+    seats_left = int(row[0]) if row else capacity
+    return {
+        'bookings': bookings,
+        'seats_sold': sold,
+        'seats_held': held,
+        'seats_left': seats_left,
+        'overbooked': sold + held > capacity,
+        'consistent': seats_left == capacity - sold - held,
+    }
+
+
+def run_app_flow(args, connect, journey_id, travel_date, usernames):
+    import app as journey_app
+    from db_pool import ConnectionPool
+
+    journey_app.db_pool = ConnectionPool(connect, pool_size=args.pool_size, checkout_timeout=60)
+    flask_app = journey_app.create_app({'SESSION_BACKEND': 'memory', 'SECRET_KEY': 'seat-check'})
+    if not os.path.isdir(os.path.join(ROOT, 'templates')):
+        flask_app.template_folder = ROOT
+
+    clients = []
+    for username in usernames:  # log everyone in first so only booking is timed
+        client = flask_app.test_client()
+        client.post('/login', data={'username': username, 'password': 'password'})
+        clients.append(client)
+
+    def buy(client):
+        response = client.post(f'/select_journey/{journey_id}', data={
+            'departure_date': travel_date.isoformat(), 'return_date': '',
+            'passengers': str(args.passengers), 'journey_type': 'one_way'})
+        if response.headers.get('Location', '').endswith('/booking_details'):
+            response = client.post('/payment', data=CARD)
+            if response.headers.get('Location', '').endswith('/confirmation'):
+                return 'booked'
+        return 'sold_out'
+
+    return clients, buy
+
+
+def run_direct_flow(args, connect, journey_id, travel_date, usernames):
+    from seat_inventory import SeatsUnavailable, claim_hold
+
+    conn = connect()
+    cursor = conn.cursor()
+    cursor.execute("SELECT id FROM users WHERE username LIKE %s ORDER BY id LIMIT %s", ('user%', len(usernames)))
+    user_ids = [user_id for (user_id,) in cursor.fetchall()]
+    cursor.execute("SELECT price FROM journeys WHERE id = %s", (journey_id,))
+    price = float(cursor.fetchone()[0])
+    cursor.close()
+    conn.close()
+
+    def buy(user_id):
+        conn = connect()
+        cursor = conn.cursor()
+        try:
+            claim_hold(conn, None, journey_id, travel_date, args.passengers)
+            cursor.execute(
+                "INSERT INTO bookings (user_id, journey_id, passengers, total_price, booking_date, payment_method,"
+                " payment_status, transaction_id) VALUES (%s, %s, %s, %s, %s, %s, %s, %s)",
+                (user_id, journey_id, args.passengers, price * args.passengers, travel_date, 'simulated-card',
+                 'completed', uuid.uuid4().hex[:8].upper()))
+            conn.commit()
+            return 'booked'
+        except SeatsUnavailable:
+            conn.rollback()
+            return 'sold_out'
+        finally:
+            cursor.close()
+            conn.close()
+
+    return user_ids, buy
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    target = parser.add_mutually_exclusive_group()
+    target.add_argument('--sqlite', metavar='PATH', help="SQLite stand-in database (default: a fresh temp file)")
+    target.add_argument('--mysql', action='store_true', help="use app.DB_CONFIG (seeded with benchmarks/seed.py)")
+    parser.add_argument('--flow', choices=('app', 'direct'), default='app')
+    parser.add_argument('--buyers', type=int, default=300)
+    parser.add_argument('--capacity', type=int, default=50)
+    parser.add_argument('--passengers', type=int, default=1, help="seats per booking")
+    parser.add_argument('--threads', type=int, default=32)
+    parser.add_argument('--pool-size', type=int, default=16)
+    parser.add_argument('--journey-id', type=int, default=1)
+    args = parser.parse_args()
+
+    if args.mysql:
+        import mysql.connector
+        from app import load_config
+        DB_CONFIG = load_config()['DB']
+
+        def connect():
+            return mysql.connector.connect(**DB_CONFIG)
+    else:
+        import sqlite_standin
+        from seed import seed
+        path = args.sqlite or os.path.join(tempfile.mkdtemp(), 'seats.sqlite')
+        if not os.path.exists(path):
+            sqlite_standin.create_schema(path)
+            conn = sqlite_standin.connect(path)
+            try:
+                seed(conn, cities=10, journeys=50, users=args.buyers, bookings=0)
+            finally:
+                conn.close()
+
+        def connect():
+            return sqlite_standin.connect(path)
+
+    travel_date = date.today() + timedelta(days=400)  # a day no seeded booking uses
+    prepare(connect, args.journey_id, travel_date, args.capacity)
+    usernames = [f"user{i}" for i in range(1, args.buyers + 1)]
+    flow = run_app_flow if args.flow == 'app' else run_direct_flow
+    buyers, buy = flow(args, connect, args.journey_id, travel_date, usernames)
+
+    outcomes = {'booked': 0, 'sold_out': 0, 'error': 0}
+    latencies = []
+    lock = threading.Lock()
+    queue = list(buyers)
+    start_gate = threading.Barrier(args.threads)
+
+    def worker():
+        start_gate.wait()
+        while True:
+            with lock:
+                if not queue:
+                    return
+                buyer = queue.pop()
+            started = time.perf_counter()
+            try:
+                outcome = buy(buyer)
+            except Exception as err:
+                print(f"booking failed: {err!r}", file=sys.stderr)
+                outcome = 'error'
+            elapsed = time.perf_counter() - started
+            with lock:
+                outcomes[outcome] += 1
+                latencies.append(elapsed)
+
+    threads = [threading.Thread(target=worker) for _ in range(args.threads)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    result = verify(connect, args.journey_id, travel_date, args.capacity)
+    latencies.sort()
+    print(f"flow={args.flow} buyers={len(buyers)} threads={args.threads} capacity={args.capacity} "
+          f"seats/booking={args.passengers}")
+    print(f"booked {outcomes['booked']}, sold out {outcomes['sold_out']}, errors {outcomes['error']}")
+    print(f"seats sold {result['seats_sold']}, held {result['seats_held']}, left {result['seats_left']} "
+          f"(inventory consistent: {result['consistent']})")
+    print(f"{len(latencies) / elapsed:.1f} bookings/s, p50 {percentile(latencies, 50) * 1000:.1f} ms, "
+          f"p95 {percentile(latencies, 95) * 1000:.1f} ms, p99 {percentile(latencies, 99) * 1000:.1f} ms")
+    expected = min(len(buyers), args.capacity // args.passengers)
+    if result['overbooked'] or not result['consistent'] or outcomes['booked'] != expected:
+        print(f"FAILED: expected {expected} bookings without overbooking")
+        raise SystemExit(1)
+    print("OK: no overbooking")
+
+
+if __name__ == '__main__':
+    main()
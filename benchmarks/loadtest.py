@@ -0,0 +1,301 @@
+"""End-to-end load test of the Flask app against MySQL or the SQLite stand-in.
+
+    # seed a stand-in database and run 8 virtual users for 30 seconds
+    python benchmarks/loadtest.py run --sqlite /tmp/bench.sqlite --seed-db --concurrency 8 --duration 30 \
+        --output results/baseline.json
+
+    # the same flows against the MySQL database in app.DB_CONFIG (already seeded with benchmarks/seed.py)
+    python benchmarks/loadtest.py run --mysql --concurrency 8 --duration 30 --output results/mysql.json
+
+    # compare two runs
+    python benchmarks/loadtest.py compare results/baseline.json results/after.json
+
+Each virtual user logs in once and then loops over a realistic flow:
+homepage, destinations lookup, a search with each sort order, then
+select_journey -> booking_details -> payment -> confirmation, and /account.
+Requests go through Flask's test client in-process, so the numbers cover
+routing, database work, post-processing and template rendering but not the
+network or the WSGI server. Latency percentiles (p50/p95/p99) and throughput
+are reported per route and written as JSON for later comparison.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import re
+import subprocess
+import sys
+import threading
+import time
+from datetime import date, datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+SORTS = ('cheapest', 'fastest', 'lowest_co2')
+CARD = {'card_number': '4111111111111111', 'expiry_date': '12/39', 'cvv': '123', 'cardholder_name': 'Load Test'}
+JOURNEY_ID_RE = re.compile(rb'/select_journey/(\d+)')
+
+
+class Recorder:
+    """Collects latencies per route label from many threads."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples = {}
+        self.errors = {}
+
+    def record(self, label, seconds, ok):
+        with self._lock:
+            self.samples.setdefault(label, []).append(seconds)
+            if not ok:
+                self.errors[label] = self.errors.get(label, 0) + 1
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = max(0, min(len(sorted_values) - 1, int(round(pct / 100.0 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+def summarise(recorder, elapsed):
+    routes = {}
+    total = 0
+    for label, values in sorted(recorder.samples.items()):
+        values = sorted(values)
+        total += len(values)
+        routes[label] = {
+            'count': len(values),
+            'errors': recorder.errors.get(label, 0),
+            'throughput_rps': round(len(values) / elapsed, 2),
+            'mean_ms': round(sum(values) / len(values) * 1000, 3),
+            'p50_ms': round(percentile(values, 50) * 1000, 3),
+            'p95_ms': round(percentile(values, 95) * 1000, 3),
+            'p99_ms': round(percentile(values, 99) * 1000, 3),
+            'max_ms': round(values[-1] * 1000, 3),
+        }
+    return routes, round(total / elapsed, 2)
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# --- Flows ---
+
+class VirtualUser:
+    def __init__(self, flask_app, recorder, username, routes, rng):
+        self.client = flask_app.test_client()
+        self.recorder = recorder
+        self.username = username
+        self.routes = routes
+        self.rng = rng
+
+    def _call(self, label, method, path, **kwargs):
+        started = time.perf_counter()
+        try:
+            response = self.client.open(path, method=method, **kwargs)
+            ok = response.status_code < 400
+        except Exception as err:  # an unhandled view error counts as a failed request
+            print(f"{label}: {err!r}", file=sys.stderr)
+            response, ok = None, False
+        self.recorder.record(label, time.perf_counter() - started, ok)
+        return response
+
+    def login(self):
+        self._call('login', 'POST', '/login', data={'username': self.username, 'password': 'password'})
+
+    def iteration(self):
+        origin, destination = self.rng.choice(self.routes)
+        departure = (date.today() + timedelta(days=self.rng.randint(1, 90))).isoformat()
+        self._call('home', 'GET', '/')
+        # What the home page's autocomplete requests while the cities are typed
+        self._call('cities_origin', 'GET', '/api/v1/cities', query_string={'q': origin[:4]})
+        self._call('cities_destination', 'GET', '/api/v1/cities',
+                   query_string={'q': destination[:4], 'origin': origin})
+
+        journey_ids = []
+        for sort in SORTS:
+            response = self._call(f'search_{sort}', 'GET', '/search_results', query_string={
+                'origin': origin, 'destination': destination, 'departure_date': departure,
+                'passengers': 1, 'journey_type': 'one_way', 'sort': sort})
+            if response is not None and not journey_ids:
+                journey_ids = JOURNEY_ID_RE.findall(response.data)
+
+        if journey_ids:
+            journey_id = int(self.rng.choice(journey_ids))
+            self._call('select_journey', 'POST', f'/select_journey/{journey_id}', data={
+                'departure_date': departure, 'return_date': '', 'passengers': '1', 'journey_type': 'one_way'})
+            self._call('booking_details', 'GET', '/booking_details')
+            self._call('payment', 'POST', '/payment', data=CARD)
+            self._call('confirmation', 'GET', '/confirmation')
+        self._call('account', 'GET', '/account')
+
+
+def load_routes(connect):
+    conn = connect()
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SELECT DISTINCT origin, destination FROM journeys")
+        routes = [tuple(row) for row in cursor.fetchall()]
+        cursor.execute("SELECT username FROM users WHERE username LIKE %s", ('user%',))
+        users = [username for (username,) in cursor.fetchall()]
+        cursor.close()
+    finally:
+        conn.close()
+    return routes, users
+
+
+def configure_app(args):
+    """Points app.py at the chosen database and an in-memory session store."""
+    import app as journey_app
+    from db_pool import ConnectionPool
+
+    if args.sqlite:
+        import sqlite_standin
+        if args.seed_db or not os.path.exists(args.sqlite):
+            from seed import seed
+            if os.path.exists(args.sqlite):
+                os.remove(args.sqlite)
+            sqlite_standin.create_schema(args.sqlite)
+            conn = sqlite_standin.connect(args.sqlite)
+            try:
+                seed(conn, args.cities, args.journeys, args.users, args.bookings)
+            finally:
+                conn.close()
+
+        def connect():
+            return sqlite_standin.connect(args.sqlite)
+    else:
+        import mysql.connector
+
+        def connect():
+            return mysql.connector.connect(**journey_app.DB_CONFIG)
+
+    journey_app.db_pool = ConnectionPool(connect, pool_size=args.pool_size, checkout_timeout=30)
+    flask_app = journey_app.create_app({'SESSION_BACKEND': 'memory', 'SECRET_KEY': 'load-test'})
+    if not os.path.isdir(os.path.join(ROOT, 'templates')):
+        flask_app.template_folder = ROOT  # templates live at the repository root in this tree
+    return flask_app, connect
+
+
+def run(args):
+    flask_app, connect = configure_app(args)
+    routes, users = load_routes(connect)
+    if not routes or not users:
+        raise SystemExit("Database has no journeys or users; seed it first (benchmarks/seed.py)")
+
+    recorder = Recorder()
+    stop_at = time.perf_counter() + args.duration + args.warmup
+    measure_from = time.perf_counter() + args.warmup
+
+    def worker(index):
+        rng = random.Random(args.seed + index)
+        user = VirtualUser(flask_app, Recorder() if args.warmup else recorder, users[index % len(users)], routes, rng)
+        user.login()
+        while time.perf_counter() < stop_at:
+            if user.recorder is not recorder and time.perf_counter() >= measure_from:
+                user.recorder = recorder
+            user.iteration()
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(args.concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - max(started, measure_from)
+
+    route_stats, total_rps = summarise(recorder, elapsed)
+    result = {
+        'meta': {
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'git_revision': git_revision(),
+            'python': platform.python_version(),
+            'backend': 'sqlite' if args.sqlite else 'mysql',
+            'concurrency': args.concurrency,
+            'duration_s': round(elapsed, 2),
+            'pool_size': args.pool_size,
+            'dataset': {'cities': args.cities, 'journeys': args.journeys, 'users': args.users,
+                        'bookings': args.bookings} if args.sqlite else None,
+        },
+        'total_throughput_rps': total_rps,
+        'routes': route_stats,
+    }
+    print_table(result)
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, 'w') as f:
+            json.dump(result, f, indent=2)
+        print(f"Wrote {args.output}")
+
+
+def print_table(result):
+    print(f"{'route':<20}{'count':>8}{'err':>6}{'rps':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for label, stats in result['routes'].items():
+        print(f"{label:<20}{stats['count']:>8}{stats['errors']:>6}{stats['throughput_rps']:>9.1f}"
+              f"{stats['p50_ms']:>10.2f}{stats['p95_ms']:>10.2f}{stats['p99_ms']:>10.2f}")
+    print(f"total throughput: {result['total_throughput_rps']} req/s")
+
+
+def compare(args):
+    with open(args.before) as f:
+        before = json.load(f)
+    with open(args.after) as f:
+        after = json.load(f)
+
+    def change(old, new):
+        return f"{(new - old) / old * 100:+.1f}%" if old else "n/a"
+
+    print(f"{'route':<20}{'p50 ms':>18}{'p95 ms':>18}{'p99 ms':>18}{'rps':>18}")
+    for label in sorted(set(before['routes']) | set(after['routes'])):
+        old, new = before['routes'].get(label), after['routes'].get(label)
+        if not old or not new:
+            print(f"{label:<20}  only in {'after' if new else 'before'}")
+            continue
+        cells = [f"{new[key]:.2f} ({change(old[key], new[key])})" for key in ('p50_ms', 'p95_ms', 'p99_ms', 'throughput_rps')]
+        print(f"{label:<20}" + ''.join(f"{cell:>18}" for cell in cells))
+    print(f"total throughput: {before['total_throughput_rps']} -> {after['total_throughput_rps']} req/s "
+          f"({change(before['total_throughput_rps'], after['total_throughput_rps'])})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = sub.add_parser('run', help="drive the app and report per-route latency")
+    target = run_parser.add_mutually_exclusive_group(required=True)
+    target.add_argument('--sqlite', metavar='PATH', help="SQLite stand-in database (created if missing)")
+    target.add_argument('--mysql', action='store_true', help="use app.DB_CONFIG")
+    run_parser.add_argument('--seed-db', action='store_true', help="recreate and seed the SQLite database first")
+    run_parser.add_argument('--cities', type=int, default=60)
+    run_parser.add_argument('--journeys', type=int, default=5000)
+    run_parser.add_argument('--users', type=int, default=500)
+    run_parser.add_argument('--bookings', type=int, default=20000)
+    run_parser.add_argument('--concurrency', type=int, default=8)
+    run_parser.add_argument('--duration', type=float, default=30.0, help="measured seconds")
+    run_parser.add_argument('--warmup', type=float, default=2.0, help="seconds before measuring starts")
+    run_parser.add_argument('--pool-size', type=int, default=10)
+    run_parser.add_argument('--seed', type=int, default=1)
+    run_parser.add_argument('--output', help="write results as JSON")
+
+    compare_parser = sub.add_parser('compare', help="compare two JSON results")
+    compare_parser.add_argument('before')
+    compare_parser.add_argument('after')
+
+    args = parser.parse_args()
+    if args.command == 'run':
+        run(args)
+    else:
+        compare(args)
+
+
+if __name__ == '__main__':
+    main()
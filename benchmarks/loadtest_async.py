@@ -0,0 +1,225 @@
+"""Concurrent-request capacity of one process: the WSGI setup versus asgi.py.
+
+    python benchmarks/loadtest_async.py --sqlite /tmp/bench.sqlite --seed-db --latency-ms 5 \
+        --concurrency 10 50 200 --duration 10
+
+Virtual users loop over the read endpoints asgi.py serves natively: the
+homepage, both autocomplete lookups, /get_destinations, a search results
+page for a random route, date and sort order, and the route's fare
+calendar. Each level of concurrency is run twice in the same process:
+
+- "wsgi": every request runs the Flask app on one of ``--threads`` threads,
+  as a threaded WSGI server (gunicorn --threads, waitress) would;
+- "asgi": every request is an ``asgi.application`` call on one event loop.
+
+Both use the SQLite stand-in with ``--latency-ms`` added to every query for
+the round trip to MySQL, and pools of ``--pool-size`` connections. Requests
+go in-process (no sockets), so the numbers compare the two serving modes,
+not HTTP servers. Caches are emptied before each run.
+
+A WSGI process has at most ``--threads`` requests in flight, whatever they
+are waiting on; under asgi.py only the database reads queue, for the pool.
+Run once with ``--pool-size`` equal to ``--threads`` and once with a larger
+pool to see both effects.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+from urllib.parse import urlencode
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from loadtest import git_revision, percentile  # noqa: E402
+
+SORTS = ('cheapest', 'fastest', 'lowest_co2')
+
+
+def iteration_requests(rng, routes):
+    """One virtual user's pass over the read endpoints, as (label, path, query) tuples."""
+    origin, destination = rng.choice(routes)
+    departure = (date.today() + timedelta(days=rng.randint(1, 90))).isoformat()
+    return [
+        ('home', '/', {}),
+        ('cities_origin', '/api/v1/cities', {'q': origin[:5]}),
+        ('cities_destination', '/api/v1/cities', {'q': destination[:5], 'origin': origin}),
+        ('destinations', f'/get_destinations/{origin}', {}),
+        ('search', '/search_results', {'origin': origin, 'destination': destination, 'departure_date': departure,
+                                       'journey_type': 'one_way', 'sort': rng.choice(SORTS)}),
+        ('calendar', '/api/v1/calendar', {'origin': origin, 'destination': destination, 'days': 30}),
+    ]
+
+
+def http_scope(path, query):
+    return {'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET', 'scheme': 'http',
+            'path': path, 'raw_path': path.encode(), 'query_string': urlencode(query).encode(), 'root_path': '',
+            'headers': [(b'host', b'loadtest')], 'server': ('loadtest', 80), 'client': ('127.0.0.1', 40000)}
+
+
+def configure(args):
+    """Points app.py and asgi.py at the stand-in database; returns (asgi module, routes)."""
+    import sqlite_standin
+    import app as journey_app
+    from async_db_pool import AsyncConnectionPool
+    from db_pool import ConnectionPool
+
+    # before asgi.py's own create_app(); queueing under overload would flood the slow log
+    flask_app = journey_app.create_app({'SESSION_BACKEND': 'memory', 'SECRET_KEY': 'load-test',
+                                        'SLOW_REQUEST_SECONDS': None})
+    import asgi
+
+    if args.seed_db or not os.path.exists(args.sqlite):
+        from seed import seed
+        if os.path.exists(args.sqlite):
+            os.remove(args.sqlite)
+        sqlite_standin.create_schema(args.sqlite)
+        conn = sqlite_standin.connect(args.sqlite)
+        try:
+            seed(conn)
+        finally:
+            conn.close()
+
+    latency = args.latency_ms / 1000.0
+    journey_app.db_pool = ConnectionPool(lambda: sqlite_standin.connect(args.sqlite, latency=latency),
+                                         pool_size=args.pool_size, checkout_timeout=60)
+    asgi.async_db_pool = AsyncConnectionPool(lambda: sqlite_standin.connect_async(args.sqlite, latency=latency),
+                                             pool_size=args.pool_size, checkout_timeout=60)
+    if not os.path.isdir(os.path.join(flask_app.root_path, 'templates')):
+        flask_app.template_folder = flask_app.root_path  # templates live at the repository root in this tree
+
+    conn = sqlite_standin.connect(args.sqlite)
+    cursor = conn.cursor()
+    cursor.execute("SELECT DISTINCT origin, destination FROM journeys")
+    routes = [tuple(row) for row in cursor.fetchall()]
+    cursor.close()
+    conn.close()
+    return asgi, routes
+
+
+def wsgi_caller(asgi, threads):
+    """An awaitable request through the Flask app on a fixed pool of threads, like a threaded WSGI server."""
+    loop = asyncio.get_running_loop()
+    executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='loadtest-wsgi')
+
+    def handle(path, query):
+        status = []
+        body = asgi.flask_app(asgi.build_environ(http_scope(path, query), b''),
+                              lambda line, headers, exc_info=None: status.append(int(line.split()[0])))
+        try:
+            for _ in body:
+                pass
+        finally:
+            if hasattr(body, 'close'):
+                body.close()
+        return status[0]
+
+    async def call(path, query):
+        return await loop.run_in_executor(executor, handle, path, query)
+
+    return call, executor.shutdown
+
+
+def asgi_caller(asgi):
+    async def call(path, query):
+        status = []
+
+        async def receive():
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+        async def send(message):
+            if message['type'] == 'http.response.start':
+                status.append(message['status'])
+
+        await asgi.application(http_scope(path, query), receive, send)
+        return status[0]
+
+    return call, lambda: None
+
+
+async def run_level(asgi, routes, mode, concurrency, args):
+    asgi.journey_app.on_journeys_changed()  # cold caches for every run
+    call, shutdown = wsgi_caller(asgi, args.threads) if mode == 'wsgi' else asgi_caller(asgi)
+    samples = []
+    errors = 0
+    stop_at = time.perf_counter() + args.warmup + args.duration
+    measure_from = time.perf_counter() + args.warmup
+
+    async def user(index):
+        nonlocal errors
+        rng = random.Random(args.seed + index)
+        while time.perf_counter() < stop_at:
+            for label, path, query in iteration_requests(rng, routes):
+                started = time.perf_counter()
+                try:
+                    ok = await call(path, query) < 400
+                except Exception as err:
+                    print(f"{mode} {label}: {err!r}", file=sys.stderr)
+                    ok = False
+                if started >= measure_from:
+                    samples.append(time.perf_counter() - started)
+                    errors += not ok
+
+    await asyncio.gather(*(user(i) for i in range(concurrency)))
+    elapsed = time.perf_counter() - measure_from
+    shutdown()
+    samples.sort()
+    return {
+        'mode': mode,
+        'concurrency': concurrency,
+        'requests': len(samples),
+        'errors': errors,
+        'throughput_rps': round(len(samples) / elapsed, 1),
+        'p50_ms': round(percentile(samples, 50) * 1000, 2),
+        'p95_ms': round(percentile(samples, 95) * 1000, 2),
+        'p99_ms': round(percentile(samples, 99) * 1000, 2),
+    }
+
+
+async def run(args):
+    asgi, routes = configure(args)
+    results = []
+    print(f"{'mode':<6}{'users':>7}{'requests':>10}{'err':>6}{'rps':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for concurrency in args.concurrency:
+        for mode in ('wsgi', 'asgi'):
+            result = await run_level(asgi, routes, mode, concurrency, args)
+            results.append(result)
+            print(f"{mode:<6}{concurrency:>7}{result['requests']:>10}{result['errors']:>6}"
+                  f"{result['throughput_rps']:>9.1f}{result['p50_ms']:>10.2f}{result['p95_ms']:>10.2f}"
+                  f"{result['p99_ms']:>10.2f}")
+    await asgi.async_db_pool.dispose()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sqlite', metavar='PATH', required=True, help="SQLite stand-in database (created if missing)")
+    parser.add_argument('--seed-db', action='store_true', help="recreate and seed the SQLite database first")
+    parser.add_argument('--latency-ms', type=float, default=5.0, help="simulated round trip added to every query")
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[10, 50, 200])
+    parser.add_argument('--duration', type=float, default=10.0, help="measured seconds per run")
+    parser.add_argument('--warmup', type=float, default=1.0, help="seconds before measuring starts")
+    parser.add_argument('--threads', type=int, default=10, help="WSGI worker threads")
+    parser.add_argument('--pool-size', type=int, default=10, help="connections in each pool")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help="write results as JSON")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, 'w') as f:
+            json.dump({'meta': {'timestamp': datetime.now().isoformat(timespec='seconds'),
+                                'git_revision': git_revision(), 'latency_ms': args.latency_ms,
+                                'threads': args.threads, 'pool_size': args.pool_size},
+                       'runs': results}, f, indent=2)
+        print(f"Wrote {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,124 @@
+"""A small in-process Redis-protocol server for exercising RedisStore locally.
+
+Supports PING, AUTH, SELECT, GET, SET (with EX/PX), DEL, EXISTS, TTL and
+FLUSHALL, which is everything the session backend uses. Not a Redis
+replacement: single dict, lazy expiry, no persistence.
+
+    python benchmarks/resp_standin.py --port 6390
+"""
+import argparse
+import socketserver
+import threading
+import time
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        server = self.server
+        while True:
+            try:
+                args = self._read_command()
+            except (ConnectionError, ValueError):
+                return
+            if args is None:
+                return
+            self.wfile.write(server.dispatch(args))
+
+    def _read_command(self):
+        line = self.rfile.readline()
+        if not line:
+            return None
+        if not line.startswith(b'*'):
+            return line.strip().split()  # inline command, e.g. from telnet
+        count = int(line[1:-2])
+        args = []
+        for _ in range(count):
+            length = int(self.rfile.readline()[1:-2])
+            args.append(self.rfile.read(length + 2)[:-2])
+        return args
+
+
+class RespStandIn(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, host='127.0.0.1', port=0):
+        super().__init__((host, port), _Handler)
+        self._lock = threading.Lock()
+        self._data = {}  # key -> (value, expires_at or None)
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"redis://{host}:{port}/0"
+
+    def start(self):
+        thread = threading.Thread(target=self.serve_forever, name='resp-standin', daemon=True)
+        thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    @staticmethod
+    def _bulk(value):
+        if value is None:
+            return b'$-1\r\n'
+        return b'$%d\r\n%s\r\n' % (len(value), value)
+
+    def _live(self, key):
+        entry = self._data.get(key)
+        if entry is not None and entry[1] is not None and entry[1] <= time.monotonic():
+            del self._data[key]
+            return None
+        return entry
+
+    def dispatch(self, args):
+        command = args[0].upper()
+        with self._lock:
+            if command == b'PING':
+                return b'+PONG\r\n'
+            if command in (b'AUTH', b'SELECT'):
+                return b'+OK\r\n'
+            if command == b'GET':
+                entry = self._live(args[1])
+                return self._bulk(entry[0] if entry else None)
+            if command == b'SET':
+                expires_at = None
+                if len(args) >= 5 and args[3].upper() == b'EX':
+                    expires_at = time.monotonic() + int(args[4])
+                elif len(args) >= 5 and args[3].upper() == b'PX':
+                    expires_at = time.monotonic() + int(args[4]) / 1000.0
+                self._data[args[1]] = (args[2], expires_at)
+                return b'+OK\r\n'
+            if command == b'DEL':
+                removed = sum(1 for key in args[1:] if self._data.pop(key, None) is not None)
+                return b':%d\r\n' % removed
+            if command == b'EXISTS':
+                return b':%d\r\n' % sum(1 for key in args[1:] if self._live(key))
+            if command == b'TTL':
+                entry = self._live(args[1])
+                if entry is None:
+                    return b':-2\r\n'
+                if entry[1] is None:
+                    return b':-1\r\n'
+                return b':%d\r\n' % int(entry[1] - time.monotonic())
+            if command == b'FLUSHALL':
+                self._data.clear()
+                return b'+OK\r\n'
+        return b"-ERR unknown command '%s'\r\n" % command
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=6390)
+    args = parser.parse_args()
+    server = RespStandIn(args.host, args.port)
+    print(f"Listening on {server.url}")
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,136 @@
+"""Synthetic dataset for benchmarks: cities, journeys, users and bookings.
+
+    python benchmarks/seed.py --sqlite /tmp/bench.sqlite --cities 60 --journeys 5000 --users 500 --bookings 20000
+    python benchmarks/seed.py --mysql --cities 60 ...      # uses DB_CONFIG from app.py; tables must exist
+
+Rows are deterministic for a given --seed, so runs are comparable. Users are
+named ``user<N>`` with password ``password``.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from journey_metrics import format_duration  # noqa: E402
+
+MODES = [
+    # mode, £ per km, minutes per km, kg CO2 per km
+    ('Electric Train', 0.18, 0.45, 0.035),
+    ('Diesel Train', 0.16, 0.55, 0.060),
+    ('Coach', 0.07, 0.90, 0.027),
+    ('Car Share', 0.11, 0.70, 0.090),
+    ('Domestic Flight', 0.40, 0.15, 0.250),
+]
+BATCH_SIZE = 1000
+PASSWORD = 'password'
+
+
+def city_names(count):
+    return [f"City{i:03d}" for i in range(count)]
+
+
+def generate_journeys(cities, count, rng):
+    coords = {city: (rng.uniform(0, 600), rng.uniform(0, 900)) for city in cities}
+    for _ in range(count):
+        origin, destination = rng.sample(cities, 2)
+        (x1, y1), (x2, y2) = coords[origin], coords[destination]
+        km = ((x1 - x2) ** 2 + (y1 - y2) ** 2) ** 0.5 + 10
+        mode, price, minutes, co2 = rng.choice(MODES)
+        duration_minutes = int(km * minutes * rng.uniform(0.9, 1.2)) + 10
+        co2_kg = round(km * co2, 3)
+        yield (origin, destination, mode, round(km * price * rng.uniform(0.8, 1.3), 2),
+               format_duration(duration_minutes), f"{co2_kg} kg CO2e",
+               f"{mode} from {origin} to {destination}", co2_kg, duration_minutes)
+
+
+def _batches(rows, size=BATCH_SIZE):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def seed(conn, cities=60, journeys=5000, users=500, bookings=20000, seed_value=42, today=None):
+    """Inserts the synthetic dataset through a mysql.connector-style connection. Returns row counts."""
+    rng = random.Random(seed_value)
+    today = today or date.today()
+    names = city_names(cities)
+    cursor = conn.cursor()
+    try:
+        for batch in _batches(generate_journeys(names, journeys, rng)):
+            cursor.executemany(
+                "INSERT INTO journeys (origin, destination, mode, price, duration, carbon_footprint, description,"
+                " co2_kg, duration_minutes) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)", batch)
+        conn.commit()
+
+        user_rows = ((f"user{i}", PASSWORD, f"user{i}@example.com") for i in range(1, users + 1))
+        for batch in _batches(user_rows):
+            cursor.executemany("INSERT INTO users (username, password_hash, email) VALUES (%s, %s, %s)", batch)
+        conn.commit()
+
+        cursor.execute("SELECT id, price FROM journeys")
+        journey_prices = cursor.fetchall()
+        cursor.execute("SELECT id FROM users")
+        user_ids = [user_id for (user_id,) in cursor.fetchall()]
+
+        def booking_rows():
+            for i in range(bookings):
+                journey_id, price = rng.choice(journey_prices)
+                passengers = rng.randint(1, 4)
+                travel_date = today + timedelta(days=rng.randint(-365, 120))
+                status = 'cancelled' if rng.random() < 0.05 else 'completed'
+                yield (rng.choice(user_ids), journey_id, passengers, round(float(price) * passengers, 2),
+                       travel_date, 'simulated-card', status, f"S{seed_value % 100:02d}{i:07d}")
+
+        for batch in _batches(booking_rows()):
+            cursor.executemany(
+                "INSERT INTO bookings (user_id, journey_id, passengers, total_price, booking_date, payment_method,"
+                " payment_status, transaction_id) VALUES (%s, %s, %s, %s, %s, %s, %s, %s)", batch)
+        conn.commit()
+    finally:
+        cursor.close()
+    return {'cities': cities, 'journeys': journeys, 'users': users, 'bookings': bookings}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument('--sqlite', metavar='PATH', help="create and seed a SQLite stand-in database")
+    target.add_argument('--mysql', action='store_true', help="seed the MySQL database in app.DB_CONFIG")
+    parser.add_argument('--cities', type=int, default=60)
+    parser.add_argument('--journeys', type=int, default=5000)
+    parser.add_argument('--users', type=int, default=500)
+    parser.add_argument('--bookings', type=int, default=20000)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    if args.sqlite:
+        import sqlite_standin
+        if os.path.exists(args.sqlite):
+            os.remove(args.sqlite)
+        sqlite_standin.create_schema(args.sqlite)
+        conn = sqlite_standin.connect(args.sqlite)
+    else:
+        import mysql.connector
+        from app import load_config
+        DB_CONFIG = load_config()['DB']
+        conn = mysql.connector.connect(**DB_CONFIG)
+
+    started = time.perf_counter()
+    try:
+        counts = seed(conn, args.cities, args.journeys, args.users, args.bookings, args.seed)
+    finally:
+        conn.close()
+    print(f"Seeded {counts} in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == '__main__':
+    main()
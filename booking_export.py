@@ -0,0 +1,54 @@
+"""CSV and JSON Lines export of a user's booking history.
+
+Rows are read from an unbuffered cursor in batches (search_api.stream_batches)
+and each batch is formatted and sent before the next is fetched, so the
+worker holds one batch whatever the size of the history.
+"""
+import csv
+import io
+
+from booking_store import BookingRecord
+from search_api import NDJSON_MIMETYPE, ndjson_line, stream_batches
+
+EXPORT_MIMETYPES = {
+    'csv': 'text/csv',
+    'jsonl': NDJSON_MIMETYPE,
+}
+
+EXPORT_FIELDS = ('transaction_id', 'booking_date', 'booked_at', 'origin', 'destination', 'mode', 'journey_type',
+                 'passengers', 'total_price', 'payment_method', 'payment_status', 'co2_kg')
+
+
+def export_row(record):
+    """A BookingRecord as a flat dict of EXPORT_FIELDS (dates as ISO text, CO2 per journey in kg)."""
+    return {
+        'transaction_id': record.transaction_id,
+        'booking_date': record.booking_date.date().isoformat() if record.booking_date else None,
+        'booked_at': record.booked_at.isoformat(' ') if record.booked_at else None,
+        'origin': record.origin,
+        'destination': record.destination,
+        'mode': record.mode,
+        'journey_type': record.journey_type,
+        'passengers': record.passengers,
+        'total_price': round(record.total_price, 2),
+        'payment_method': record.payment_method,
+        'payment_status': record.payment_status,
+        'co2_kg': None if record.carbon_footprint is None else round(record.carbon_footprint, 3),
+    }
+
+
+def export_chunks(cursor, fmt):
+    """Yields the export of an executed BOOKING_HISTORY_SQL cursor as text chunks, one per fetched batch."""
+    if fmt == 'csv':
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=EXPORT_FIELDS)
+        writer.writeheader()
+        yield buffer.getvalue()
+        for rows in stream_batches(cursor):
+            buffer.seek(0)
+            buffer.truncate()
+            writer.writerows(export_row(BookingRecord(row)) for row in rows)
+            yield buffer.getvalue()
+    else:
+        for rows in stream_batches(cursor):
+            yield ''.join(ndjson_line(export_row(BookingRecord(row))) for row in rows)
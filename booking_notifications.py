@@ -0,0 +1,79 @@
+"""Booking emails, sent by background jobs once the booking has committed.
+
+payment, cancel_booking and modify_booking enqueue a ``booking_email`` job
+(job_queue.enqueue) in their booking transaction instead of doing any of this
+on the request path. The handler reads the booking back, as it stands when
+the job runs, and mails it to the user. ``Mailer`` sends through
+``MAIL_SERVER`` over SMTP; with no server configured it prints the message,
+for development.
+"""
+import smtplib
+from email.message import EmailMessage
+
+from booking_store import get_booking
+
+BOOKING_EMAIL = 'booking_email'  # job kind; payload {'event', 'transaction_id', 'user_id'}
+
+SUBJECTS = {
+    'confirmed': "Your Green Journey booking {ref} is confirmed",
+    'modified': "Your Green Journey booking {ref} has been changed",
+    'cancelled': "Your Green Journey booking {ref} has been cancelled",
+}
+
+
+class Mailer:
+    def __init__(self, server=None, port=25, sender='bookings@greenjourney.com', timeout=10):
+        self.server = server
+        self.port = port
+        self.sender = sender
+        self.timeout = timeout
+
+    def send(self, to, subject, body):
+        message = EmailMessage()
+        message['From'] = self.sender
+        message['To'] = to
+        message['Subject'] = subject
+        message.set_content(body)
+        if not self.server:
+            print(f"Mail to {to} (no MAIL_SERVER configured): {subject}")
+            return
+        with smtplib.SMTP(self.server, self.port, timeout=self.timeout) as smtp:
+            smtp.send_message(message)
+
+
+def booking_email_body(booking, event, username):
+    trip = 'return' if booking.journey_type == 'return' else 'one way'
+    lines = [
+        f"Hello {username},",
+        "",
+        {'confirmed': "Thank you for booking with Green Journey. Your trip:",
+         'modified': "Your booking has been changed. It now reads:",
+         'cancelled': "Your booking has been cancelled and a refund is on its way. It was for:"}[event],
+        "",
+        f"  Reference:   {booking.transaction_id}",
+        f"  Journey:     {booking.origin} to {booking.destination} by {booking.mode} ({trip})",
+        f"  Departure:   {booking.booking_date:%A %d %B %Y}",
+        f"  Passengers:  {booking.passengers}",
+        f"  Total price: £{booking.total_price:.2f}",
+        f"  Est. CO2:    {booking.carbon_footprint:.2f} kg",
+        "",
+        "You can view or change your bookings from your account page.",
+    ]
+    return '\n'.join(lines) + '\n'
+
+
+def booking_email_handler(mailer):
+    """The ``booking_email`` job handler, sending through ``mailer``."""
+    def handle(conn, payload):
+        booking = get_booking(conn, payload['transaction_id'], payload['user_id'])
+        if booking is None:
+            return  # the user or booking no longer exists; nothing to tell anyone
+        cursor = conn.cursor()
+        try:
+            cursor.execute("SELECT username, email FROM users WHERE id = %s", (payload['user_id'],))
+            username, email = cursor.fetchone()
+        finally:
+            cursor.close()
+        subject = SUBJECTS[payload['event']].format(ref=booking.transaction_id)
+        mailer.send(email, subject, booking_email_body(booking, payload['event'], username))
+    return handle
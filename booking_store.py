@@ -0,0 +1,185 @@
+"""Booking lookups shared by confirmation, account, view_booking_details and modify_booking.
+
+Each query selects only the columns the booking pages render and runs as a
+server-side prepared statement. A prepared cursor is kept per pooled
+connection and statement, so MySQL parses and plans each statement once per
+connection rather than once per request; later calls only send the
+parameters (binary protocol). Rows come back as ``BookingRecord`` objects
+whose dates are already ``datetime`` values and whose ``carbon_footprint`` is
+the journey's CO2 in kg, which is what the templates format.
+
+/account pages through a user's upcoming and past bookings with keyset
+cursors on ``(booking_date, id)`` (see ``booking_page``), so a page costs the
+same however long the history is; the index on ``(user_id, booking_date)``
+already ends in the primary key.
+"""
+import base64
+import json
+from datetime import date, datetime
+
+import mysql.connector
+
+from journey_metrics import parse_carbon_footprint
+from journey_search import InvalidCursor
+
+BOOKING_COLUMNS = (
+    "b.transaction_id, b.journey_id, b.passengers, b.total_price, b.booking_date, b.booked_at,"
+    " b.payment_method, b.payment_status, j.origin, j.destination, j.mode, j.duration,"
+    " j.carbon_footprint, j.co2_kg, j.description, j.price, b.journey_type, b.id"
+)
+
+BOOKING_PAGE_SIZE = 10
+
+BOOKING_BY_REFERENCE_SQL = (
+    f"SELECT {BOOKING_COLUMNS} FROM bookings b JOIN journeys j ON b.journey_id = j.id"
+    " WHERE b.transaction_id = %s AND b.user_id = %s"
+)
+
+_USER_BOOKINGS_SQL = f"SELECT {BOOKING_COLUMNS} FROM bookings b JOIN journeys j ON b.journey_id = j.id WHERE b.user_id = %s"
+
+# Upcoming trips run soonest first, past ones latest first. The *_AFTER_SQL forms continue after a
+# cursor and seek the index from its date, which the OR alone would not let the planner do
+UPCOMING_BOOKINGS_SQL = (
+    f"{_USER_BOOKINGS_SQL} AND b.booking_date >= %s ORDER BY b.booking_date, b.id LIMIT %s"
+)
+UPCOMING_BOOKINGS_AFTER_SQL = (
+    f"{_USER_BOOKINGS_SQL} AND b.booking_date >= %s"
+    " AND (b.booking_date > %s OR (b.booking_date = %s AND b.id > %s)) ORDER BY b.booking_date, b.id LIMIT %s"
+)
+PAST_BOOKINGS_SQL = (
+    f"{_USER_BOOKINGS_SQL} AND b.booking_date < %s ORDER BY b.booking_date DESC, b.id DESC LIMIT %s"
+)
+PAST_BOOKINGS_AFTER_SQL = (
+    f"{_USER_BOOKINGS_SQL} AND b.booking_date <= %s"
+    " AND (b.booking_date < %s OR (b.booking_date = %s AND b.id < %s)) ORDER BY b.booking_date DESC, b.id DESC LIMIT %s"
+)
+
+# Whole history for the export, latest first; read through an unbuffered cursor
+BOOKING_HISTORY_SQL = f"{_USER_BOOKINGS_SQL} ORDER BY b.booking_date DESC, b.id DESC"
+
+
+def as_datetime(value):
+    """DATE, DATETIME or 'YYYY-MM-DD[ HH:MM:SS]' as a datetime (midnight for dates); None stays None."""
+    if value is None or isinstance(value, datetime):
+        return value
+    if isinstance(value, date):
+        return datetime.combine(value, datetime.min.time())
+    return datetime.fromisoformat(str(value))
+
+
+class BookingRecord:
+    """One booking joined with its journey, in the shape the booking templates read."""
+
+    __slots__ = ('transaction_id', 'journey_id', 'passengers', 'total_price', 'booking_date', 'booked_at',
+                 'payment_method', 'payment_status', 'origin', 'destination', 'mode', 'duration',
+                 'carbon_footprint', 'journey_description', 'journey_base_price', 'journey_type', 'id')
+
+    def __init__(self, row):
+        (self.transaction_id, self.journey_id, self.passengers, total_price, booking_date, booked_at,
+         self.payment_method, self.payment_status, self.origin, self.destination, self.mode, self.duration,
+         carbon_footprint, co2_kg, self.journey_description, base_price, self.journey_type, self.id) = row
+        self.total_price = float(total_price)
+        self.booking_date = as_datetime(booking_date)
+        self.booked_at = as_datetime(booked_at)
+        # CO2 in kg, from the numeric column where the backfill has reached the row
+        self.carbon_footprint = float(co2_kg) if co2_kg is not None else parse_carbon_footprint(carbon_footprint)
+        self.journey_base_price = float(base_price)
+
+    def journey_fare(self):
+        """The booked journey as a quotes input row."""
+        return {'id': self.journey_id, 'price': self.journey_base_price, 'co2_kg': self.carbon_footprint,
+                'duration': self.duration}
+
+    def __repr__(self):
+        return f"<BookingRecord {self.transaction_id} journey={self.journey_id} {self.booking_date:%Y-%m-%d}>"
+
+
+# --- Prepared statements ---
+
+_STATEMENTS_ATTR = '_booking_store_statements'  # {sql: prepared cursor}, kept on the raw connection
+
+
+def _prepared_cursor(conn, sql):
+    """The connection's prepared cursor for sql, created (and prepared on first execute) if needed."""
+    raw = getattr(conn, 'raw_connection', conn)
+    cursors = getattr(raw, _STATEMENTS_ATTR, None)
+    if cursors is None:
+        # A pooled connection serves one request at a time, so this needs no lock;
+        # the cursors are dropped with the connection when the pool recycles it
+        cursors = {}
+        setattr(raw, _STATEMENTS_ATTR, cursors)
+    cursor = cursors.get(sql)
+    if cursor is None:
+        cursor = cursors[sql] = conn.cursor(prepared=True)
+    return cursor
+
+
+def _query(conn, sql, params):
+    cursor = _prepared_cursor(conn, sql)
+    try:
+        cursor.execute(sql, params)
+        return cursor.fetchall()  # always drain, so the next request can reuse the cursor
+    except mysql.connector.Error:
+        forget_statements(conn)
+        raise
+
+
+def forget_statements(conn):
+    """Closes the connection's cached prepared cursors (after an error, or to re-prepare after DDL)."""
+    raw = getattr(conn, 'raw_connection', conn)
+    cursors = getattr(raw, _STATEMENTS_ATTR, None) or {}
+    setattr(raw, _STATEMENTS_ATTR, None)
+    for cursor in cursors.values():
+        try:
+            cursor.close()
+        except mysql.connector.Error:
+            pass
+
+
+# --- Lookups ---
+
+def get_booking(conn, transaction_id, user_id):
+    """The user's booking with that reference, or None."""
+    rows = _query(conn, BOOKING_BY_REFERENCE_SQL, (transaction_id, user_id))
+    return BookingRecord(rows[0]) if rows else None
+
+
+def booking_page(conn, user_id, today, upcoming, after=None, limit=BOOKING_PAGE_SIZE):
+    """One page of the user's upcoming (departing today or later) or past bookings.
+
+    ``after`` is a cursor from a previous page. Returns (records, next cursor or None).
+    """
+    cursor = decode_booking_cursor(after) if after else None
+    if cursor and upcoming and as_datetime(cursor[0]).date() < today:
+        cursor = None  # made on an earlier day, when that trip was still upcoming: start again from today
+    if cursor is None:
+        sql = UPCOMING_BOOKINGS_SQL if upcoming else PAST_BOOKINGS_SQL
+        params = (user_id, today, limit + 1)
+    else:
+        # A past cursor is before today, and an upcoming one from today on, so its date bounds the page alone
+        sql = UPCOMING_BOOKINGS_AFTER_SQL if upcoming else PAST_BOOKINGS_AFTER_SQL
+        booking_date, last_id = cursor
+        params = (user_id, booking_date, booking_date, booking_date, last_id, limit + 1)
+    rows = _query(conn, sql, params)
+    records = [BookingRecord(row) for row in rows[:limit]]
+    return records, (encode_booking_cursor(records[-1]) if len(rows) > limit else None)
+
+
+def encode_booking_cursor(record):
+    """Cursor pointing just after ``record`` in its list."""
+    booking_date = record.booking_date
+    # Bookings are made for a day; a bare date compares equal to the stored value in MySQL and SQLite alike
+    value = booking_date.date().isoformat() if booking_date.time() == datetime.min.time() else booking_date.isoformat(' ')
+    payload = json.dumps([value, record.id])
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_booking_cursor(token):
+    """``(booking_date text, id)`` from a cursor made by encode_booking_cursor()."""
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        value, last_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        as_datetime(value)  # rejects anything that is not a date
+        return value, int(last_id)
+    except (ValueError, TypeError, json.JSONDecodeError) as err:
+        raise InvalidCursor(f"Invalid page cursor: {token!r}") from err
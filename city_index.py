@@ -0,0 +1,146 @@
+"""In-memory city autocomplete: prefix lookup with a typo-tolerant fallback.
+
+Names are normalised (accents stripped, case-folded, punctuation to spaces)
+and every word start is kept in one sorted array, so "lon", "kings cr" and
+"cross" all find "London King's Cross" with two bisects. Matches are ranked
+by popularity (bookings on the city's routes), then name.
+
+When fewer than ``limit`` cities start with what was typed, the word starts
+that share the most trigrams with it are checked with a bounded prefix edit
+distance (1 typo up to 5 characters, 2 beyond), so "mancehster" and "lodnon"
+still find Manchester and London. Queries under 3 characters are matched by
+prefix only, and the results for prefixes of up to 3 characters are ranked
+once when the index is built.
+
+``python benchmarks/bench_autocomplete.py`` measures lookup latency.
+"""
+import heapq
+import unicodedata
+from bisect import bisect_left
+from collections import Counter
+from functools import lru_cache
+
+FUZZY_CANDIDATES = 12  # word starts (by shared trigrams) checked with edit distance
+FUZZY_PREFIX_CHARS = 12  # only the start of each word is compared with what was typed
+FUZZY_POSTINGS_BUDGET = 3000  # stop adding (ever commoner) trigrams once this many postings are counted
+SHORT_PREFIX_CHARS = 3  # prefixes up to this long match too many cities to rank per request...
+SHORT_PREFIX_RESULTS = 50  # ...so their best this many are ranked once, when the index is built
+
+
+@lru_cache(maxsize=65536)
+def normalise(name):
+    """'Bristol Temple-Meads' -> 'bristol temple meads'."""
+    decomposed = unicodedata.normalize('NFKD', name or '')
+    stripped = ''.join(ch for ch in decomposed if not unicodedata.combining(ch))
+    folded = ''.join(ch if ch.isalnum() else ' ' for ch in stripped.casefold().replace("'", ''))
+    return ' '.join(folded.split())
+
+
+@lru_cache(maxsize=65536)
+def word_starts(key):
+    """Every suffix of a normalised name that begins at a word: 'a b c' -> ('a b c', 'b c', 'c')."""
+    words = key.split()
+    return tuple(' '.join(words[i:]) for i in range(len(words)))
+
+
+def trigrams(key):
+    """Trigrams of a normalised name, padded at the front so word starts weigh more."""
+    padded = f"  {key}"
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def max_typos(query):
+    return 0 if len(query) < 3 else 1 if len(query) <= 5 else 2
+
+
+def prefix_edit_distance(query, text, limit):
+    """Edit distance between query and the closest prefix of text, or limit + 1 if it exceeds limit.
+
+    Optimal string alignment (an adjacent swap counts as one edit), computed
+    only within ``limit`` of the diagonal, which is all a bounded match needs.
+    """
+    n = len(query)
+    m = min(len(text), n + limit)
+    if n - m > limit:
+        return limit + 1
+    over = limit + 1
+    before = None
+    previous = [j if j <= limit else over for j in range(m + 1)]
+    for i in range(1, n + 1):
+        current = [over] * (m + 1)
+        if i <= limit:
+            current[0] = i
+        q = query[i - 1]
+        for j in range(max(1, i - limit), min(m, i + limit) + 1):
+            cost = q != text[j - 1]
+            best = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if cost and i > 1 and j > 1 and q == text[j - 2] and query[i - 2] == text[j - 1]:
+                best = min(best, before[j - 2] + 1)
+            current[j] = best
+        if min(current) > limit:
+            return over
+        before, previous = previous, current
+    return min(min(previous[max(0, n - limit):]), over)
+
+
+class CityIndex:
+    """Autocomplete over ``scores`` (city -> popularity; higher ranks first). Immutable once built."""
+
+    def __init__(self, scores):
+        by_name = sorted(scores)
+        self._ranked = sorted(by_name, key=scores.get, reverse=True)  # stable: ties stay alphabetical
+        self._rank = {city: i for i, city in enumerate(self._ranked)}
+        self._keys = {city: normalise(city) for city in by_name}
+        entries = sorted((start, city) for city, key in self._keys.items() for start in word_starts(key))
+        self._starts = [start for start, _ in entries]
+        self._start_cities = [city for _, city in entries]
+        self._trigrams = {}  # trigram -> positions in _starts whose first chars contain it
+        for position, start in enumerate(self._starts):
+            for gram in trigrams(start[:FUZZY_PREFIX_CHARS]):
+                self._trigrams.setdefault(gram, []).append(position)
+        short = {}
+        for start, city in entries:
+            for length in range(1, min(SHORT_PREFIX_CHARS, len(start)) + 1):
+                short.setdefault(start[:length], set()).add(city)
+        self._short = {prefix: heapq.nsmallest(SHORT_PREFIX_RESULTS, cities, key=self._rank.__getitem__)
+                       for prefix, cities in short.items()}
+
+    def __len__(self):
+        return len(self._ranked)
+
+    def complete(self, query, limit=10):
+        """Up to ``limit`` city names for what the user has typed so far, best first."""
+        q = normalise(query)
+        if not q:
+            return self._ranked[:limit]
+        if len(q) <= SHORT_PREFIX_CHARS and limit <= SHORT_PREFIX_RESULTS:
+            found = self._short.get(q, [])  # every match, unless there are more than limit anyway
+            results = found[:limit]
+        else:
+            lo = bisect_left(self._starts, q)
+            hi = bisect_left(self._starts, q + '\U0010ffff', lo)
+            found = set(self._start_cities[lo:hi])
+            results = heapq.nsmallest(limit, found, key=self._rank.__getitem__)
+        if len(results) < limit and max_typos(q):
+            results += self._fuzzy(q, limit - len(results), exclude=set(found))
+        return results
+
+    def _fuzzy(self, q, limit, exclude):
+        shared = Counter()
+        counted = 0
+        # Rarest trigrams first: they pick out candidates best, and very common ones cost the most to count
+        for postings in sorted((self._trigrams.get(gram, ()) for gram in trigrams(q)), key=len):
+            if counted and counted + len(postings) > FUZZY_POSTINGS_BUDGET:
+                break
+            shared.update(postings)
+            counted += len(postings)
+        allowed = max_typos(q)
+        best = {}
+        for position, _ in shared.most_common(FUZZY_CANDIDATES):
+            city = self._start_cities[position]
+            if city in exclude:
+                continue
+            distance = prefix_edit_distance(q, self._starts[position], allowed)
+            if distance <= allowed and distance < best.get(city, allowed + 1):
+                best[city] = distance
+        return heapq.nsmallest(limit, best, key=lambda city: (best[city], self._rank[city]))
@@ -0,0 +1,86 @@
+"""Cross-process change notification for shared reference data.
+
+Each app worker keeps in-memory copies of the journeys table (route catalog,
+planner graph, search cache). A process that rewrites journeys, such as
+import_journeys.py, calls ``bump_version(conn, 'journeys')``; every worker's
+``VersionWatcher`` notices the new number within ``poll_seconds`` and calls
+its ``on_change`` callback, instead of serving stale data until the TTLs run out.
+"""
+import threading
+import time
+
+import mysql.connector
+
+
+def bump_version(conn, name):
+    """Increments the named dataset's version and commits."""
+    cursor = conn.cursor()
+    try:
+        cursor.execute(
+            "INSERT INTO dataset_versions (name, version) VALUES (%s, 1)"
+            " ON DUPLICATE KEY UPDATE version = version + 1", (name,))
+        conn.commit()
+    finally:
+        cursor.close()
+
+
+def read_version(conn, name):
+    """Current version of the named dataset (0 if it was never bumped)."""
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT version FROM dataset_versions WHERE name = %s", (name,))
+        row = cursor.fetchone()
+        return int(row[0]) if row else 0
+    finally:
+        cursor.close()
+
+
+class VersionWatcher:
+    """Calls ``on_change()`` when the named dataset's version moves.
+
+    ``poll()`` is cheap to call on every request: it returns immediately
+    unless ``poll_seconds`` have passed, and only one thread at a time runs
+    the check. The first successful read sets the baseline without firing.
+    Database errors are logged and retried at the next interval.
+    """
+
+    def __init__(self, name, connect_func, on_change, poll_seconds=5.0):
+        self.name = name
+        self._connect_func = connect_func
+        self._on_change = on_change
+        self.poll_seconds = poll_seconds
+        self._lock = threading.Lock()
+        self._version = None
+        self._next_check = 0.0
+
+    @property
+    def version(self):
+        """The version last read, or None before the first successful poll()."""
+        return self._version
+
+    def due(self):
+        """True if the next poll() will query the database."""
+        return time.monotonic() >= self._next_check
+
+    def poll(self):
+        now = time.monotonic()
+        if now < self._next_check or not self._lock.acquire(blocking=False):
+            return False
+        try:
+            self._next_check = now + self.poll_seconds
+            conn = self._connect_func()
+            try:
+                version = read_version(conn, self.name)
+            finally:
+                conn.close()
+            changed = self._version is not None and version != self._version
+            self._version = version
+            if changed:
+                print(f"Dataset '{self.name}' changed (version {version}); refreshing cached copies")
+                self._on_change()
+            return changed
+        except mysql.connector.Error as err:
+            print(f"Error checking dataset version for '{self.name}': {err}")
+            return False
+        finally:
+            self._lock.release()
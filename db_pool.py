@@ -0,0 +1,206 @@
+"""Thread-safe database connection pool used by app.py.
+
+Opening a fresh MySQL connection per request costs more than most of the
+queries the routes run, so connections are checked out of a bounded pool
+and handed back when the route calls ``conn.close()``.
+"""
+import threading
+import time
+
+import mysql.connector
+
+
+class PoolTimeout(mysql.connector.errors.PoolError):
+    """Raised when no connection became free within the checkout timeout."""
+
+
+class PooledConnection:
+    """Wraps a raw connection so that ``close()`` returns it to the pool.
+
+    Every other attribute is forwarded to the underlying connection, so the
+    routes keep using ``cursor()``, ``commit()``, ``rollback()`` and
+    ``is_connected()`` exactly as before.
+    """
+
+    def __init__(self, pool, raw, created_at):
+        self._pool = pool
+        self._raw = raw
+        self._created_at = created_at
+        self._released = False
+
+    def __getattr__(self, name):
+        return getattr(self._raw, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    @property
+    def raw_connection(self):
+        """The underlying connection; it outlives this checkout, so per-connection caches key on it."""
+        return self._raw
+
+    def is_connected(self):
+        return not self._released and self._raw.is_connected()
+
+    def close(self):
+        if self._released:
+            return
+        self._released = True
+        self._pool._release(self._raw, self._created_at)
+
+
+class ConnectionPool:
+    """A bounded pool of connections created by ``connect_func``.
+
+    pool_size         maximum number of open connections
+    checkout_timeout  seconds to wait for a free connection before PoolTimeout
+    recycle_seconds   connections older than this are closed and reopened
+    pre_ping          ping idle connections on checkout and replace dead ones
+    """
+
+    def __init__(self, connect_func, pool_size=10, checkout_timeout=5.0,
+                 recycle_seconds=1800, pre_ping=True):
+        if pool_size < 1:
+            raise ValueError("pool_size must be at least 1")
+        self._connect_func = connect_func
+        self.pool_size = pool_size
+        self.checkout_timeout = checkout_timeout
+        self.recycle_seconds = recycle_seconds
+        self.pre_ping = pre_ping
+
+        self._cond = threading.Condition()
+        self._idle = []  # list of (raw_connection, created_at)
+        self._open = 0
+        self._in_use = 0
+        self._stats = {
+            'checkouts': 0,
+            'waits': 0,
+            'timeouts': 0,
+            'created': 0,
+            'recycled': 0,
+            'ping_failures': 0,
+            'wait_seconds': 0.0,
+        }
+
+    # --- Checkout / release ---
+
+    def connect(self):
+        """Check out a connection, waiting up to ``checkout_timeout`` seconds."""
+        deadline = time.monotonic() + self.checkout_timeout
+        waited = False
+        wait_started = None
+        with self._cond:
+            while True:
+                if self._idle:
+                    raw, created_at = self._idle.pop()
+                    break
+                if self._open < self.pool_size:
+                    raw, created_at = None, None
+                    self._open += 1
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._stats['timeouts'] += 1
+                    if wait_started is not None:
+                        self._stats['wait_seconds'] += time.monotonic() - wait_started
+                    raise PoolTimeout(
+                        f"No database connection available within {self.checkout_timeout}s "
+                        f"(pool_size={self.pool_size})")
+                if not waited:
+                    waited = True
+                    wait_started = time.monotonic()
+                    self._stats['waits'] += 1
+                self._cond.wait(remaining)
+            if wait_started is not None:
+                self._stats['wait_seconds'] += time.monotonic() - wait_started
+            self._in_use += 1
+            self._stats['checkouts'] += 1
+
+        # Network work (connect/ping) happens outside the lock.
+        try:
+            if raw is not None:
+                raw, created_at = self._validate(raw, created_at)
+            if raw is None:
+                raw = self._connect_func()
+                created_at = time.monotonic()
+                with self._cond:
+                    self._stats['created'] += 1
+        except Exception:
+            with self._cond:
+                self._open -= 1
+                self._in_use -= 1
+                self._cond.notify()
+            raise
+        return PooledConnection(self, raw, created_at)
+
+    def _validate(self, raw, created_at):
+        """Return (raw, created_at), or (None, None) if it must be replaced."""
+        if self.recycle_seconds and time.monotonic() - created_at > self.recycle_seconds:
+            self._discard(raw)
+            with self._cond:
+                self._stats['recycled'] += 1
+            return None, None
+        if self.pre_ping:
+            try:
+                raw.ping(reconnect=False)
+            except Exception:
+                self._discard(raw)
+                with self._cond:
+                    self._stats['ping_failures'] += 1
+                return None, None
+        return raw, created_at
+
+    def _release(self, raw, created_at):
+        healthy = True
+        try:
+            # A streaming cursor abandoned mid-way leaves rows on the wire;
+            # such a connection cannot be reused.
+            if getattr(raw, 'unread_result', False):
+                healthy = False
+            # Never hand the next request a half-finished transaction.
+            elif getattr(raw, 'in_transaction', False):
+                raw.rollback()
+        except Exception:
+            healthy = False
+        if not healthy:
+            self._discard(raw)
+        with self._cond:
+            self._in_use -= 1
+            if healthy:
+                self._idle.append((raw, created_at))
+            else:
+                self._open -= 1
+            self._cond.notify()
+
+    @staticmethod
+    def _discard(raw):
+        try:
+            raw.close()
+        except Exception:
+            pass
+
+    # --- Maintenance ---
+
+    def dispose(self):
+        """Close every idle connection; checked-out ones close when released."""
+        with self._cond:
+            idle, self._idle = self._idle, []
+            self._open -= len(idle)
+        for raw, _ in idle:
+            self._discard(raw)
+
+    def stats(self):
+        """Snapshot of pool usage counters."""
+        with self._cond:
+            snapshot = dict(self._stats)
+            snapshot.update({
+                'pool_size': self.pool_size,
+                'open': self._open,
+                'in_use': self._in_use,
+                'idle': len(self._idle),
+            })
+        snapshot['wait_seconds'] = round(snapshot['wait_seconds'], 6)
+        return snapshot
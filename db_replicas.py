@@ -0,0 +1,172 @@
+"""Read replicas: round-robin routing of read-only queries, with health checks.
+
+``app.get_db_connection(read_only=True)`` asks ``ReplicaSet.connect()`` for a
+connection to the next replica in rotation and falls back to the primary
+pool when none can serve. A replica leaves the rotation for
+``retry_seconds`` when a checkout from it fails, and whenever a health check
+(``ReplicaSet.check()``, run every few seconds by ``ReplicaMonitor``) finds
+it unreachable, not replicating, or further behind than ``max_lag_seconds``;
+a passing check puts it straight back.
+
+Routing a user's reads back to the primary after they write (read-your-writes)
+is up to the caller; app.py does it with ``pin_to_primary()``.
+"""
+import threading
+import time
+
+import mysql.connector
+
+from db_pool import PoolTimeout
+
+REPLICA_STATUS_SQL = "SHOW REPLICA STATUS"
+
+
+def replica_lag_seconds(conn):
+    """How far the server is behind its source in seconds: 0 if it is not a replica, None if replication is stopped."""
+    cursor = conn.cursor(dictionary=True)
+    try:
+        cursor.execute(REPLICA_STATUS_SQL)
+        rows = cursor.fetchall()
+    finally:
+        cursor.close()
+    if not rows:
+        return 0
+    lag = rows[0].get('Seconds_Behind_Source', rows[0].get('Seconds_Behind_Master'))
+    return None if lag is None else int(lag)
+
+
+class ReplicaSet:
+    """The connection pools of the read replicas and which of them are in rotation.
+
+    pools            one db_pool.ConnectionPool per replica
+    max_lag_seconds  health checks take out replicas further behind than this (None: no lag check)
+    retry_seconds    how long a replica stays out after a failed checkout or check
+    """
+
+    def __init__(self, pools, max_lag_seconds=5, retry_seconds=10):
+        self.pools = list(pools)
+        self.max_lag_seconds = max_lag_seconds
+        self.retry_seconds = retry_seconds
+        self._lock = threading.Lock()
+        self._next = 0
+        self._down_until = [0.0] * len(self.pools)
+        self._stats = {
+            'replica_checkouts': 0,
+            'primary_fallbacks': 0,
+            'checkout_failures': 0,
+            'check_failures': 0,
+        }
+
+    def __len__(self):
+        return len(self.pools)
+
+    # --- Routing ---
+
+    def candidates(self):
+        """Indexes of the replicas in rotation, starting one further along on every call."""
+        with self._lock:
+            count = len(self.pools)
+            if not count:
+                return []
+            start = self._next
+            self._next = (start + 1) % count
+            now = time.monotonic()
+            order = [(start + offset) % count for offset in range(count)]
+            return [index for index in order if self._down_until[index] <= now]
+
+    def connect(self):
+        """A connection from the next replica in rotation that can give one, or None to use the primary."""
+        for index in self.candidates():
+            try:
+                conn = self.pools[index].connect()
+            except PoolTimeout:
+                continue  # busy, not broken: try the next one
+            except mysql.connector.Error as err:
+                self.checkout_failed(index, err)
+                continue
+            self.checked_out(index)
+            return conn
+        if self.pools:
+            self.fell_back()
+        return None
+
+    def checked_out(self, index):
+        with self._lock:
+            self._stats['replica_checkouts'] += 1
+
+    def checkout_failed(self, index, err):
+        with self._lock:
+            self._stats['checkout_failures'] += 1
+        self.mark_down(index, f"checkout failed: {err}")
+
+    def fell_back(self):
+        with self._lock:
+            self._stats['primary_fallbacks'] += 1
+
+    # --- Health ---
+
+    def mark_down(self, index, reason):
+        with self._lock:
+            was_up = self._down_until[index] <= time.monotonic()
+            self._down_until[index] = time.monotonic() + self.retry_seconds
+        if was_up:
+            print(f"Replica {index} out of rotation: {reason}")
+
+    def mark_up(self, index):
+        with self._lock:
+            was_down = self._down_until[index] > time.monotonic()
+            self._down_until[index] = 0.0
+        if was_down:
+            print(f"Replica {index} back in rotation")
+
+    def check(self):
+        """Checks every replica now and updates the rotation. Returns the number in rotation."""
+        for index, pool in enumerate(self.pools):
+            try:
+                conn = pool.connect()
+                try:
+                    lag = replica_lag_seconds(conn) if self.max_lag_seconds is not None else 0
+                finally:
+                    conn.close()
+            except (PoolTimeout, mysql.connector.Error) as err:
+                problem = f"health check failed: {err}"
+            else:
+                if lag is None:
+                    problem = "replication is not running"
+                elif lag > self.max_lag_seconds:
+                    problem = f"{lag}s behind the primary (limit {self.max_lag_seconds}s)"
+                else:
+                    problem = None
+            if problem:
+                with self._lock:
+                    self._stats['check_failures'] += 1
+                self.mark_down(index, problem)
+            else:
+                self.mark_up(index)
+        return self.stats()['in_rotation']
+
+    def stats(self):
+        """Routing counters plus the number of replicas and how many are in rotation."""
+        with self._lock:
+            snapshot = dict(self._stats)
+            now = time.monotonic()
+            snapshot['replicas'] = len(self.pools)
+            snapshot['in_rotation'] = sum(until <= now for until in self._down_until)
+        return snapshot
+
+
+class ReplicaMonitor(threading.Thread):
+    """Daemon thread that runs ReplicaSet.check() every ``interval`` seconds."""
+
+    def __init__(self, replica_set, interval=5):
+        super().__init__(name='replica-monitor', daemon=True)
+        self.replica_set = replica_set
+        self.interval = interval
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            self.replica_set.check()
+
+    def stop(self):
+        self._stop_event.set()
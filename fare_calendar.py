@@ -0,0 +1,106 @@
+"""Fare and emissions calendar: the cheapest, greenest and fastest option per day for one route.
+
+A route's journeys are loaded once into NumPy arrays (``RouteFares``) and
+cached per route; a calendar for any window is then a few array operations
+over (days x journeys) instead of one search per day.
+
+The only thing that changes a journey's price from day to day is the
+promotional discount (quotes.has_promo_discount). Every (day, journey) pair
+is priced in one quotes.price_arrays call, the same rules the search page
+and booking use.
+
+CO2 and duration do not depend on the date in this data model; they are
+reported per day alongside the price so the view can show all three.
+"""
+from datetime import date, timedelta
+
+import numpy as np
+
+from journey_metrics import format_duration, journey_co2_kg, journey_duration_minutes
+from quotes import price_arrays
+
+MAX_CALENDAR_DAYS = 90
+
+CALENDAR_FIELDS = ('date', 'min_price', 'cheapest_journey_id', 'cheapest_mode', 'discounted', 'min_co2_kg',
+                   'greenest_mode', 'fastest_minutes', 'fastest_mode', 'travel_time')
+
+ROUTE_FARES_SQL = ("SELECT id, mode, price, duration, duration_minutes, carbon_footprint, co2_kg FROM journeys"
+                   " WHERE origin = %s AND destination = %s")
+
+
+class RouteFares:
+    """One route's journeys as parallel arrays (immutable once built)."""
+
+    __slots__ = ('ids', 'modes', 'prices', 'co2_kg', 'duration_minutes')
+
+    def __init__(self, rows):
+        self.ids = np.array([row['id'] for row in rows], dtype=np.int64)
+        self.modes = np.array([row['mode'] for row in rows], dtype=object)
+        self.prices = np.array([float(row['price']) for row in rows], dtype=np.float64)
+        self.co2_kg = np.array([journey_co2_kg(row) for row in rows], dtype=np.float64)
+        self.duration_minutes = np.array([journey_duration_minutes(row) for row in rows], dtype=np.int64)
+
+    def __len__(self):
+        return len(self.ids)
+
+
+def load_route_fares(cursor, origin, destination):
+    """Reads a route's journeys with a dictionary cursor."""
+    cursor.execute(ROUTE_FARES_SQL, (origin, destination))
+    return RouteFares(cursor.fetchall())
+
+
+def build_calendar(fares, start, days, promo_share, journey_type='one_way', student_discount=False, modes=()):
+    """Per-day cheapest/greenest/fastest options for ``days`` days from ``start``, as a list of dicts.
+
+    Prices follow quotes.py: the student discount applies every day when
+    requested, otherwise the day's promotional discount; return journeys
+    double price, CO2 and duration. Days with no matching journey have None values.
+    """
+    day_list = [start + timedelta(days=offset) for offset in range(days)]
+    selected = np.isin(fares.modes, list(modes)) if modes else np.ones(len(fares), dtype=bool)
+    if not selected.any():
+        return [dict.fromkeys(CALENDAR_FIELDS, None) | {'date': day} for day in day_list]
+
+    ids = fares.ids[selected]
+    mode_names = fares.modes[selected]
+    multiplier = 2 if journey_type == 'return' else 1
+    # Every (day, journey) pair as one flat batch, then back to days x journeys
+    prices, discount = price_arrays(np.tile(fares.prices[selected], days), np.tile(ids, days),
+                                    np.repeat(np.arange(days), len(ids)), [day.isoformat() for day in day_list],
+                                    journey_type == 'return', student_discount, promo_share)
+    prices = prices.reshape(days, len(ids))
+    discount = discount.reshape(days, len(ids))
+
+    cheapest = prices.argmin(axis=1)
+    min_prices = prices[np.arange(days), cheapest]
+    discounted_cheapest = discount[np.arange(days), cheapest]
+    co2 = np.broadcast_to(fares.co2_kg[selected] * multiplier, prices.shape)
+    greenest = co2.argmin(axis=1)
+    duration = np.broadcast_to(fares.duration_minutes[selected] * multiplier, prices.shape)
+    fastest = duration.argmin(axis=1)
+
+    calendar = []
+    for i, day in enumerate(day_list):
+        calendar.append({
+            'date': day,
+            'min_price': round(float(min_prices[i]), 2),
+            'cheapest_journey_id': int(ids[cheapest[i]]),
+            'cheapest_mode': mode_names[cheapest[i]],
+            'discounted': bool(discounted_cheapest[i]),
+            'min_co2_kg': round(float(co2[i, greenest[i]]), 3),
+            'greenest_mode': mode_names[greenest[i]],
+            'fastest_minutes': int(duration[i, fastest[i]]),
+            'fastest_mode': mode_names[fastest[i]],
+            'travel_time': format_duration(duration[i, fastest[i]]),
+        })
+    return calendar
+
+
+def parse_window(start, days, today=None):
+    """(start date, days) from request strings; start defaults to today. Raises ValueError."""
+    start = date.fromisoformat(start) if start else (today or date.today())
+    days = int(days)
+    if not 1 <= days <= MAX_CALENDAR_DAYS:
+        raise ValueError(f"days must be between 1 and {MAX_CALENDAR_DAYS}")
+    return start, days
@@ -0,0 +1,324 @@
+"""Bulk journey importer for operator timetable feeds.
+
+    python import_journeys.py feeds/coaches.csv --source megacoach
+    python import_journeys.py feeds/rail.jsonl.gz --source rail --batch-size 2000
+    zcat feed.csv.gz | python import_journeys.py - --format csv --source rail
+    python import_journeys.py feed.csv --source rail --dry-run       # validate only
+
+Rows are read lazily (CSV with a header row, or one JSON object per line;
+``.gz`` files are decompressed on the fly), validated and normalised one at a
+time, and written in batches with ``executemany``, which mysql.connector
+sends as a single multi-row INSERT per batch. Each batch is committed on its
+own, so a large feed never holds one long transaction.
+
+Rows are upserted by the natural key ``(source, external_ref)`` added in
+migration 0003: ``external_ref`` comes from the feed's ``external_ref``/``id``
+column, or is ``origin|destination|mode`` when the feed has none. Re-running
+a feed therefore refreshes prices and times in place instead of duplicating
+journeys.
+
+Accepted columns (aliases in brackets):
+
+    origin, destination, mode                      required
+    price [fare]                                   "12.50", "£12.50", "GBP 12.50"
+    duration [duration_minutes]                    "1h 30m", "90", "90 min", "1:30", "PT1H30M"
+    carbon_footprint [co2_kg, co2]                 "12.3", "12.3 kg CO2e", "850 g", "0.2 t"
+    description, external_ref [id]                 optional
+
+Invalid rows are skipped and reported with their line number. When the
+import wrote anything, the ``journeys`` dataset version is bumped so running
+app workers drop their cached routes and search results.
+"""
+import argparse
+import csv
+import gzip
+import io
+import json
+import math
+import os
+import re
+import sys
+import time
+from decimal import Decimal
+
+import mysql.connector
+
+from dataset_versions import bump_version
+from journey_metrics import format_duration
+
+DEFAULT_BATCH_SIZE = 1000
+MAX_REPORTED_ERRORS = 20
+MAX_DURATION_MINUTES = 65535  # journeys.duration_minutes is SMALLINT UNSIGNED
+FIELD_ALIASES = {
+    'fare': 'price',
+    'duration_minutes': 'duration',
+    'co2_kg': 'carbon_footprint',
+    'co2': 'carbon_footprint',
+    'id': 'external_ref',
+}
+UPSERT_SQL = (
+    "INSERT INTO journeys (origin, destination, mode, price, duration, carbon_footprint, description,"
+    " co2_kg, duration_minutes, source, external_ref)"
+    " VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)"
+    " ON DUPLICATE KEY UPDATE origin = VALUES(origin), destination = VALUES(destination),"
+    " mode = VALUES(mode), price = VALUES(price), duration = VALUES(duration),"
+    " carbon_footprint = VALUES(carbon_footprint), description = VALUES(description),"
+    " co2_kg = VALUES(co2_kg), duration_minutes = VALUES(duration_minutes)")
+
+_NUMBER_RE = re.compile(r'\d+(?:\.\d+)?')
+_CLOCK_RE = re.compile(r'^(\d+):([0-5]\d)$')
+_ISO_DURATION_RE = re.compile(r'^PT(?:(\d+)H)?(?:(\d+)M)?$', re.I)
+_HOURS_RE = re.compile(r'(\d+(?:\.\d+)?)\s*(?:h|hr|hrs|hour|hours)\b', re.I)
+_MINUTES_RE = re.compile(r'(\d+)\s*(?:m|min|mins|minute|minutes)\b', re.I)
+_CO2_RE = re.compile(r'^(\d+(?:\.\d+)?)\s*(kg|g|t)?\b', re.I)
+_CO2_SCALE = {'kg': Decimal(1), 'g': Decimal('0.001'), 't': Decimal(1000)}
+
+
+class RowError(ValueError):
+    """A feed row that cannot be imported."""
+
+
+# --- Reading ---
+
+def open_feed(path):
+    """Text stream for a feed path; '-' is stdin and '.gz' files are decompressed."""
+    if path == '-':
+        return io.TextIOWrapper(sys.stdin.buffer, encoding='utf-8-sig', newline='')
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rt', encoding='utf-8-sig', newline='')
+    return open(path, encoding='utf-8-sig', newline='')
+
+
+def feed_format(path, requested=None):
+    if requested:
+        return requested
+    name = path[:-3] if path.endswith('.gz') else path
+    return 'jsonl' if name.endswith(('.jsonl', '.ndjson', '.json')) else 'csv'
+
+
+def read_csv(stream):
+    """Yields (line_number, row dict) from a CSV stream with a header row."""
+    reader = csv.DictReader(stream)
+    for row in reader:
+        yield reader.line_num, row
+
+
+def read_jsonl(stream):
+    """Yields (line_number, row dict) from a JSON Lines stream; bad JSON becomes a RowError."""
+    for line_number, line in enumerate(stream, 1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as err:
+            yield line_number, RowError(f"invalid JSON: {err}")
+            continue
+        yield line_number, row if isinstance(row, dict) else RowError("expected a JSON object")
+
+
+# --- Validation / normalisation ---
+
+def _text(value):
+    return ' '.join(str(value).split()) if value is not None else ''
+
+
+def _is_number(value, what):
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        return False
+    if not math.isfinite(value):
+        raise RowError(f"invalid {what} {value!r}")
+    return True
+
+
+def parse_price(value):
+    if _is_number(value, 'price'):
+        price = Decimal(str(value))
+    else:
+        text = _text(value).replace(',', '')
+        if text.startswith('-'):
+            raise RowError(f"negative price {value!r}")
+        match = _NUMBER_RE.search(text)
+        if not match:
+            raise RowError(f"invalid price {value!r}")
+        price = Decimal(match.group())
+    if price < 0:
+        raise RowError(f"negative price {value!r}")
+    return price.quantize(Decimal('0.01'))
+
+
+def parse_duration(value):
+    """Minutes from a number of minutes, "1h 30m", "90 min", "1:30" or ISO 8601 "PT1H30M"."""
+    if _is_number(value, 'duration'):
+        minutes = int(round(value))
+    else:
+        text = _text(value)
+        if text.isdigit():
+            minutes = int(text)
+        elif _CLOCK_RE.match(text):
+            hours, mins = _CLOCK_RE.match(text).groups()
+            minutes = int(hours) * 60 + int(mins)
+        elif _ISO_DURATION_RE.match(text) and text.upper() != 'PT':
+            hours, mins = _ISO_DURATION_RE.match(text).groups()
+            minutes = int(hours or 0) * 60 + int(mins or 0)
+        else:
+            hours = _HOURS_RE.search(text)
+            mins = _MINUTES_RE.search(text)
+            if not hours and not mins:
+                raise RowError(f"invalid duration {value!r}")
+            minutes = int(round(float(hours.group(1)) * 60)) if hours else 0
+            minutes += int(mins.group(1)) if mins else 0
+    if not 0 < minutes <= MAX_DURATION_MINUTES:
+        raise RowError(f"duration out of range {value!r}")
+    return minutes
+
+
+def parse_co2_kg(value):
+    """kg of CO2 from a number (kg) or text such as "12.3 kg CO2e", "850 g" or "0.2 t"."""
+    if _is_number(value, 'carbon footprint'):
+        co2 = Decimal(str(value))
+    else:
+        match = _CO2_RE.match(_text(value))
+        if not match:
+            raise RowError(f"invalid carbon footprint {value!r}")
+        co2 = Decimal(match.group(1)) * _CO2_SCALE[(match.group(2) or 'kg').lower()]
+    if co2 < 0:
+        raise RowError(f"negative carbon footprint {value!r}")
+    return co2.quantize(Decimal('0.001'))
+
+
+def normalise_row(raw, source):
+    """Validates one feed row and returns the tuple UPSERT_SQL expects. Raises RowError."""
+    row = {}
+    for key, value in raw.items():
+        if key is None:
+            continue  # extra CSV cells without a header
+        key = key.strip().lower()
+        row[FIELD_ALIASES.get(key, key)] = value
+
+    origin, destination, mode = _text(row.get('origin')), _text(row.get('destination')), _text(row.get('mode'))
+    for field, value in (('origin', origin), ('destination', destination), ('mode', mode)):
+        if not value:
+            raise RowError(f"missing {field}")
+    if origin.lower() == destination.lower():
+        raise RowError("origin and destination are the same")
+    for field in ('price', 'duration', 'carbon_footprint'):
+        if row.get(field) in (None, ''):
+            raise RowError(f"missing {field}")
+
+    price = parse_price(row['price'])
+    minutes = parse_duration(row['duration'])
+    co2_kg = parse_co2_kg(row['carbon_footprint'])
+    description = _text(row.get('description')) or f"{mode} from {origin} to {destination}"
+    external_ref = _text(row.get('external_ref')) or f"{origin}|{destination}|{mode}"
+    return (origin, destination, mode, price, format_duration(minutes), f"{co2_kg.normalize():f} kg CO2e",
+            description, co2_kg, minutes, source, external_ref[:191])
+
+
+def normalised_rows(records, source, errors):
+    """Yields valid rows; RowErrors are appended to ``errors`` as (line_number, message)."""
+    for line_number, raw in records:
+        try:
+            if isinstance(raw, RowError):
+                raise raw
+            yield normalise_row(raw, source)
+        except RowError as err:
+
+            errors.append((line_number, str(err)))
+
+
+def batched(rows, size):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+# --- Writing ---
+
+def import_journeys(conn, records, source, batch_size=DEFAULT_BATCH_SIZE, dry_run=False, max_errors=None,
+                    progress=True):
+    """Upserts the feed records into journeys. Returns a stats dict.
+
+    ``records`` is an iterable of (line_number, row dict) as produced by
+    read_csv()/read_jsonl(). Stops early (after committing what was already
+    written) once more than ``max_errors`` rows were rejected.
+    """
+    errors = []
+    stats = {'written': 0, 'skipped': 0, 'batches': 0, 'seconds': 0.0, 'rows_per_second': 0.0}
+    started = time.perf_counter()
+    cursor = None if dry_run else conn.cursor()
+    try:
+        for batch in batched(normalised_rows(records, source, errors), batch_size):
+            if cursor is not None:
+                try:
+                    cursor.executemany(UPSERT_SQL, batch)
+                    conn.commit()
+                except mysql.connector.Error:
+                    conn.rollback()
+                    raise
+            stats['written'] += len(batch)
+            stats['batches'] += 1
+            if progress:
+                rate = stats['written'] / max(time.perf_counter() - started, 1e-9)
+                print(f"  {stats['written']} rows ({rate:,.0f} rows/s)")
+            if max_errors is not None and len(errors) > max_errors:
+                break
+    finally:
+        if cursor is not None:
+            cursor.close()
+    stats['skipped'] = len(errors)
+    elapsed = time.perf_counter() - started
+    stats['seconds'] = round(elapsed, 3)
+    stats['rows_per_second'] = round(stats['written'] / elapsed, 1) if elapsed else 0.0
+    stats['errors'] = errors
+    if stats['written'] and not dry_run:
+        bump_version(conn, 'journeys')
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import journeys from a CSV or JSON Lines feed")
+    parser.add_argument('path', help="feed file ('-' for stdin; .gz is decompressed)")
+    parser.add_argument('--source', required=True, help="feed name; part of the upsert key")
+    parser.add_argument('--format', choices=('csv', 'jsonl'), help="default: from the file extension")
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument('--max-errors', type=int, help="stop after this many rejected rows")
+    parser.add_argument('--dry-run', action='store_true', help="validate only, write nothing")
+    parser.add_argument('--sqlite', metavar='PATH', help="import into a SQLite stand-in database instead of MySQL")
+    args = parser.parse_args()
+
+    if args.sqlite:
+        import sqlite_standin
+        if not os.path.exists(args.sqlite):
+            sqlite_standin.create_schema(args.sqlite)
+        conn = sqlite_standin.connect(args.sqlite)
+    else:
+        from app import load_config
+        DB_CONFIG = load_config()['DB']
+        conn = mysql.connector.connect(**DB_CONFIG)
+
+    fmt = feed_format(args.path, args.format)
+    try:
+        with open_feed(args.path) as stream:
+            records = read_jsonl(stream) if fmt == 'jsonl' else read_csv(stream)
+            stats = import_journeys(conn, records, args.source, args.batch_size, args.dry_run, args.max_errors)
+    finally:
+        conn.close()
+
+    for line_number, message in stats['errors'][:MAX_REPORTED_ERRORS]:
+        print(f"  line {line_number}: {message}")
+    if len(stats['errors']) > MAX_REPORTED_ERRORS:
+        print(f"  ... and {len(stats['errors']) - MAX_REPORTED_ERRORS} more rejected rows")
+    action = "Validated" if args.dry_run else "Imported"
+    print(f"{action} {stats['written']} rows in {stats['batches']} batches, skipped {stats['skipped']}, "
+          f"{stats['seconds']:.1f}s ({stats['rows_per_second']:,.0f} rows/s)")
+    if args.max_errors is not None and stats['skipped'] > args.max_errors:
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,349 @@
+"""Durable background jobs, stored in the ``jobs`` table.
+
+    python job_queue.py status              # jobs queued, running and dead
+    python job_queue.py work --workers 4    # run jobs in this process until interrupted
+    python job_queue.py retry-dead          # queue dead jobs again, with fresh attempts
+
+A view that wants work done after its response calls ``enqueue(conn, kind,
+payload)`` inside its own transaction, so the job is committed or rolled
+back together with the write that caused it, then ``JobQueue.wake()`` after
+the commit. ``JobWorker`` threads (a few in each app process, or in a
+separate ``work`` process) claim due jobs and pass each payload to the
+handler registered for its kind.
+
+A handler gets the worker's connection with a transaction open and must not
+commit: the job row is deleted in that same transaction, so a handler's
+database writes happen exactly once. Anything else it does (sending mail)
+happens at least once, as a job whose worker dies mid-way runs again.
+
+Claiming a job moves its ``run_at`` forward by ``lease_seconds`` and counts
+an attempt; if the worker has not finished by then another one takes it. A
+failed job is retried after ``retry_seconds``, doubling each time, and
+after ``max_attempts`` attempts stays in the table with status ``dead``.
+Queue depth comes from the table and job latency (enqueue to completion) is
+recorded per kind, both exported at /metrics.
+"""
+import argparse
+import json
+import threading
+import time
+from datetime import datetime, timedelta
+
+import mysql.connector
+
+from db_pool import PoolTimeout
+from metrics import LATENCY_BUCKETS, registry
+
+DEFAULT_MAX_ATTEMPTS = 5
+DEFAULT_LEASE_SECONDS = 60
+DEFAULT_RETRY_SECONDS = 10
+MAX_ERROR_LENGTH = 500  # jobs.last_error
+
+JOB_BUCKETS = LATENCY_BUCKETS + (30.0, 60.0, 300.0, 900.0)
+JOB_LATENCY_SECONDS = registry.histogram(
+    'job_latency_seconds', "Time from a job being enqueued to its successful completion", ('kind',), JOB_BUCKETS)
+JOB_RUN_SECONDS = registry.histogram('job_run_seconds', "Time a job handler ran, commit included", ('kind',))
+
+
+def enqueue(conn, kind, payload, delay_seconds=0):
+    """Adds a job inside the caller's open transaction on conn. Returns its id.
+
+    Workers see it once the caller commits; call JobQueue.wake() then so one
+    in this process starts straight away. ``payload`` must be JSON-serialisable.
+    """
+    now = datetime.now()
+    cursor = conn.cursor()
+    try:
+        cursor.execute(
+            "INSERT INTO jobs (kind, payload, status, attempts, run_at, created_at)"
+            " VALUES (%s, %s, 'queued', 0, %s, %s)",
+            (kind, json.dumps(payload), now + timedelta(seconds=delay_seconds), now))
+        return cursor.lastrowid
+    finally:
+        cursor.close()
+
+
+class Job:
+    __slots__ = ('id', 'kind', 'payload', 'attempts', 'created_at')
+
+    def __init__(self, job_id, kind, payload, attempts, created_at):
+        self.id = job_id
+        self.kind = kind
+        self.payload = json.loads(payload)
+        self.attempts = attempts
+        self.created_at = created_at
+
+    def __repr__(self):
+        return f"<Job {self.id} {self.kind} attempt={self.attempts}>"
+
+
+class JobQueue:
+    """Claims and runs jobs through the handlers registered for their kinds.
+
+    connect_func    returns a connection to the primary (e.g. a db_pool checkout)
+    handlers        {kind: handler(conn, payload)}; more can be added with ``@queue.handler(kind)``
+    max_attempts    attempts before a job is left as dead
+    lease_seconds   how long a claimed job is reserved for its worker
+    retry_seconds   delay before the first retry; doubles with every further attempt
+    """
+
+    def __init__(self, connect_func, handlers=None, max_attempts=DEFAULT_MAX_ATTEMPTS,
+                 lease_seconds=DEFAULT_LEASE_SECONDS, retry_seconds=DEFAULT_RETRY_SECONDS):
+        self._connect_func = connect_func
+        self.handlers = dict(handlers or {})
+        self.max_attempts = max_attempts
+        self.lease_seconds = lease_seconds
+        self.retry_seconds = retry_seconds
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition()
+        self._pending = False
+        self._stats = {
+            'completed': 0,
+            'retried': 0,
+            'dead': 0,
+            'lost_leases': 0,
+            'errors': 0,
+        }
+
+    def handler(self, kind):
+        """Decorator registering a handler(conn, payload) for jobs of ``kind``."""
+        def register(func):
+            self.handlers[kind] = func
+            return func
+        return register
+
+    # --- Waking workers ---
+
+    def wake(self):
+        """Tells a worker in this process that a job was just committed."""
+        with self._wakeup:
+            self._pending = True
+            self._wakeup.notify()
+
+    def wait(self, timeout):
+        """Blocks until wake() is called or ``timeout`` seconds pass."""
+        with self._wakeup:
+            self._wakeup.wait_for(lambda: self._pending, timeout)
+            self._pending = False
+
+    # --- Running ---
+
+    def run_pending(self, limit=1):
+        """Claims up to ``limit`` due jobs and runs them. Returns how many were claimed."""
+        try:
+            conn = self._connect_func()
+        except (PoolTimeout, mysql.connector.Error) as err:
+            print(f"Job queue could not connect: {err}")
+            self._count('errors')
+            return 0
+        try:
+            jobs = self._claim(conn, limit)
+            for job in jobs:
+                self._run(conn, job)
+            return len(jobs)
+        except mysql.connector.Error as err:
+            print(f"Job queue error: {err}")
+            self._count('errors')
+            return 0
+        finally:
+            conn.close()
+
+    def _claim(self, conn, limit):
+        now = datetime.now()
+        lease_until = now + timedelta(seconds=self.lease_seconds)
+        claimed = []
+        cursor = conn.cursor()
+        try:
+            # Running jobs whose lease ran out (their worker died), then queued jobs that are due
+            rows = []
+            for status in ('running', 'queued'):
+                cursor.execute(
+                    "SELECT id, kind, payload, attempts, created_at FROM jobs"
+                    " WHERE status = %s AND run_at <= %s ORDER BY run_at LIMIT %s FOR UPDATE SKIP LOCKED",
+                    (status, now, limit - len(rows)))
+                rows += cursor.fetchall()
+                if len(rows) >= limit:
+                    break
+            for job_id, kind, payload, attempts, created_at in rows:
+                if attempts >= self.max_attempts:
+                    # Its last attempt never finished
+                    cursor.execute("UPDATE jobs SET status = 'dead', last_error = %s WHERE id = %s AND attempts = %s",
+                                   ("lease expired on the last attempt", job_id, attempts))
+                    if cursor.rowcount:
+                        self._count('dead')
+                    continue
+                # attempts doubles as a version: only one worker's UPDATE can match
+                cursor.execute(
+                    "UPDATE jobs SET status = 'running', attempts = attempts + 1, run_at = %s"
+                    " WHERE id = %s AND attempts = %s", (lease_until, job_id, attempts))
+                if cursor.rowcount:
+                    claimed.append(Job(job_id, kind, payload, attempts + 1, created_at))
+            conn.commit()
+        except mysql.connector.Error:
+            conn.rollback()
+            raise
+        finally:
+            cursor.close()
+        return claimed
+
+    def _run(self, conn, job):
+        started = time.perf_counter()
+        cursor = conn.cursor()
+        try:
+            handler = self.handlers.get(job.kind)
+            if handler is None:
+                raise LookupError(f"no handler for job kind {job.kind!r}")
+            handler(conn, job.payload)
+            cursor.execute("DELETE FROM jobs WHERE id = %s AND attempts = %s", (job.id, job.attempts))
+            if not cursor.rowcount:
+                # Ran past its lease and another worker has it: undo this run's writes
+                conn.rollback()
+                self._count('lost_leases')
+                return
+            conn.commit()
+        except Exception as err:  # a handler may fail any way; the job is retried either way
+            conn.rollback()
+            self._failed(conn, job, err)
+            return
+        finally:
+            cursor.close()
+        JOB_RUN_SECONDS.observe(time.perf_counter() - started, job.kind)
+        JOB_LATENCY_SECONDS.observe((datetime.now() - job.created_at).total_seconds(), job.kind)
+        self._count('completed')
+
+    def _failed(self, conn, job, err):
+        error = f"{type(err).__name__}: {err}"[:MAX_ERROR_LENGTH]
+        cursor = conn.cursor()
+        try:
+            if job.attempts >= self.max_attempts:
+                cursor.execute("UPDATE jobs SET status = 'dead', last_error = %s WHERE id = %s AND attempts = %s",
+                               (error, job.id, job.attempts))
+                outcome = 'dead'
+            else:
+                retry_at = datetime.now() + timedelta(seconds=self.retry_seconds * 2 ** (job.attempts - 1))
+                cursor.execute(
+                    "UPDATE jobs SET status = 'queued', run_at = %s, last_error = %s WHERE id = %s AND attempts = %s",
+                    (retry_at, error, job.id, job.attempts))
+                outcome = 'retried'
+            conn.commit()
+        finally:
+            cursor.close()
+        print(f"Job {job.id} ({job.kind}) failed on attempt {job.attempts}: {error}"
+              + (" - giving up" if outcome == 'dead' else ""))
+        self._count(outcome)
+
+    def _count(self, key):
+        with self._lock:
+            self._stats[key] += 1
+
+    # --- Inspection ---
+
+    def depth(self):
+        """{'queued', 'running', 'dead': job counts, 'oldest_due_seconds': how long the oldest due job has waited}."""
+        conn = self._connect_func()
+        try:
+            return queue_depth(conn)
+        finally:
+            conn.close()
+
+    def stats(self):
+        """This process's run counters plus the queue depth (left out if the database cannot be reached)."""
+        with self._lock:
+            snapshot = dict(self._stats)
+        try:
+            snapshot.update(self.depth())
+        except (PoolTimeout, mysql.connector.Error) as err:
+            print(f"Error reading job queue depth: {err}")
+        return snapshot
+
+
+def queue_depth(conn):
+    now = datetime.now()
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status")
+        depth = {'queued': 0, 'running': 0, 'dead': 0}
+        depth.update((status, int(count)) for status, count in cursor.fetchall())
+        cursor.execute("SELECT run_at FROM jobs WHERE status = 'queued' AND run_at <= %s ORDER BY run_at LIMIT 1",
+                       (now,))
+        oldest_due = cursor.fetchone()
+    finally:
+        cursor.close()
+    depth['oldest_due_seconds'] = round((now - oldest_due[0]).total_seconds(), 3) if oldest_due else 0.0
+    return depth
+
+
+class JobWorker(threading.Thread):
+    """Daemon thread that runs a JobQueue's jobs, polling every ``poll_interval`` seconds when idle."""
+
+    def __init__(self, queue, poll_interval=2, name='job-worker'):
+        super().__init__(name=name, daemon=True)
+        self.queue = queue
+        self.poll_interval = poll_interval
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            self.queue.wait(self.poll_interval)
+            while not self._stop_event.is_set() and self.queue.run_pending():
+                pass  # keep going while there is work
+
+    def stop(self):
+        self._stop_event.set()
+
+
+def start_workers(queue, count, poll_interval=2):
+    workers = [JobWorker(queue, poll_interval, name=f'job-worker-{index}') for index in range(count)]
+    for worker in workers:
+        worker.start()
+    return workers
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Background job queue")
+    sub = parser.add_subparsers(dest='command', required=True)
+    sub.add_parser('status', help="count jobs by status")
+    work = sub.add_parser('work', help="run jobs until interrupted")
+    work.add_argument('--workers', type=int, default=4)
+    retry = sub.add_parser('retry-dead', help="queue dead jobs again")
+    retry.add_argument('--kind', help="only jobs of this kind")
+    args = parser.parse_args()
+
+    if args.command == 'work':
+        # The app's queue, so the handlers and their settings are the app's
+        import app as journey_app
+        journey_app.load_config({'JOB_WORKERS': args.workers})
+        journey_app.init_worker()
+        print(f"Running jobs on {len(journey_app.job_workers)} workers; Ctrl-C to stop")
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            for worker in journey_app.job_workers:
+                worker.stop()
+        return
+
+    from app import load_config
+    DB_CONFIG = load_config()['DB']
+    conn = mysql.connector.connect(**DB_CONFIG)
+    try:
+        if args.command == 'status':
+            for key, value in queue_depth(conn).items():
+                print(f"{key:>22}: {value}")
+        elif args.command == 'retry-dead':
+            cursor = conn.cursor()
+            sql = "UPDATE jobs SET status = 'queued', attempts = 0, run_at = %s WHERE status = 'dead'"
+            params = [datetime.now()]
+            if args.kind:
+                sql += " AND kind = %s"
+                params.append(args.kind)
+            cursor.execute(sql, params)
+            conn.commit()
+            print(f"Queued {cursor.rowcount} dead jobs again")
+            cursor.close()
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+"""Numeric CO2 / duration helpers for journeys.
+
+``journeys`` stores ``carbon_footprint`` as text like "12.3 kg CO2e" and
+``duration`` as text like "1h 30m". Migration 0001 adds typed ``co2_kg`` and
+``duration_minutes`` columns; routes read those and only fall back to parsing
+the strings for rows the backfill has not reached yet.
+"""
+import re
+
+_HOURS_RE = re.compile(r'(\d+)h')
+_MINUTES_RE = re.compile(r'(\d+)m')
+
+
+# Helper function to safely convert carbon_footprint string to float
+def parse_carbon_footprint(cf_str):
+    try:
+        if cf_str is not None:
+            # Remove 'kg CO2e' and any extra spaces, then convert to float
+            return float(cf_str.replace('kg CO2e', '').strip())
+        return 0.0
+    except (ValueError, AttributeError):
+        return 0.0
+
+
+# Helper function to parse duration string (e.g., "1h 30m") into minutes for sorting
+def parse_duration_to_minutes(duration_str):
+    if not isinstance(duration_str, str):
+        return 0 # Or raise an error, depending on expected input
+
+    hours = 0
+    minutes = 0
+
+    h_match = _HOURS_RE.search(duration_str)
+    if h_match:
+        hours = int(h_match.group(1))
+
+    m_match = _MINUTES_RE.search(duration_str)
+    if m_match:
+        minutes = int(m_match.group(1))
+
+    return hours * 60 + minutes
+
+
+def format_duration(total_minutes):
+    """Formats minutes back into the "1h 30m" display form."""
+    total_minutes = int(total_minutes)
+    return f"{total_minutes // 60}h {total_minutes % 60}m"
+
+
+def journey_co2_kg(row):
+    """CO2 in kg for a journey row, preferring the numeric co2_kg column."""
+    value = row.get('co2_kg')
+    if value is not None:
+        return float(value)
+    return parse_carbon_footprint(row.get('carbon_footprint'))
+
+
+def journey_duration_minutes(row):
+    """Duration in minutes for a journey row, preferring the numeric duration_minutes column."""
+    value = row.get('duration_minutes')
+    if value is not None:
+        return int(value)
+    return parse_duration_to_minutes(row.get('duration'))
@@ -0,0 +1,199 @@
+"""Multi-leg journey planner over an in-memory route graph.
+
+``search_results`` only finds direct ``journeys`` rows. When there is no
+direct link, the planner searches the graph of all journeys (indexed by
+origin) for connections of up to ``max_legs`` legs that are Pareto-optimal
+in (price, duration, CO2): no other connection is at least as good on all
+three and better on one.
+
+The search runs in rounds like RAPTOR: round k extends the labels created in
+round k-1 by one more leg. A new label is dropped when it is dominated by a
+label already kept at the same city (which used no more legs) or by a
+connection already found to the destination, since every leg only adds cost.
+"""
+import threading
+import time
+
+from journey_metrics import journey_co2_kg, journey_duration_minutes
+
+# Extra minutes added per change of vehicle; journeys have no timetable yet.
+DEFAULT_TRANSFER_MINUTES = 30
+
+
+def _dominates(a, b):
+    """True if criteria tuple ``a`` is at least as good as ``b`` everywhere."""
+    return a[0] <= b[0] and a[1] <= b[1] and a[2] <= b[2]
+
+
+def _insert_pareto(bag, criteria):
+    """Adds ``criteria`` to the Pareto ``bag`` unless dominated. Returns True if added."""
+    for existing in bag:
+        if _dominates(existing, criteria):
+            return False
+    bag[:] = [existing for existing in bag if not _dominates(criteria, existing)]
+    bag.append(criteria)
+    return True
+
+
+class RouteGraph:
+    """Journeys indexed by origin as compact edge tuples.
+
+    Each edge is ``(destination, price, duration_minutes, co2_kg, journey_id, mode)``.
+    Parallel edges between the same pair of cities are reduced to their Pareto
+    set per mode, which keeps the branching factor small on busy corridors.
+    """
+
+    def __init__(self, rows):
+        edges_by_pair = {}
+        self.journeys = {}
+        for row in rows:
+            edge = (row['destination'], float(row['price']), journey_duration_minutes(row),
+                    journey_co2_kg(row), row['id'], row['mode'])
+            self.journeys[row['id']] = row
+            bag = edges_by_pair.setdefault((row['origin'], row['destination'], row['mode']), [])
+            criteria = edge[1:4]
+            if any(_dominates(other[1:4], criteria) for other in bag):
+                continue
+            bag[:] = [other for other in bag if not _dominates(criteria, other[1:4])]
+            bag.append(edge)
+
+        self.adjacency = {}
+        for (origin, _, _), edges in edges_by_pair.items():
+            self.adjacency.setdefault(origin, []).extend(edges)
+        self.edge_count = sum(len(edges) for edges in self.adjacency.values())
+
+    def plan(self, origin, destination, max_legs=3, modes=None,
+             transfer_minutes=DEFAULT_TRANSFER_MINUTES, max_results=10):
+        """Pareto-optimal connections from origin to destination.
+
+        Returns a list of ``(price, duration_minutes, co2_kg, [journey_id, ...])``
+        sorted by price.
+        """
+        if origin == destination or origin not in self.adjacency:
+            return []
+        allowed_modes = set(modes) if modes else None
+
+        # Per-city Pareto bags of criteria tuples.
+        bags = {}
+        target_bag = []
+        found = []
+        # Labels: (price, duration, co2, city, path of journey ids, visited cities)
+        frontier = [(0.0, 0, 0.0, origin, (), frozenset((origin,)))]
+
+        for leg in range(max_legs):
+            next_frontier = []
+            for price, duration, co2, city, path, visited in frontier:
+                penalty = transfer_minutes if path else 0
+                for dest, e_price, e_duration, e_co2, journey_id, mode in self.adjacency.get(city, ()):
+                    if dest in visited:
+                        continue
+                    if allowed_modes is not None and mode not in allowed_modes:
+                        continue
+                    criteria = (price + e_price, duration + penalty + e_duration, co2 + e_co2)
+                    # Target pruning: costs only grow, so anything a found
+                    # connection already beats can never catch up.
+                    if any(_dominates(t, criteria) for t in target_bag):
+                        continue
+                    if dest == destination:
+                        if _insert_pareto(target_bag, criteria):
+                            found.append((criteria, path + (journey_id,)))
+                        continue
+                    if leg == max_legs - 1:
+                        continue
+                    if not _insert_pareto(bags.setdefault(dest, []), criteria):
+                        continue
+                    next_frontier.append(criteria + (dest, path + (journey_id,), visited | {dest}))
+            # Skip labels evicted from their city's bag later in the same round.
+            frontier = [label for label in next_frontier if label[:3] in bags[label[3]]]
+            if not frontier:
+                break
+
+        # Drop connections that a later round dominated.
+        results = [(c[0], c[1], c[2], list(p)) for c, p in found if c in target_bag]
+        results.sort(key=lambda r: (r[0], r[1], r[2]))
+        return results[:max_results]
+
+
+class JourneyPlanner:
+    """Keeps a RouteGraph built from ``load_func`` and rebuilds it after a TTL.
+
+    ``load_func`` returns journey rows (dicts) or None on database errors, in
+    which case the previous graph keeps being used.
+    """
+
+    def __init__(self, load_func, ttl_seconds=300, max_legs=3,
+                 transfer_minutes=DEFAULT_TRANSFER_MINUTES):
+        self._load_func = load_func
+        self.ttl_seconds = ttl_seconds
+        self.max_legs = max_legs
+        self.transfer_minutes = transfer_minutes
+        self._lock = threading.Lock()
+        self._graph = None
+        self._loaded_at = 0.0
+
+    def invalidate(self):
+        with self._lock:
+            self._loaded_at = 0.0
+
+    def is_fresh(self):
+        """True if graph() will return without reloading."""
+        return self._graph is not None and bool(self._loaded_at) and \
+            time.monotonic() - self._loaded_at < self.ttl_seconds
+
+    def graph(self):
+        with self._lock:
+            if self.is_fresh():
+                return self._graph
+            rows = self._load_func()
+            if rows is not None:
+                self._graph = RouteGraph(rows)
+                self._loaded_at = time.monotonic()
+            return self._graph
+
+    def connections(self, origin, destination, modes=None, max_legs=None, max_results=10):
+        graph = self.graph()
+        if graph is None:
+            return [], None
+        plans = graph.plan(origin, destination, max_legs=max_legs or self.max_legs, modes=modes,
+                           transfer_minutes=self.transfer_minutes, max_results=max_results)
+        return plans, graph
+
+
+def connection_fare(plan):
+    """A planner result as a quotes input row: summed fares, CO2 and time, and no journey id of its own."""
+    price, duration_minutes, co2_value, _ = plan
+    return {'id': None, 'price': price, 'co2_kg': co2_value, 'duration_minutes': duration_minutes}
+
+
+def build_connection_result(plan, graph, departure_date, quote):
+    """Shapes one planner result like the processed_results dicts in search_results.
+
+    ``quote`` prices connection_fare(plan) for the trip searched for.
+
+    Connecting trips have no single journey id, so ``id`` is None and each
+    leg is listed under ``legs`` for results_page.html.
+    """
+    legs = [graph.journeys[journey_id] for journey_id in plan[3]]
+    changes = len(legs) - 1
+    via = ', '.join(leg['destination'] for leg in legs[:-1])
+    return {
+        'id': None,
+        'mode': legs[0]['mode'] if len({leg['mode'] for leg in legs}) == 1 else 'Mixed',
+        'mode_icon': '',
+        'route': f"{legs[0]['origin']} to {legs[-1]['destination']} via {via}",
+        'times': f"Departs: {departure_date} (Time TBD)",
+        'stops': f"{changes} change{'s' if changes != 1 else ''}",
+        'travel_time': quote['travel_time'],
+        'duration_minutes': quote['duration_minutes'],
+        'cost': round(quote['price'], 2),
+        'co2_emissions': round(quote['co2_kg'], 3),
+        'student_discount': quote['discounted'],
+        'description': ' → '.join(f"{leg['origin']} to {leg['destination']} by {leg['mode']}" for leg in legs),
+        'legs': [{
+            'id': leg['id'],
+            'route': f"{leg['origin']} to {leg['destination']}",
+            'mode': leg['mode'],
+            'travel_time': leg['duration'],
+            'cost': float(leg['price']),
+        } for leg in legs],
+    }
@@ -0,0 +1,138 @@
+"""SQL building blocks for journey search.
+
+Ordering happens in the database and results come back one page at a time
+using keyset (seek) pagination: each page ends with an opaque cursor holding
+the last row's ``(sort value, id)``, and the next page starts strictly after
+it. Unlike OFFSET, fetching page N costs the same as fetching page 1.
+
+The one exception is 'cheapest': the promotional fare depends on the journey
+and the departure date, so the price a result shows is not the stored
+price. For that sort the whole route is fetched once (``limit=None``),
+quoted in one batch and ranked by quoted per-person price
+(``rank_by_price``); the app caches the ranking per route, date, trip type
+and discount flag, and every page is a slice of it (``quoted_price_page``).
+"""
+import base64
+import bisect
+import json
+
+# Columns results.html actually needs (plus the raw text columns used as a
+# fallback for rows the co2_kg/duration_minutes backfill has not reached).
+SEARCH_COLUMNS = "id, origin, destination, mode, price, duration, duration_minutes, carbon_footprint, co2_kg, description"
+
+# sort option -> (column, python type of its value)
+SORT_COLUMNS = {
+    'cheapest': ('price', float),
+    'fastest': ('duration_minutes', int),
+    'lowest_co2': ('co2_kg', float),
+}
+DEFAULT_SORT_COLUMN = ('id', int)
+
+# Sorts ordered by the quoted price rather than a column (see quoted_price_page)
+QUOTED_SORTS = frozenset({'cheapest'})
+
+SEARCH_PAGE_SIZE = 20
+
+
+class InvalidCursor(ValueError):
+    """Raised when a pagination cursor cannot be decoded."""
+
+
+def sort_column(sort_by):
+    return SORT_COLUMNS.get(sort_by, DEFAULT_SORT_COLUMN)
+
+
+def encode_cursor(row, sort_by):
+    """Cursor pointing just after ``row`` for the given sort order."""
+    column, cast = sort_column(sort_by)
+    value = row[column]
+    return _encode((None if value is None else cast(value)), row['id'])
+
+
+def _encode(value, last_id):
+    payload = [value, int(last_id)]
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode().rstrip('=')
+
+
+def decode_cursor(token, sort_by):
+    """Returns ``(sort_value, id)`` from a cursor produced by encode_cursor()."""
+    column, cast = sort_column(sort_by)
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        value, last_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return (None if value is None else cast(value)), int(last_id)
+    except (ValueError, TypeError, json.JSONDecodeError) as err:
+        raise InvalidCursor(f"Invalid page cursor: {token!r}") from err
+
+
+def build_search_query(origin, destination, selected_modes, sort_by, after=None, limit=SEARCH_PAGE_SIZE):
+    """Returns ``(sql, params)`` for one page of journeys from origin to destination.
+
+    ``after`` is a decoded cursor ``(sort_value, id)`` or None for the first
+    page. One extra row is fetched so the caller can tell whether another
+    page exists without a COUNT query; ``limit=None`` fetches every match.
+    """
+    column, _ = sort_column(sort_by)
+    query = f"SELECT {SEARCH_COLUMNS} FROM journeys WHERE origin = %s AND destination = %s"
+    params = [origin, destination]
+
+    if selected_modes:
+        mode_placeholders = ', '.join(['%s'] * len(selected_modes))
+        query += f" AND mode IN ({mode_placeholders})"
+        params.extend(selected_modes)
+
+    if after is not None:
+        value, last_id = after
+        if column == 'id':
+            query += " AND id > %s"
+            params.append(last_id)
+        elif value is None:
+            # NULLs sort first in ascending order, so the page after a NULL key
+            # continues among the NULLs and then moves on to every non-NULL value.
+            query += f" AND (({column} IS NULL AND id > %s) OR {column} IS NOT NULL)"
+            params.append(last_id)
+        else:
+            query += f" AND ({column} > %s OR ({column} = %s AND id > %s))"
+            params.extend([value, value, last_id])
+
+    if column == 'id':
+        query += " ORDER BY id"
+    else:
+        query += f" ORDER BY {column}, id"
+    if limit is not None:
+        query += " LIMIT %s"
+        params.append(limit + 1)
+    return query, tuple(params)
+
+
+def split_page(rows, sort_by, limit=SEARCH_PAGE_SIZE):
+    """Trims the look-ahead row and returns ``(page_rows, next_cursor or None)``."""
+    if limit is not None and len(rows) > limit:
+        page = rows[:limit]
+        return page, encode_cursor(page[-1], sort_by)
+    return rows, None
+
+
+def rank_by_price(rows, prices):
+    """A whole route's ``rows`` ordered by ``(prices[i], id)``, as the ``(keys, rows)`` quoted_price_page pages.
+
+    ``prices`` are the quoted per-person prices of ``rows``.
+    """
+    ranked = sorted(zip(prices, (int(row['id']) for row in rows), rows), key=lambda item: item[:2])
+    return [item[:2] for item in ranked], [item[2] for item in ranked]
+
+
+def quoted_price_page(ranking, after=None, limit=SEARCH_PAGE_SIZE):
+    """One page of a rank_by_price() ranking as ``(page_rows, next_cursor or None)``.
+
+    ``after`` is a decoded cursor whose sort value is a quoted price; the page
+    starts at its bisection point, so any page costs the same as the first.
+    """
+    keys, rows = ranking
+    start = 0
+    if after is not None and after[0] is not None:
+        start = bisect.bisect_right(keys, tuple(after))
+    stop = start + limit
+    if stop < len(rows):
+        return rows[start:stop], _encode(*keys[stop - 1])
+    return rows[start:], None
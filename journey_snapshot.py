@@ -0,0 +1,450 @@
+"""Read-only snapshot of the journeys table, shared by every worker process through one memory-mapped file.
+
+The route catalog, search cache and fare calendar each keep their own copy
+of journeys in every process, and each process reloads its copies when the
+data changes. A snapshot holds the searchable part of the table once per
+host instead: numeric price, CO2 and duration, city and mode ids, and the
+text the result cards show, as flat arrays in a file that each process maps
+with ``mmap`` and reads through NumPy views. Nothing is copied into the
+process, so the pages are shared by every worker (on tmpfs such as
+``/dev/shm`` they never touch a disk).
+
+Rows are stored grouped by route, ``(origin, destination)``, in id order,
+together with one row order per sort option. A search page is then a slice of
+the route's rows in the requested order, filtered by mode and the page cursor
+(journey_search.py) without a query or a sort, and the destinations from an
+origin are a slice of the route index.
+
+``write_snapshot()`` writes a new file next to the old one and renames it
+over it, which is atomic: a reader has either the old file mapped or the new
+one, and a process that still has the old one mapped keeps a consistent
+view until it next calls ``JourneySnapshotStore.current()``. The header
+records the ``journeys`` dataset version (dataset_versions.py) it was built
+from. ``SnapshotRefresher`` rebuilds the file when that version moves; one
+runs in every worker process, and a file lock plus a version check after
+taking it leave the work for each change to just one of them.
+
+    python journey_snapshot.py build /dev/shm/green_journey/journeys.snap
+    python journey_snapshot.py info /dev/shm/green_journey/journeys.snap
+"""
+import argparse
+import json
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+
+import mysql.connector
+import numpy as np
+
+from dataset_versions import read_version
+from journey_search import SEARCH_PAGE_SIZE, sort_column, split_page
+
+try:
+    import fcntl
+except ImportError:  # no flock (Windows): concurrent rebuilds are wasted work, but the rename keeps them safe
+    fcntl = None
+
+MAGIC = b'GJSNAP01'
+HEADER = struct.Struct('<8sI')  # magic, length of the JSON header that follows
+ALIGNMENT = 64
+
+SNAPSHOT_SQL = ("SELECT id, origin, destination, mode, price, duration, duration_minutes, carbon_footprint, co2_kg,"
+                " description FROM journeys")
+
+TEXT_COLUMNS = ('duration', 'carbon_footprint', 'description')
+
+# sort option column -> the array of row numbers holding that order within each route
+ORDER_ARRAYS = {'price': 'by_price', 'duration_minutes': 'by_duration', 'co2_kg': 'by_co2'}
+
+
+class SnapshotError(Exception):
+    """The file is not a journey snapshot this code can read."""
+
+
+# --- Building ---
+
+def _sort_key(values):
+    """(is-not-NULL, value) arrays that put NULLs first, as MySQL does in ascending order."""
+    present = ~np.isnan(values)
+    return present, np.where(present, values, 0.0)
+
+
+def build_arrays(rows):
+    """The snapshot's arrays and string tables for journeys ``rows``; returns (arrays, cities, modes)."""
+    cities = sorted({row[1] for row in rows} | {row[2] for row in rows})
+    modes = sorted({row[3] for row in rows})
+    city_ids = {city: index for index, city in enumerate(cities)}
+    mode_ids = {mode: index for index, mode in enumerate(modes)}
+
+    rows = sorted(rows, key=lambda row: (city_ids[row[1]], city_ids[row[2]], row[0]))
+    count = len(rows)
+    ids = np.fromiter((row[0] for row in rows), dtype=np.int64, count=count)
+    origins = np.fromiter((city_ids[row[1]] for row in rows), dtype=np.int32, count=count)
+    destinations = np.fromiter((city_ids[row[2]] for row in rows), dtype=np.int32, count=count)
+    arrays = {
+        'ids': ids,
+        'origin_ids': origins,
+        'destination_ids': destinations,
+        'mode_ids': np.fromiter((mode_ids[row[3]] for row in rows), dtype=np.int16, count=count),
+        'prices': np.fromiter((float(row[4]) for row in rows), dtype=np.float64, count=count),
+        'duration_minutes': np.fromiter((np.nan if row[6] is None else row[6] for row in rows), dtype=np.float64,
+                                        count=count),
+        'co2_kg': np.fromiter((np.nan if row[8] is None else float(row[8]) for row in rows), dtype=np.float64,
+                              count=count),
+    }
+
+    # Route index: rows [route_starts[i], route_starts[i + 1]) are route route_keys[i]
+    route_keys = origins.astype(np.int64) * max(len(cities), 1) + destinations
+    keys, starts = np.unique(route_keys, return_index=True)
+    arrays['route_keys'] = keys
+    arrays['route_starts'] = np.append(starts, count).astype(np.int64)
+
+    for column, name in ORDER_ARRAYS.items():
+        present, values = _sort_key(arrays['prices'] if column == 'price' else arrays[column])
+        # Primary key last: route, then NULLs first, then value, then id (rows are in id order within a route)
+        arrays[name] = np.lexsort((ids, values, present, route_keys)).astype(np.int32)
+
+    for position, column in zip((5, 7, 9), TEXT_COLUMNS):
+        encoded = [None if row[position] is None else str(row[position]).encode() for row in rows]
+        lengths = np.fromiter((-1 if text is None else len(text) for text in encoded), dtype=np.int32, count=count)
+        arrays[f'{column}_starts'] = np.concatenate(([0], np.cumsum(np.maximum(lengths, 0))[:-1])).astype(np.int64)
+        arrays[f'{column}_lengths'] = lengths
+        text = b''.join(text for text in encoded if text)
+        arrays[f'{column}_text'] = np.frombuffer(text, dtype=np.uint8) if text else np.zeros(0, dtype=np.uint8)
+    return arrays, cities, modes
+
+
+def write_snapshot(path, rows, version):
+    """Writes a snapshot of journeys ``rows`` (SNAPSHOT_SQL's columns) and renames it over ``path``.
+
+    Returns the size of the file in bytes.
+    """
+    arrays, cities, modes = build_arrays(rows)
+    layout = {}
+    offset = 0
+    for name, array in arrays.items():
+        layout[name] = [array.dtype.str, offset, len(array)]
+        offset += -(-array.nbytes // ALIGNMENT) * ALIGNMENT
+    header = json.dumps({'version': version, 'built_at': time.time(), 'rows': len(arrays['ids']),
+                         'cities': cities, 'modes': modes, 'arrays': layout}).encode()
+    data_start = -(-(HEADER.size + len(header)) // ALIGNMENT) * ALIGNMENT
+
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(prefix='.journeys-', dir=directory)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, len(header)))
+            f.write(header)
+            for name, array in arrays.items():
+                f.seek(data_start + layout[name][1])
+                f.write(array.tobytes())
+            f.truncate(data_start + offset)
+            f.flush()
+            os.fsync(f.fileno())
+        os.chmod(temp_path, 0o644)
+        os.replace(temp_path, path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+    return data_start + offset
+
+
+def build_snapshot(conn, path):
+    """Reads journeys and the dataset version over ``conn`` and writes a snapshot to ``path``. Returns its version.
+
+    The version is read first, so a change that commits during the read leaves
+    the snapshot labelled older than it may be and it is simply built again.
+    """
+    version = read_version(conn, 'journeys')
+    cursor = conn.cursor()
+    try:
+        cursor.execute(SNAPSHOT_SQL)
+        rows = cursor.fetchall()
+    finally:
+        cursor.close()
+    write_snapshot(path, rows, version)
+    return version
+
+
+# --- Reading ---
+
+class JourneySnapshot:
+    """One snapshot file, mapped read-only; the arrays are views of the mapping (immutable)."""
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self.file_id = _file_id(os.fstat(f.fileno()))
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, header_length = HEADER.unpack_from(self._map)
+        if magic != MAGIC:
+            raise SnapshotError(f"{path} is not a journey snapshot")
+        header = json.loads(self._map[HEADER.size:HEADER.size + header_length])
+        data_start = -(-(HEADER.size + header_length) // ALIGNMENT) * ALIGNMENT
+        self.version = header['version']
+        self.built_at = header['built_at']
+        self.cities = header['cities']
+        self.modes = header['modes']
+        self.nbytes = len(self._map)
+        self._city_ids = {city: index for index, city in enumerate(self.cities)}
+        self._mode_ids = {mode: index for index, mode in enumerate(self.modes)}
+        self._arrays = {name: np.frombuffer(self._map, dtype=np.dtype(dtype), count=count, offset=data_start + offset)
+                        for name, (dtype, offset, count) in header['arrays'].items()}
+        for name, array in self._arrays.items():
+            setattr(self, name, array)
+        # The text columns' bytes, sliced without copying the rest of the file
+        self._text = {column: memoryview(self._arrays[f'{column}_text']).cast('B') for column in TEXT_COLUMNS}
+
+    def __len__(self):
+        return len(self.ids)
+
+    def route_rows(self, origin, destination):
+        """(start, stop) of the route's rows, or None if there is no such route."""
+        origin_id = self._city_ids.get(origin)
+        destination_id = self._city_ids.get(destination)
+        if origin_id is None or destination_id is None:
+            return None
+        key = origin_id * len(self.cities) + destination_id
+        index = int(np.searchsorted(self.route_keys, key))
+        if index == len(self.route_keys) or self.route_keys[index] != key:
+            return None
+        return int(self.route_starts[index]), int(self.route_starts[index + 1])
+
+    def destinations(self, origin):
+        """Sorted list of destinations reachable directly from ``origin`` (RouteCatalog.destinations)."""
+        origin_id = self._city_ids.get(origin)
+        if origin_id is None:
+            return []
+        width = len(self.cities)
+        first, last = np.searchsorted(self.route_keys, [origin_id * width, (origin_id + 1) * width])
+        return [self.cities[key - origin_id * width] for key in self.route_keys[first:last].tolist()]
+
+    def search_page(self, origin, destination, selected_modes, sort_by, after=None, limit=SEARCH_PAGE_SIZE):
+        """One page of the route's journeys as (rows, next_cursor), exactly as the SQL of build_search_query returns.
+
+        ``after`` is a decoded cursor; cursors from either path work with the other. ``limit=None``
+        returns the whole route.
+        """
+        span = self.route_rows(origin, destination)
+        if span is None:
+            return [], None
+        start, stop = span
+        column, _ = sort_column(sort_by)
+        if column == 'id':
+            order = np.arange(start, stop)
+        else:
+            order = getattr(self, ORDER_ARRAYS[column])[start:stop]
+
+        keep = np.ones(len(order), dtype=bool)
+        if selected_modes:
+            wanted = [self._mode_ids[mode] for mode in selected_modes if mode in self._mode_ids]
+            keep &= np.isin(self.mode_ids[order], wanted)
+        if after is not None:
+            value, last_id = after
+            ids = self.ids[order]
+            if column == 'id':
+                keep &= ids > last_id
+            else:
+                values = (self.prices if column == 'price' else getattr(self, column))[order]
+                null = np.isnan(values)
+                if value is None:
+                    keep &= ~null | (ids > last_id)
+                else:
+                    keep &= ~null & ((values > value) | ((values == value) & (ids > last_id)))
+        selected = order[keep] if limit is None else order[keep][:limit + 1]
+        return split_page(self.rows(selected), sort_by, limit)
+
+    def rows(self, indexes):
+        """Rows ``indexes`` as the dicts a SEARCH_COLUMNS query returns (DECIMAL columns as floats)."""
+        indexes = np.asarray(indexes, dtype=np.intp)
+        columns = {
+            'id': self.ids[indexes].tolist(),
+            'origin': [self.cities[city] for city in self.origin_ids[indexes].tolist()],
+            'destination': [self.cities[city] for city in self.destination_ids[indexes].tolist()],
+            'mode': [self.modes[mode] for mode in self.mode_ids[indexes].tolist()],
+            'price': self.prices[indexes].tolist(),
+            # NaN (NULL) is the one value not equal to itself
+            'duration_minutes': [None if value != value else int(value)
+                                 for value in self.duration_minutes[indexes].tolist()],
+            'co2_kg': [None if value != value else value for value in self.co2_kg[indexes].tolist()],
+        }
+        for column in TEXT_COLUMNS:
+            text = self._text[column]
+            columns[column] = [None if length < 0 else str(text[start:start + length], 'utf-8')
+                               for start, length in zip(self._arrays[f'{column}_starts'][indexes].tolist(),
+                                                        self._arrays[f'{column}_lengths'][indexes].tolist())]
+        names = list(columns)
+        return [dict(zip(names, values)) for values in zip(*columns.values())]
+
+    def row(self, index):
+        """Row ``index``; see rows()."""
+        return self.rows([index])[0]
+
+
+def _file_id(stat):
+    return stat.st_dev, stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+
+class JourneySnapshotStore:
+    """The snapshot at ``path`` as this process sees it, remapped when the file is replaced.
+
+    ``current()`` looks at the file at most every ``check_seconds``. A process
+    keeps its previous mapping until the new file has been mapped, and mappings
+    are only ever dropped, never closed, so arrays a request is still reading
+    stay valid.
+    """
+
+    def __init__(self, path, check_seconds=1.0):
+        self.path = path
+        self.check_seconds = check_seconds
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self._next_check = 0.0
+        self._stats = {'hits': 0, 'stale': 0, 'missing': 0, 'remaps': 0, 'builds': 0, 'build_errors': 0}
+
+    def current(self, min_version=None):
+        """The mapped snapshot, or None if there is none at least as new as ``min_version``."""
+        if time.monotonic() >= self._next_check:
+            self._check_file()
+        snapshot = self._snapshot
+        with self._lock:
+            if snapshot is None:
+                self._stats['missing'] += 1
+                return None
+            if min_version is not None and snapshot.version < min_version:
+                self._stats['stale'] += 1
+                return None
+            self._stats['hits'] += 1
+        return snapshot
+
+    def invalidate(self):
+        """Look at the file again on the next current() call."""
+        self._next_check = 0.0
+
+    def _check_file(self):
+        self._next_check = time.monotonic() + self.check_seconds
+        try:
+            file_id = _file_id(os.stat(self.path))
+        except FileNotFoundError:
+            return
+        if self._snapshot is not None and self._snapshot.file_id == file_id:
+            return
+        try:
+            snapshot = JourneySnapshot(self.path)
+        except FileNotFoundError:
+            return  # replaced again between the stat and the open; the next check maps the newer one
+        except (OSError, ValueError, SnapshotError) as err:
+            print(f"Error mapping journey snapshot {self.path}: {err}")
+            return
+        with self._lock:
+            self._snapshot = snapshot
+            self._stats['remaps'] += 1
+
+    def refresh(self, conn):
+        """Rebuilds the file from ``conn`` unless it already has the current journeys version. Returns True if built.
+
+        Only one process on the host builds at a time; the others return False
+        straight away and map the file it writes on their next check.
+        """
+        lock_file = open(self.path + '.lock', 'a')
+        try:
+            if fcntl is not None:
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    return False
+            version = read_version(conn, 'journeys')
+            try:
+                built = JourneySnapshot(self.path).version
+            except (OSError, ValueError, SnapshotError):
+                built = None
+            if built == version:
+                return False
+            build_snapshot(conn, self.path)
+            with self._lock:
+                self._stats['builds'] += 1
+            self.invalidate()
+            return True
+        finally:
+            lock_file.close()  # releases the lock
+
+    def refresh_failed(self, err):
+        with self._lock:
+            self._stats['build_errors'] += 1
+        print(f"Journey snapshot refresh error: {err}")
+
+    def stats(self):
+        """Lookup and rebuild counters plus the version, rows and size of the mapped snapshot."""
+        with self._lock:
+            snapshot = dict(self._stats)
+            mapped = self._snapshot
+        snapshot['version'] = mapped.version if mapped else 0
+        snapshot['rows'] = len(mapped) if mapped else 0
+        snapshot['bytes'] = mapped.nbytes if mapped else 0
+        return snapshot
+
+
+class SnapshotRefresher(threading.Thread):
+    """Daemon thread that runs JourneySnapshotStore.refresh() on start and then every ``interval`` seconds."""
+
+    def __init__(self, store, connect_func, interval=5):
+        super().__init__(name='journey-snapshot-refresher', daemon=True)
+        self.store = store
+        self._connect_func = connect_func
+        self.interval = interval
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while True:
+            try:
+                conn = self._connect_func()
+                try:
+                    if self.store.refresh(conn):
+                        print(f"Journey snapshot rebuilt at {self.store.path}")
+                finally:
+                    conn.close()
+            except (mysql.connector.Error, OSError) as err:
+                self.store.refresh_failed(err)
+            if self._stop_event.wait(self.interval):
+                return
+
+    def stop(self):
+        self._stop_event.set()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Shared journey snapshot")
+    sub = parser.add_subparsers(dest='command', required=True)
+    build = sub.add_parser('build', help="write a snapshot of journeys now")
+    build.add_argument('path', nargs='?', help="default: the app's JOURNEY_SNAPSHOT_PATH")
+    info = sub.add_parser('info', help="describe a snapshot file")
+    info.add_argument('path', nargs='?', help="default: the app's JOURNEY_SNAPSHOT_PATH")
+    args = parser.parse_args()
+
+    from app import load_config
+    config = load_config()
+    path = args.path or config['JOURNEY_SNAPSHOT_PATH']
+    if not path:
+        parser.error("no path given and JOURNEY_SNAPSHOT_PATH is not set")
+
+    if args.command == 'build':
+        conn = mysql.connector.connect(**config['DB'])
+        try:
+            started = time.perf_counter()
+            version = build_snapshot(conn, path)
+            print(f"Wrote {path} (journeys version {version}, {os.path.getsize(path)} bytes)"
+                  f" in {time.perf_counter() - started:.2f}s")
+        finally:
+            conn.close()
+    elif args.command == 'info':
+        snapshot = JourneySnapshot(path)
+        print(f"{path}: journeys version {snapshot.version}, built {time.ctime(snapshot.built_at)}")
+        print(f"  {len(snapshot)} journeys, {len(snapshot.route_keys)} routes, {len(snapshot.cities)} cities,"
+              f" {len(snapshot.modes)} modes, {snapshot.nbytes} bytes")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,402 @@
+"""Request, database and template instrumentation, exported at /metrics.
+
+``init_metrics(app)`` records, per request:
+
+* route latency (``http_request_duration_seconds``, by endpoint/method/status)
+* time spent checking out a DB connection (``db_connect_seconds``)
+* time in ``execute()`` and in fetching rows (``db_query_seconds``,
+  ``db_fetch_seconds``, by statement type)
+* queries issued (``http_request_db_queries``)
+* Jinja render time (``template_render_seconds``, by template)
+
+and serves them, plus any registered stats collectors (pool, route catalog,
+search cache), in the Prometheus text format. Connections are instrumented by
+wrapping them with ``instrument_connection()`` at checkout
+(``instrument_async_connection()`` for the async pool in asgi.py).
+
+When ``SLOW_REQUEST_SECONDS`` is set, requests slower than that are written
+to the ``slow_requests`` logger (and ``SLOW_REQUEST_LOG`` if given) as one
+JSON line with the timings and SQL of every query the request ran.
+
+Streaming responses are timed until the view returns, not until the last
+byte is sent; their queries after that point still feed the DB histograms.
+"""
+import bisect
+import json
+import logging
+import threading
+import time
+
+from flask import before_render_template, g, has_request_context, request, template_rendered
+
+PROMETHEUS_MIMETYPE = 'text/plain; version=0.0.4; charset=utf-8'
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55)
+SLOW_LOG_MAX_SQL = 2000  # characters of each statement kept in the slow log
+
+slow_request_log = logging.getLogger('slow_requests')
+
+
+# --- Metric types ---
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, v in pairs)
+    return '{' + ','.join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Histogram:
+    """Cumulative-bucket histogram with optional labels, safe to observe from any thread."""
+
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        self._series = {}  # label values -> [bucket counts..., +Inf count, sum]
+
+    def observe(self, value, *labelvalues):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labelvalues)
+            if series is None:
+                series = self._series[labelvalues] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    def samples(self):
+        with self._lock:
+            snapshot = {labels: list(series) for labels, series in self._series.items()}
+        for labels, series in sorted(snapshot.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), series):
+                cumulative += count
+                yield (self.name + '_bucket',
+                       _format_labels(self.labelnames, labels, [('le', _format_value(float(bound)))]), cumulative)
+            yield self.name + '_count', _format_labels(self.labelnames, labels), cumulative
+            yield self.name + '_sum', _format_labels(self.labelnames, labels), round(series[-1], 6)
+
+
+class Counter:
+    """Monotonic counter with optional labels."""
+
+    kind = 'counter'
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def inc(self, *labelvalues, amount=1):
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            snapshot = dict(self._values)
+        for labels, value in sorted(snapshot.items()):
+            yield self.name, _format_labels(self.labelnames, labels), value
+
+
+class MetricsRegistry:
+    """Holds metrics and stats collectors and renders them in the Prometheus text format."""
+
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name, help_text, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self.register(Histogram(name, help_text, labelnames, buckets))
+
+    def counter(self, name, help_text, labelnames=()):
+        return self.register(Counter(name, help_text, labelnames))
+
+    def register_stats(self, prefix, stats_func, counters=()):
+        """Exports a component's ``stats()`` dict: keys in ``counters`` as counters, the rest as gauges."""
+        self._collectors.append((prefix, stats_func, frozenset(counters)))
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.append(f'# HELP {metric.name} {metric.help_text}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            lines.extend(f'{name}{labels} {_format_value(value)}' for name, labels, value in metric.samples())
+        for prefix, stats_func, counters in self._collectors:
+            try:
+                stats = stats_func()
+            except Exception as err:  # a broken collector must not take /metrics down
+                print(f"Error collecting {prefix} stats: {err}")
+                continue
+            for key, value in stats.items():
+                if not isinstance(value, (int, float)) or isinstance(value, bool):
+                    continue
+                if key in counters:
+                    name, kind = f'{prefix}_{key}_total', 'counter'
+                else:
+                    name, kind = f'{prefix}_{key}', 'gauge'
+                lines.append(f'# TYPE {name} {kind}')
+                lines.append(f'{name} {_format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
+REQUEST_SECONDS = registry.histogram(
+    'http_request_duration_seconds', "Time from request start until the view returned",
+    ('endpoint', 'method', 'status'))
+REQUEST_QUERIES = registry.histogram(
+    'http_request_db_queries', "SQL statements executed per request", ('endpoint',), COUNT_BUCKETS)
+DB_CONNECT_SECONDS = registry.histogram('db_connect_seconds', "Time to check out a database connection")
+DB_QUERY_SECONDS = registry.histogram('db_query_seconds', "Time spent in cursor.execute()", ('statement',))
+DB_FETCH_SECONDS = registry.histogram('db_fetch_seconds', "Time spent fetching result rows", ('statement',))
+DB_ERRORS = registry.counter('db_errors_total', "Failed cursor.execute() calls", ('statement',))
+TEMPLATE_SECONDS = registry.histogram('template_render_seconds', "Jinja render time", ('template',))
+
+
+# --- Per-request timing ---
+
+class RequestTiming:
+    """What one request spent its time on; kept on ``flask.g``."""
+
+    __slots__ = ('started', 'connect_seconds', 'render_seconds', 'queries', '_render_started')
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.connect_seconds = 0.0
+        self.render_seconds = 0.0
+        self.queries = []  # [statement, sql, execute seconds, fetch seconds]
+        self._render_started = {}
+
+
+def _current_timing():
+    if has_request_context():
+        return g.get('request_timing')
+    return None
+
+
+def _statement_type(sql):
+    head = sql.lstrip().split(None, 1)
+    return head[0].upper() if head else 'UNKNOWN'
+
+
+class InstrumentedCursor:
+    """Times execute/fetch calls on a cursor; everything else is forwarded."""
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+        self._query = None
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __iter__(self):
+        return iter(self.fetchone, None)
+
+    def _execute(self, method, operation, *args, **kwargs):
+        statement = _statement_type(operation)
+        started = time.perf_counter()
+        try:
+            return method(operation, *args, **kwargs)
+        except Exception:
+            DB_ERRORS.inc(statement)
+            raise
+        finally:
+            self._executed(statement, operation, started)
+
+    def _executed(self, statement, operation, started):
+        elapsed = time.perf_counter() - started
+        DB_QUERY_SECONDS.observe(elapsed, statement)
+        self._query = [statement, operation, elapsed, 0.0]
+        timing = _current_timing()
+        if timing is not None:
+            timing.queries.append(self._query)
+
+    def execute(self, operation, *args, **kwargs):
+        return self._execute(self._cursor.execute, operation, *args, **kwargs)
+
+    def executemany(self, operation, *args, **kwargs):
+        return self._execute(self._cursor.executemany, operation, *args, **kwargs)
+
+    def _fetch(self, method, *args):
+        started = time.perf_counter()
+        try:
+            return method(*args)
+        finally:
+            self._fetched(started)
+
+    def _fetched(self, started):
+        elapsed = time.perf_counter() - started
+        query = self._query
+        if query is not None:
+            query[3] += elapsed
+            DB_FETCH_SECONDS.observe(elapsed, query[0])
+
+    def fetchone(self):
+        return self._fetch(self._cursor.fetchone)
+
+    def fetchmany(self, size=1):
+        return self._fetch(self._cursor.fetchmany, size)
+
+    def fetchall(self):
+        return self._fetch(self._cursor.fetchall)
+
+
+class InstrumentedConnection:
+    """Hands out InstrumentedCursors; every other attribute goes to the wrapped connection."""
+
+    def __init__(self, conn):
+        self._conn = conn
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def cursor(self, *args, **kwargs):
+        return InstrumentedCursor(self._conn.cursor(*args, **kwargs))
+
+    def close(self):
+        self._conn.close()
+
+
+def instrument_connection(conn):
+    return InstrumentedConnection(conn)
+
+
+class AsyncInstrumentedCursor(InstrumentedCursor):
+    """InstrumentedCursor for mysql.connector.aio cursors: execute and fetch calls are awaited and timed."""
+
+    async def _execute(self, method, operation, *args, **kwargs):
+        statement = _statement_type(operation)
+        started = time.perf_counter()
+        try:
+            return await method(operation, *args, **kwargs)
+        except Exception:
+            DB_ERRORS.inc(statement)
+            raise
+        finally:
+            self._executed(statement, operation, started)
+
+    async def _fetch(self, method, *args):
+        started = time.perf_counter()
+        try:
+            return await method(*args)
+        finally:
+            self._fetched(started)
+
+
+class AsyncInstrumentedConnection(InstrumentedConnection):
+    """InstrumentedConnection for async connections (async_db_pool)."""
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def cursor(self, *args, **kwargs):
+        return AsyncInstrumentedCursor(await self._conn.cursor(*args, **kwargs))
+
+    async def close(self):
+        await self._conn.close()
+
+
+def instrument_async_connection(conn):
+    return AsyncInstrumentedConnection(conn)
+
+
+def observe_connect(seconds):
+    DB_CONNECT_SECONDS.observe(seconds)
+    timing = _current_timing()
+    if timing is not None:
+        timing.connect_seconds += seconds
+
+
+# --- Flask wiring ---
+
+def _on_before_render(sender, template, context, **extra):
+    timing = _current_timing()
+    if timing is not None:
+        timing._render_started[id(template)] = time.perf_counter()
+
+
+def _on_rendered(sender, template, context, **extra):
+    timing = _current_timing()
+    if timing is None:
+        return
+    started = timing._render_started.pop(id(template), None)
+    if started is not None:
+        elapsed = time.perf_counter() - started
+        timing.render_seconds += elapsed
+        TEMPLATE_SECONDS.observe(elapsed, template.name or 'unknown')
+
+
+def _open_slow_request_log(log_path):
+    """Sends the slow log to ``log_path`` too, from the first slow request on (so after any fork)."""
+    if log_path and not slow_request_log.handlers:
+        handler = logging.FileHandler(log_path)
+        handler.setFormatter(logging.Formatter('%(asctime)s %(message)s'))
+        slow_request_log.addHandler(handler)
+
+
+def _log_slow_request(timing, endpoint, status, elapsed):
+    entry = {
+        'method': request.method,
+        'path': request.path,
+        'endpoint': endpoint,
+        'status': status,
+        'total_ms': round(elapsed * 1000, 2),
+        'connect_ms': round(timing.connect_seconds * 1000, 2),
+        'render_ms': round(timing.render_seconds * 1000, 2),
+        'db_ms': round(sum(q[2] + q[3] for q in timing.queries) * 1000, 2),
+        'queries': [{'sql': ' '.join(q[1].split())[:SLOW_LOG_MAX_SQL],
+                     'execute_ms': round(q[2] * 1000, 2), 'fetch_ms': round(q[3] * 1000, 2)}
+                    for q in timing.queries],
+    }
+    slow_request_log.warning(json.dumps(entry))
+
+
+def init_metrics(app):
+    """Installs the request hooks and template signals on app. Returns the registry."""
+    @app.before_request
+    def _start_request_timing():
+        g.request_timing = RequestTiming()
+
+    @app.after_request
+    def _record_request_timing(response):
+        timing = g.pop('request_timing', None)
+        if timing is None:
+            return response
+        elapsed = time.perf_counter() - timing.started
+        endpoint = request.endpoint or 'unmatched'
+        REQUEST_SECONDS.observe(elapsed, endpoint, request.method, str(response.status_code))
+        REQUEST_QUERIES.observe(len(timing.queries), endpoint)
+        slow_seconds = app.config.get('SLOW_REQUEST_SECONDS')
+        if slow_seconds is not None and elapsed >= slow_seconds:
+            _open_slow_request_log(app.config.get('SLOW_REQUEST_LOG'))
+            _log_slow_request(timing, endpoint, response.status_code, elapsed)
+        return response
+
+    before_render_template.connect(_on_before_render, app)
+    template_rendered.connect(_on_rendered, app)
+    return registry
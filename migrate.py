@@ -0,0 +1,140 @@
+"""Schema migrations and data backfills for green_journey_db.
+
+    python migrate.py upgrade            # apply pending migrations/*.sql in order
+    python migrate.py status             # list applied and pending migrations
+    python migrate.py backfill           # fill journeys.co2_kg / duration_minutes
+
+Applied migrations are recorded in a ``schema_migrations`` table. The
+backfill walks ``journeys`` by primary key in small batches, committing after
+each one, so it never holds long locks on large tables and can be stopped and
+resumed at any time.
+"""
+import argparse
+import os
+import time
+
+import mysql.connector
+
+from journey_metrics import parse_carbon_footprint, parse_duration_to_minutes
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migrations')
+
+
+def get_connection():
+    from app import load_config
+    DB_CONFIG = load_config()['DB']
+    return mysql.connector.connect(**DB_CONFIG)
+
+
+def split_statements(sql):
+    """Splits a migration file into statements, dropping comment-only lines."""
+    lines = [line for line in sql.splitlines() if not line.strip().startswith('--')]
+    return [stmt.strip() for stmt in '\n'.join(lines).split(';') if stmt.strip()]
+
+
+def list_migrations():
+    return sorted(name for name in os.listdir(MIGRATIONS_DIR) if name.endswith('.sql'))
+
+
+def applied_migrations(conn):
+    cursor = conn.cursor()
+    try:
+        cursor.execute(
+            "CREATE TABLE IF NOT EXISTS schema_migrations ("
+            " version VARCHAR(255) PRIMARY KEY,"
+            " applied_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP)")
+        cursor.execute("SELECT version FROM schema_migrations")
+        return {version for (version,) in cursor.fetchall()}
+    finally:
+        cursor.close()
+
+
+def upgrade(conn):
+    done = applied_migrations(conn)
+    pending = [name for name in list_migrations() if name not in done]
+    if not pending:
+        print("Schema is up to date.")
+        return
+    cursor = conn.cursor()
+    try:
+        for name in pending:
+            with open(os.path.join(MIGRATIONS_DIR, name)) as f:
+                statements = split_statements(f.read())
+            print(f"Applying {name} ({len(statements)} statements)")
+            for statement in statements:
+                cursor.execute(statement)
+            cursor.execute("INSERT INTO schema_migrations (version) VALUES (%s)", (name,))
+            conn.commit()
+    finally:
+        cursor.close()
+
+
+def status(conn):
+    done = applied_migrations(conn)
+    for name in list_migrations():
+        print(f"[{'x' if name in done else ' '}] {name}")
+
+
+def backfill_journey_metrics(conn, batch_size=1000, pause=0.05):
+    """Fills co2_kg and duration_minutes for rows that do not have them yet.
+
+    Walks the table by id (keyset, no OFFSET) and commits after every batch so
+    row locks are held only for one small UPDATE at a time.
+    """
+    read_cursor = conn.cursor()
+    write_cursor = conn.cursor()
+    last_id = 0
+    updated = 0
+    started = time.perf_counter()
+    try:
+        while True:
+            read_cursor.execute(
+                "SELECT id, carbon_footprint, duration FROM journeys"
+                " WHERE id > %s AND (co2_kg IS NULL OR duration_minutes IS NULL)"
+                " ORDER BY id LIMIT %s",
+                (last_id, batch_size))
+            rows = read_cursor.fetchall()
+            if not rows:
+                break
+            write_cursor.executemany(
+                "UPDATE journeys SET co2_kg = %s, duration_minutes = %s WHERE id = %s",
+                [(parse_carbon_footprint(cf), parse_duration_to_minutes(duration), journey_id)
+                 for journey_id, cf, duration in rows])
+            conn.commit()
+            updated += len(rows)
+            last_id = rows[-1][0]
+            print(f"  backfilled {updated} rows (last id {last_id})")
+            if pause:
+                time.sleep(pause)
+    finally:
+        read_cursor.close()
+        write_cursor.close()
+    elapsed = time.perf_counter() - started
+    print(f"Backfill complete: {updated} rows in {elapsed:.1f}s")
+    return updated
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Green Journey Advisor schema migrations")
+    sub = parser.add_subparsers(dest='command', required=True)
+    sub.add_parser('upgrade', help="apply pending migrations")
+    sub.add_parser('status', help="show applied and pending migrations")
+    backfill = sub.add_parser('backfill', help="fill journeys.co2_kg and journeys.duration_minutes")
+    backfill.add_argument('--batch-size', type=int, default=1000)
+    backfill.add_argument('--pause', type=float, default=0.05, help="seconds to sleep between batches")
+    args = parser.parse_args()
+
+    conn = get_connection()
+    try:
+        if args.command == 'upgrade':
+            upgrade(conn)
+        elif args.command == 'status':
+            status(conn)
+        elif args.command == 'backfill':
+            backfill_journey_metrics(conn, args.batch_size, args.pause)
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,38 @@
+-- Tables as app.py first used them, so a fresh database can be built with `python migrate.py upgrade`.
+-- Existing databases already have them; IF NOT EXISTS makes this a no-op there. Later migrations
+-- add columns (0001, 0003, 0004) and the query indexes (0005).
+CREATE TABLE IF NOT EXISTS users (
+    id INT NOT NULL AUTO_INCREMENT PRIMARY KEY,
+    username VARCHAR(50) NOT NULL,
+    password_hash VARCHAR(255) NOT NULL,
+    email VARCHAR(100) NOT NULL,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    UNIQUE KEY uq_users_username (username),
+    UNIQUE KEY uq_users_email (email)
+);
+
+CREATE TABLE IF NOT EXISTS journeys (
+    id INT NOT NULL AUTO_INCREMENT PRIMARY KEY,
+    origin VARCHAR(100) NOT NULL,
+    destination VARCHAR(100) NOT NULL,
+    mode VARCHAR(50) NOT NULL,
+    price DECIMAL(10, 2) NOT NULL,
+    duration VARCHAR(50),
+    carbon_footprint VARCHAR(50),
+    description TEXT
+);
+
+CREATE TABLE IF NOT EXISTS bookings (
+    id INT NOT NULL AUTO_INCREMENT PRIMARY KEY,
+    user_id INT NOT NULL,
+    journey_id INT NOT NULL,
+    passengers INT NOT NULL DEFAULT 1,
+    total_price DECIMAL(10, 2) NOT NULL,
+    booking_date DATETIME NOT NULL,
+    booked_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    payment_method VARCHAR(50),
+    payment_status VARCHAR(20) NOT NULL DEFAULT 'completed',
+    transaction_id VARCHAR(50) NOT NULL,
+    CONSTRAINT fk_bookings_user FOREIGN KEY (user_id) REFERENCES users (id),
+    CONSTRAINT fk_bookings_journey FOREIGN KEY (journey_id) REFERENCES journeys (id)
+);
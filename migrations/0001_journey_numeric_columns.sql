@@ -0,0 +1,7 @@
+-- Typed copies of journeys.carbon_footprint ("12.3 kg CO2e") and journeys.duration ("1h 30m")
+-- so routes stop parsing strings on every request.
+-- Nullable columns are added online; `python migrate.py backfill` fills them in batches.
+ALTER TABLE journeys
+    ADD COLUMN co2_kg DECIMAL(10, 3) NULL,
+    ADD COLUMN duration_minutes SMALLINT UNSIGNED NULL,
+    ALGORITHM=INPLACE, LOCK=NONE;
@@ -0,0 +1,12 @@
+-- Per-user running totals shown on /account, maintained by payment, cancel_booking and modify_booking.
+-- Totals cover non-cancelled bookings dated before settled_through; /account rolls the window
+-- forward to today by aggregating only the bookings that became past since the last visit.
+-- `python user_stats.py rebuild` recomputes every row from bookings.
+CREATE TABLE IF NOT EXISTS user_travel_stats (
+    user_id INT NOT NULL PRIMARY KEY,
+    past_trips INT NOT NULL DEFAULT 0,
+    past_co2_kg DECIMAL(14, 3) NOT NULL DEFAULT 0,
+    past_spend DECIMAL(14, 2) NOT NULL DEFAULT 0,
+    settled_through DATE NOT NULL,
+    updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+);
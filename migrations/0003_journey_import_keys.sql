@@ -0,0 +1,16 @@
+-- Natural key for journeys loaded by `python import_journeys.py`: the feed name plus the feed's own id
+-- for the service (or origin|destination|mode when the feed has none). Re-importing a feed updates
+-- rows in place through ON DUPLICATE KEY UPDATE. Hand-entered rows keep NULLs and are never matched.
+ALTER TABLE journeys
+    ADD COLUMN source VARCHAR(50) NULL,
+    ADD COLUMN external_ref VARCHAR(191) NULL,
+    ADD UNIQUE KEY uq_journeys_source_ref (source, external_ref),
+    ALGORITHM=INPLACE, LOCK=NONE;
+
+-- Bumped by writers of shared reference data so every app worker can drop its in-memory copies
+-- (route catalog, planner graph, search cache) without waiting for their TTLs.
+CREATE TABLE IF NOT EXISTS dataset_versions (
+    name VARCHAR(50) NOT NULL PRIMARY KEY,
+    version BIGINT UNSIGNED NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+);
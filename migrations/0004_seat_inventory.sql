@@ -0,0 +1,31 @@
+-- Seats per journey and travel date. Rows are created on first use with seats_left = capacity minus
+-- the passengers already booked that day; bookings and holds then take seats with a conditional
+-- `UPDATE ... SET seats_left = seats_left - n WHERE seats_left >= n`, which locks only that one row.
+-- journeys.seat_capacity overrides the app's DEFAULT_SEAT_CAPACITY for a service.
+ALTER TABLE journeys
+    ADD COLUMN seat_capacity SMALLINT UNSIGNED NULL,
+    ALGORITHM=INPLACE, LOCK=NONE;
+
+CREATE TABLE IF NOT EXISTS journey_inventory (
+    journey_id INT NOT NULL,
+    travel_date DATE NOT NULL,
+    capacity INT NOT NULL,
+    seats_left INT NOT NULL,
+    PRIMARY KEY (journey_id, travel_date)
+);
+
+-- Seats taken at select_journey and kept until payment or expiry; expired holds are
+-- returned to journey_inventory by the hold sweeper (`python seat_inventory.py release-expired`).
+CREATE TABLE IF NOT EXISTS seat_holds (
+    id BIGINT NOT NULL AUTO_INCREMENT PRIMARY KEY,
+    hold_token CHAR(32) NOT NULL,
+    journey_id INT NOT NULL,
+    travel_date DATE NOT NULL,
+    seats INT NOT NULL,
+    expires_at DATETIME NOT NULL,
+    UNIQUE KEY uq_seat_holds_token (hold_token),
+    KEY idx_seat_holds_expires (expires_at)
+);
+
+-- Seats taken by existing bookings are counted when an inventory row is first created
+CREATE INDEX idx_bookings_journey_date ON bookings (journey_id, booking_date);
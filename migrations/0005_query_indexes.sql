@@ -0,0 +1,25 @@
+-- Indexes behind the hot queries; benchmarks/check_query_plans.py EXPLAINs every route query and fails
+-- on a full table scan or filesort.
+--
+-- journeys
+--   idx_journeys_route           search filters (origin, destination, mode IN ...); covers the
+--                                SELECT DISTINCT origin, destination of the route catalog
+--   idx_journeys_route_price     ORDER BY price, id      ('cheapest', keyset pages)
+--   idx_journeys_route_duration  ORDER BY duration_minutes, id   ('fastest')
+--   idx_journeys_route_co2       ORDER BY co2_kg, id     ('lowest_co2')
+--   (InnoDB appends the primary key to secondary indexes, so ", id" is already in index order.)
+ALTER TABLE journeys
+    ADD INDEX idx_journeys_route (origin, destination, mode),
+    ADD INDEX idx_journeys_route_price (origin, destination, price),
+    ADD INDEX idx_journeys_route_duration (origin, destination, duration_minutes),
+    ADD INDEX idx_journeys_route_co2 (origin, destination, co2_kg),
+    ALGORITHM=INPLACE, LOCK=NONE;
+
+-- bookings
+--   idx_bookings_user_date  /account history (WHERE user_id ORDER BY booking_date) and the
+--                           user_travel_stats date-range aggregates
+--   idx_bookings_txn_user   confirmation, view/cancel/modify by (transaction_id, user_id)
+ALTER TABLE bookings
+    ADD INDEX idx_bookings_user_date (user_id, booking_date),
+    ADD INDEX idx_bookings_txn_user (transaction_id, user_id),
+    ALGORITHM=INPLACE, LOCK=NONE;
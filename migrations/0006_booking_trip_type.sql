@@ -0,0 +1,10 @@
+-- The trip type (one_way/return) each booking was quoted for, so modify_booking no longer guesses it
+-- from total_price. Existing bookings get the old guess once: more than 1.5x the one-way fare is a return.
+ALTER TABLE bookings
+    ADD COLUMN journey_type VARCHAR(10) NOT NULL DEFAULT 'one_way',
+    ALGORITHM=INPLACE, LOCK=NONE;
+
+UPDATE bookings b
+JOIN journeys j ON b.journey_id = j.id
+SET b.journey_type = 'return'
+WHERE b.total_price > j.price * b.passengers * 1.5;
@@ -0,0 +1,15 @@
+-- Background jobs (job_queue.py). Requests insert a row in the same transaction as the write that
+-- caused it, so a job exists if and only if that write committed. Workers claim ready rows by moving
+-- run_at forward by their lease; a job whose worker dies is claimed again when the lease runs out.
+-- Finished jobs are deleted; jobs that fail max_attempts times stay behind with status 'dead'.
+CREATE TABLE IF NOT EXISTS jobs (
+    id BIGINT NOT NULL AUTO_INCREMENT PRIMARY KEY,
+    kind VARCHAR(50) NOT NULL,
+    payload TEXT NOT NULL,
+    status VARCHAR(10) NOT NULL DEFAULT 'queued',
+    attempts SMALLINT NOT NULL DEFAULT 0,
+    run_at DATETIME(6) NOT NULL,
+    created_at DATETIME(6) NOT NULL,
+    last_error VARCHAR(500) NULL,
+    KEY idx_jobs_status_run_at (status, run_at)
+);
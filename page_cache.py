@@ -0,0 +1,205 @@
+"""Response caching for the static content pages, fingerprinted assets and compression.
+
+PageCache
+    help, about and why_us differ between visitors only in the header
+    (logged in or not, and the username). Each page is rendered once per
+    process in two variants: logged out, and logged in with a placeholder
+    where the username goes. Later hits splice the escaped username into the
+    cached body instead of running Jinja. With ``TEMPLATES_AUTO_RELOAD`` or
+    debug on, pages are rendered on every request as before.
+
+Static fingerprints
+    ``url_for('static', filename=...)`` gets ``?v=<content hash>``; requests
+    carrying the current hash are served with a one-year ``immutable``
+    Cache-Control, so browsers never revalidate style.css until it changes.
+
+Compression
+    Text responses are compressed with brotli (when the ``brotli`` package is
+    installed and the client accepts it) or gzip. Bodies that repeat, such as
+    cached pages and static assets, keep their compressed bytes in an LRU so
+    they are compressed once; other responses are compressed per request.
+    Streamed responses (NDJSON search API) are left alone.
+"""
+import gzip
+import hashlib
+import os
+import secrets
+import threading
+from collections import OrderedDict
+
+from flask import g, render_template, request
+from markupsafe import escape
+
+try:
+    import brotli
+except ImportError:  # optional: gzip only
+    brotli = None
+
+COMPRESSIBLE_MIMETYPES = {'text/html', 'text/css', 'text/plain', 'text/javascript', 'application/javascript',
+                          'application/json', 'image/svg+xml'}
+MIN_COMPRESS_BYTES = 512
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+
+class PageCache:
+    """Renders per-visitor-static templates once and fills in the username per request."""
+
+    def __init__(self, app):
+        self.app = app
+        self._placeholder = f"__page_cache_username_{secrets.token_hex(8)}__"
+        self._lock = threading.Lock()
+        self._bodies = {}  # (template, logged_in) -> (before, after) around the username placeholder
+
+    def _enabled(self):
+        return not (self.app.debug or self.app.config.get('TEMPLATES_AUTO_RELOAD'))
+
+    def _variant(self, template_name, logged_in):
+        key = (template_name, logged_in)
+        body = self._bodies.get(key)
+        if body is None:
+            html = render_template(template_name, user_id=1 if logged_in else None,
+                                   username=self._placeholder if logged_in else None)
+            # Split once so serving is a join, not a search-and-replace
+            body = tuple(html.split(self._placeholder)) if logged_in else (html,)
+            with self._lock:
+                self._bodies[key] = body
+        return body
+
+    def render(self, template_name, user_id=None, username=None):
+        """Response for a page whose only per-visitor parts are ``user_id`` (truthiness) and ``username``."""
+        if not self._enabled():
+            return self.app.make_response(render_template(template_name, user_id=user_id, username=username))
+        logged_in = bool(user_id)
+        parts = self._variant(template_name, logged_in)
+        html = str(escape(username or '')).join(parts) if logged_in else parts[0]
+        response = self.app.make_response(html)
+        response.set_etag(hashlib.sha1(response.get_data()).hexdigest(), weak=True)
+        # Same body for every anonymous visitor; per user otherwise
+        g.compressed_body_key = ('page', template_name, username if logged_in else None)
+        return response.make_conditional(request)
+
+    def clear(self):
+        with self._lock:
+            self._bodies.clear()
+
+
+# --- Compression ---
+
+class CompressedBodyCache:
+    """Thread-safe LRU of compressed response bodies keyed by (body key, encoding)."""
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+
+    def get_or_compress(self, key, encoding, data):
+        cache_key = (key, encoding)
+        with self._lock:
+            body = self._entries.get(cache_key)
+            if body is not None:
+                self._entries.move_to_end(cache_key)
+                self._stats['hits'] += 1
+                return body
+            self._stats['misses'] += 1
+        body = compress(data, encoding, best=True)
+        with self._lock:
+            self._entries[cache_key] = body
+            self._entries.move_to_end(cache_key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats['evictions'] += 1
+        return body
+
+    def stats(self):
+        with self._lock:
+            snapshot = dict(self._stats)
+            snapshot['size'] = len(self._entries)
+        return snapshot
+
+
+def compress(data, encoding, best=False):
+    """Compresses with 'br' or 'gzip'; ``best`` trades CPU for size for bodies that are cached."""
+    if encoding == 'br':
+        return brotli.compress(data, quality=11 if best else 4)
+    return gzip.compress(data, compresslevel=9 if best else 6, mtime=0)
+
+
+def choose_encoding(accept_encodings):
+    """'br', 'gzip' or None from the request's Accept-Encoding."""
+    if brotli is not None and accept_encodings.quality('br') > 0:
+        return 'br'
+    if accept_encodings.quality('gzip') > 0:
+        return 'gzip'
+    return None
+
+
+# --- Static fingerprints ---
+
+class StaticFingerprints:
+    """Content hashes of files in the static folder, computed once per file (per deploy)."""
+
+    def __init__(self, app):
+        self.app = app
+        self._hashes = {}
+
+    def get(self, filename):
+        if filename in self._hashes and not self.app.debug:
+            return self._hashes[filename]
+        path = os.path.join(self.app.static_folder or '', filename)
+        try:
+            with open(path, 'rb') as f:
+                digest = hashlib.sha256(f.read()).hexdigest()[:12]
+        except OSError:
+            digest = None  # missing file: leave its URL unversioned
+        self._hashes[filename] = digest
+        return digest
+
+
+def init_response_cache(app, compressed_cache_entries=1024):
+    """Installs static fingerprinting and response compression on app. Returns (PageCache, CompressedBodyCache)."""
+    fingerprints = StaticFingerprints(app)
+    compressed_cache = CompressedBodyCache(compressed_cache_entries)
+
+    @app.url_defaults
+    def _add_static_fingerprint(endpoint, values):
+        if endpoint == 'static' and 'filename' in values and 'v' not in values:
+            digest = fingerprints.get(values['filename'])
+            if digest:
+                values['v'] = digest
+
+    @app.after_request
+    def _cache_and_compress(response):
+        static = request.endpoint == 'static'
+        if static and response.status_code in (200, 304):
+            filename = (request.view_args or {}).get('filename')
+            version = request.args.get('v')
+            if version and version == fingerprints.get(filename):
+                response.headers['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+                response.headers.pop('Expires', None)
+                g.compressed_body_key = ('static', filename, version)
+
+        if (response.status_code != 200 or response.mimetype not in COMPRESSIBLE_MIMETYPES
+                or 'Content-Encoding' in response.headers or response.is_streamed and not static):
+            return response
+        response.vary.add('Accept-Encoding')
+        encoding = choose_encoding(request.accept_encodings)
+        if encoding is None:
+            return response
+        if static:
+            response.direct_passthrough = False  # read the file so it can be compressed
+        data = response.get_data()
+        if len(data) < MIN_COMPRESS_BYTES:
+            return response
+        key = g.get('compressed_body_key')
+        body = compressed_cache.get_or_compress(key, encoding, data) if key else compress(data, encoding)
+        response.set_data(body)
+        response.headers['Content-Encoding'] = encoding
+        # Weak, so If-None-Match still matches whichever encoding the client cached
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            response.set_etag(etag, weak=True)
+        return response
+
+    return PageCache(app), compressed_cache
@@ -0,0 +1,154 @@
+"""In-memory origin -> destinations catalog.
+
+The set of routes in ``journeys`` changes rarely, but the homepage and the
+``/get_destinations`` AJAX call used to query it on every hit. The catalog
+keeps a prebuilt adjacency dict in memory, reloads it after ``ttl_seconds``
+and can be invalidated explicitly whenever journeys are written.
+
+It also answers city autocomplete (see city_index.py): origins are ranked by
+the bookings on all their routes, destinations by the bookings on the route
+from the chosen origin. Each origin's destination index is built on first use
+and dropped with the rest of the catalog on refresh.
+"""
+import threading
+import time
+
+from city_index import CityIndex
+
+
+class RouteCatalog:
+    """Caches the route adjacency produced by ``load_func``.
+
+    ``load_func`` returns an iterable of ``(origin, destination)`` pairs,
+    optionally followed by the route's popularity, or ``None`` if the database
+    could not be reached, in which case the previous catalog (if any) keeps
+    being served.
+    """
+
+    def __init__(self, load_func, ttl_seconds=300):
+        self._load_func = load_func
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._adjacency = None
+        self._origins = []
+        self._route_popularity = {}
+        self._origin_index = CityIndex({})
+        self._destination_indexes = {}
+        self._loaded_at = 0.0
+        self._stats = {'hits': 0, 'misses': 0, 'refreshes': 0, 'load_errors': 0, 'invalidations': 0}
+
+    # --- Lookups ---
+
+    def origins(self):
+        """Sorted list of every origin city."""
+        self._ensure_fresh()
+        return self._origins
+
+    def destinations(self, origin):
+        """Sorted list of destinations reachable directly from ``origin``."""
+        adjacency = self._ensure_fresh()
+        return adjacency.get(origin, [])
+
+    def adjacency(self):
+        """The full origin -> sorted destinations dict (do not mutate)."""
+        return self._ensure_fresh()
+
+    def complete_origins(self, query, limit=10):
+        """Origin cities for a partly typed name, most popular first."""
+        self._ensure_fresh()
+        return self._origin_index.complete(query, limit)
+
+    def complete_destinations(self, origin, query, limit=10):
+        """Cities reachable directly from ``origin`` for a partly typed name, most booked route first."""
+        adjacency = self._ensure_fresh()
+        with self._lock:
+            index = self._destination_indexes.get(origin)
+            popularity = self._route_popularity
+        if index is None:
+            index = CityIndex({destination: popularity.get((origin, destination), 0)
+                               for destination in adjacency.get(origin, ())})
+            with self._lock:
+                if self._adjacency is adjacency:  # not replaced by a refresh meanwhile
+                    self._destination_indexes[origin] = index
+        return index.complete(query, limit)
+
+    # --- Refresh ---
+
+    def invalidate(self):
+        """Force a reload on the next lookup, e.g. after journeys were written."""
+        with self._lock:
+            self._loaded_at = 0.0
+            self._stats['invalidations'] += 1
+
+    def refresh(self):
+        """Reload from the database now. Returns True if the load succeeded."""
+        pairs = self._load_func()
+        if pairs is None:
+            with self._lock:
+                self._stats['load_errors'] += 1
+            return False
+        self.load(pairs)
+        return True
+
+    def load(self, pairs):
+        """Replaces the catalog with ``pairs`` (as returned by ``load_func``), fresh for another ``ttl_seconds``."""
+        adjacency = {}
+        route_popularity = {}
+        origin_popularity = {}
+        for origin, destination, *popularity in pairs:
+            adjacency.setdefault(origin, set()).add(destination)
+            score = int(popularity[0] or 0) if popularity else 0
+            route_popularity[(origin, destination)] = score
+            origin_popularity[origin] = origin_popularity.get(origin, 0) + score
+        adjacency = {origin: sorted(dests) for origin, dests in adjacency.items()}
+        origin_index = CityIndex(origin_popularity)
+        with self._lock:
+            self._adjacency = adjacency
+            self._origins = sorted(adjacency)
+            self._route_popularity = route_popularity
+            self._origin_index = origin_index
+            self._destination_indexes = {}
+            self._loaded_at = time.monotonic()
+            self._stats['refreshes'] += 1
+
+    def is_fresh(self):
+        """True if lookups will be answered from memory without reloading first."""
+        with self._lock:
+            return bool(self._is_fresh())
+
+    def _is_fresh(self):
+        return self._adjacency is not None and self._loaded_at and \
+            time.monotonic() - self._loaded_at < self.ttl_seconds
+
+    def _ensure_fresh(self):
+        with self._lock:
+            if self._is_fresh():
+                self._stats['hits'] += 1
+                return self._adjacency
+            self._stats['misses'] += 1
+            stale = self._adjacency
+        if stale is not None:
+            # Somebody else is already reloading: serve the stale copy meanwhile.
+            if not self._refresh_lock.acquire(blocking=False):
+                return stale
+        else:
+            self._refresh_lock.acquire()
+        try:
+            with self._lock:
+                if self._is_fresh():
+                    return self._adjacency
+            self.refresh()
+        finally:
+            self._refresh_lock.release()
+        return self._adjacency if self._adjacency is not None else {}
+
+    def stats(self):
+        """Hit/miss counters plus the current catalog size."""
+        with self._lock:
+            snapshot = dict(self._stats)
+            snapshot['origins'] = len(self._origins)
+            snapshot['routes'] = sum(len(d) for d in (self._adjacency or {}).values())
+            lookups = snapshot['hits'] + snapshot['misses']
+            snapshot['hit_rate'] = round(snapshot['hits'] / lookups, 4) if lookups else 0.0
+        return snapshot
@@ -0,0 +1,164 @@
+"""Helpers for the versioned JSON search API (``/api/v1/...``).
+
+Search responses are streamed as NDJSON (one JSON object per line) straight
+from an unbuffered database cursor, so a worker holds at most one fetch
+batch in memory no matter how many journeys match.
+"""
+import json
+
+from journey_search import SEARCH_COLUMNS, SORT_COLUMNS, sort_column
+from quotes import TRIP_TYPES, quote_journeys, student_fare_requested
+
+NDJSON_MIMETYPE = 'application/x-ndjson'
+STREAM_FETCH_SIZE = 500
+MAX_BATCH_PAIRS = 100
+JOURNEY_TYPES = TRIP_TYPES
+
+
+class SearchParamsError(ValueError):
+    """Raised for search parameters the API cannot accept."""
+
+
+def parse_search_params(values):
+    """Validates the shared search parameters from a dict-like (request.args or JSON body)."""
+    getlist = getattr(values, 'getlist', None)
+    modes = getlist('mode') if getlist else values.get('mode') or []
+    if isinstance(modes, str):
+        modes = [modes]
+    sort_by = values.get('sort', 'cheapest')
+    if sort_by not in SORT_COLUMNS:
+        raise SearchParamsError(f"sort must be one of {', '.join(SORT_COLUMNS)}")
+    journey_type = values.get('journey_type', 'one_way')
+    if journey_type not in JOURNEY_TYPES:
+        raise SearchParamsError(f"journey_type must be one of {', '.join(JOURNEY_TYPES)}")
+    try:
+        passengers = int(values.get('passengers', 1))
+    except (TypeError, ValueError):
+        raise SearchParamsError("passengers must be an integer")
+    if passengers < 1:
+        raise SearchParamsError("passengers must be at least 1")
+    limit = values.get('limit')
+    if limit is not None:
+        try:
+            limit = int(limit)
+        except (TypeError, ValueError):
+            raise SearchParamsError("limit must be an integer")
+        if limit < 1:
+            raise SearchParamsError("limit must be at least 1")
+    return {
+        'modes': list(modes),
+        'sort_by': sort_by,
+        'journey_type': journey_type,
+        'passengers': passengers,
+        'student_discount': student_fare_requested(values),
+        'limit': limit,
+    }
+
+
+def parse_batch_pairs(body):
+    """Validates ``{"pairs": [[origin, destination], ...]}`` from a batch request body."""
+    pairs = body.get('pairs') if isinstance(body, dict) else None
+    if not isinstance(pairs, list) or not pairs:
+        raise SearchParamsError("pairs must be a non-empty list of [origin, destination]")
+    if len(pairs) > MAX_BATCH_PAIRS:
+        raise SearchParamsError(f"at most {MAX_BATCH_PAIRS} pairs per batch")
+    cleaned = []
+    for pair in pairs:
+        if not (isinstance(pair, (list, tuple)) and len(pair) == 2 and all(isinstance(c, str) and c for c in pair)):
+            raise SearchParamsError("each pair must be [origin, destination]")
+        cleaned.append((pair[0], pair[1]))
+    # Keep the first occurrence of each pair, in request order
+    return list(dict.fromkeys(cleaned))
+
+
+def _mode_filter(modes, params):
+    if not modes:
+        return ""
+    params.extend(modes)
+    return f" AND mode IN ({', '.join(['%s'] * len(modes))})"
+
+
+def _order_by(sort_by, leading=""):
+    column, _ = sort_column(sort_by)
+    return f" ORDER BY {leading}{column}" + ("" if column == 'id' else ", id")
+
+
+def build_stream_query(origin, destination, search):
+    """Full ordered result set for one origin/destination pair."""
+    params = [origin, destination]
+    query = f"SELECT {SEARCH_COLUMNS} FROM journeys WHERE origin = %s AND destination = %s"
+    query += _mode_filter(search['modes'], params)
+    query += _order_by(search['sort_by'])
+    if search['limit']:
+        query += " LIMIT %s"
+        params.append(search['limit'])
+    return query, tuple(params)
+
+
+def build_batch_query(pairs, search):
+    """One query answering every origin/destination pair, grouped by pair.
+
+    ``limit`` applies per pair and is enforced while streaming.
+    """
+    origins = list(dict.fromkeys(origin for origin, _ in pairs))
+    params = list(origins)
+    for origin, destination in pairs:
+        params.extend([origin, destination])
+    placeholders = ', '.join(['(%s, %s)'] * len(pairs))
+    # The redundant origin IN (...) lets planners that cannot seek on a row-value
+    # IN (SQLite) still walk the route index in order instead of scanning it
+    query = (f"SELECT {SEARCH_COLUMNS} FROM journeys WHERE origin IN ({', '.join(['%s'] * len(origins))})"
+             f" AND (origin, destination) IN ({placeholders})")
+    query += _mode_filter(search['modes'], params)
+    query += _order_by(search['sort_by'], leading="origin, destination, ")
+    return query, tuple(params)
+
+
+def journey_records(rows, search):
+    """JSON-ready records for journey rows, priced for the requested trip in one quote batch.
+
+    Searches have no departure date, so no promotional fares apply.
+    """
+    quotes = quote_journeys((row, None, search['journey_type'], search['passengers'], search['student_discount'])
+                            for row in rows)
+    return [journey_record(row, search, quote) for row, quote in zip(rows, quotes)]
+
+
+def journey_record(row, search, quote):
+    """JSON-ready record for one journey row and its quote."""
+    return {
+        'id': row['id'],
+        'origin': row['origin'],
+        'destination': row['destination'],
+        'mode': row['mode'],
+        'price': round(quote['price'], 2),
+        'total_price': quote['total_price'],
+        'duration_minutes': quote['duration_minutes'],
+        'travel_time': quote['travel_time'],
+        'co2_kg': round(quote['co2_kg'], 3),
+        'student_discount': search['student_discount'],
+        'description': row['description'],
+    }
+
+
+def ndjson_line(obj):
+    return json.dumps(obj, separators=(',', ':')) + '\n'
+
+
+def stream_batches(cursor, fetch_size=STREAM_FETCH_SIZE):
+    """Yields lists of up to fetch_size rows from an unbuffered cursor."""
+    while True:
+        rows = cursor.fetchmany(fetch_size)
+        if not rows:
+            return
+        yield rows
+
+
+async def stream_batches_async(cursor, fetch_size=STREAM_FETCH_SIZE):
+    """stream_batches for an async (mysql.connector.aio) cursor."""
+    while True:
+        rows = await cursor.fetchmany(fetch_size)
+        if not rows:
+            return
+        yield rows
+
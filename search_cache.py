@@ -0,0 +1,67 @@
+"""Bounded LRU + TTL cache for processed search results.
+
+Writing journeys clears the whole cache (see app.on_journeys_changed); the
+TTL bounds how long a worker that has not seen the change yet serves old
+results.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+
+class SearchResultCache:
+    """Thread-safe LRU cache whose entries also expire after ``ttl_seconds``."""
+
+    def __init__(self, max_entries=1024, ttl_seconds=120):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (expires_at, value)
+        self._stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'expirations': 0, 'invalidations': 0}
+
+    @staticmethod
+    def make_key(origin, destination, modes, sort_by, journey_type, student_discount, *extra):
+        """Normalised cache key; mode order does not matter."""
+        return (origin, destination, tuple(sorted(modes or ())), sort_by, journey_type,
+                bool(student_discount)) + tuple(extra)
+
+    def get(self, key):
+        """Returns the cached value, or None on a miss."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._stats['misses'] += 1
+                return None
+            if entry[0] <= time.monotonic():
+                del self._entries[key]
+                self._stats['expirations'] += 1
+                self._stats['misses'] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._stats['hits'] += 1
+            return entry[1]
+
+    def put(self, key, value):
+        """Caches ``value`` for ``key``."""
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats['evictions'] += 1
+
+    # --- Invalidation ---
+
+    def clear(self):
+        with self._lock:
+            self._stats['invalidations'] += len(self._entries)
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            snapshot = dict(self._stats)
+            snapshot['size'] = len(self._entries)
+            snapshot['max_entries'] = self.max_entries
+            lookups = snapshot['hits'] + snapshot['misses']
+            snapshot['hit_rate'] = round(snapshot['hits'] / lookups, 4) if lookups else 0.0
+        return snapshot
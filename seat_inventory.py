@@ -0,0 +1,258 @@
+"""Seat inventory per journey and travel date, with short-lived holds.
+
+Seats are taken with a single conditional UPDATE,
+
+    UPDATE journey_inventory SET seats_left = seats_left - n
+    WHERE journey_id = ? AND travel_date = ? AND seats_left >= n
+
+which either succeeds atomically or matches no row, so two payments can never
+both take the last seat. It locks only that one inventory row, and only until
+the caller's transaction commits, so bookings on a popular journey are not
+serialised behind a ``SELECT ... FOR UPDATE`` on the journey.
+
+select_journey places a hold (takes the seats and records a ``seat_holds``
+row with an expiry); payment converts the hold into the booking inside the
+booking transaction. Holds that are never paid for are returned by
+``release_expired_holds()``, run by ``HoldSweeper`` in each app process or
+from cron with ``python seat_inventory.py release-expired``.
+
+A hold is "live" for exactly as long as its row exists: payment and the
+sweeper both delete it by key and only act when their DELETE matched, so a
+hold that expires during payment is counted once, by whichever commits first.
+"""
+import argparse
+import secrets
+import threading
+from datetime import datetime, timedelta
+
+import mysql.connector
+
+DEFAULT_SEAT_CAPACITY = 200  # journeys.seat_capacity is NULL for most services
+DEFAULT_HOLD_SECONDS = 600
+SWEEP_BATCH_SIZE = 500
+
+
+class SeatsUnavailable(Exception):
+    """Not enough seats left on the journey for the requested date."""
+
+
+def _day_bounds(travel_date):
+    """(day, next day) for a DATE/DATETIME value or 'YYYY-MM-DD...' string. Raises ValueError."""
+    day = datetime.strptime(str(travel_date)[:10], '%Y-%m-%d').date()
+    return day, day + timedelta(days=1)
+
+
+def ensure_inventory(cursor, journey_id, travel_date, default_capacity=DEFAULT_SEAT_CAPACITY):
+    """Creates the (journey, date) inventory row if missing, net of seats already booked that day."""
+    day, next_day = _day_bounds(travel_date)
+    cursor.execute(
+        "INSERT IGNORE INTO journey_inventory (journey_id, travel_date, capacity, seats_left)"
+        " SELECT j.id, %s, COALESCE(j.seat_capacity, %s), COALESCE(j.seat_capacity, %s) - ("
+        "   SELECT COALESCE(SUM(b.passengers), 0) FROM bookings b"
+        "   WHERE b.journey_id = j.id AND b.booking_date >= %s AND b.booking_date < %s"
+        "   AND b.payment_status <> 'cancelled')"
+        " FROM journeys j WHERE j.id = %s",
+        (day, default_capacity, default_capacity, day, next_day, journey_id))
+    return day
+
+
+def _decrement(cursor, journey_id, day, seats):
+    cursor.execute(
+        "UPDATE journey_inventory SET seats_left = seats_left - %s"
+        " WHERE journey_id = %s AND travel_date = %s AND seats_left >= %s",
+        (seats, journey_id, day, seats))
+    return cursor.rowcount == 1
+
+
+def take_seats(conn, journey_id, travel_date, seats, default_capacity=DEFAULT_SEAT_CAPACITY):
+    """Takes seats inside the caller's open transaction on conn. Raises SeatsUnavailable."""
+    if seats < 1:
+        raise ValueError(f"Cannot take {seats} seat(s)")
+    day = _day_bounds(travel_date)[0]
+    cursor = conn.cursor()
+    try:
+        if _decrement(cursor, journey_id, day, seats):
+            return
+        # No inventory row yet (first booking for that day), or sold out
+        cursor.execute("SELECT 1 FROM journey_inventory WHERE journey_id = %s AND travel_date = %s",
+                       (journey_id, day))
+        exists = cursor.fetchone() is not None
+        if not exists:
+            ensure_inventory(cursor, journey_id, day, default_capacity)
+        if exists or not _decrement(cursor, journey_id, day, seats):
+            raise SeatsUnavailable(f"Fewer than {seats} seat(s) left on this journey for {day:%d %b %Y}.")
+    finally:
+        cursor.close()
+
+
+def return_seats(conn, journey_id, travel_date, seats):
+    """Gives seats back (cancellation, modification) inside the caller's open transaction on conn."""
+    day = _day_bounds(travel_date)[0]
+    cursor = conn.cursor()
+    try:
+        cursor.execute(
+            "UPDATE journey_inventory SET seats_left = LEAST(capacity, seats_left + %s)"
+            " WHERE journey_id = %s AND travel_date = %s",
+            (seats, journey_id, day))
+    finally:
+        cursor.close()
+
+
+def seats_left(conn, journey_id, travel_date):
+    """Seats currently left, or None if nobody has booked or held this journey on that date yet."""
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT seats_left FROM journey_inventory WHERE journey_id = %s AND travel_date = %s",
+                       (journey_id, _day_bounds(travel_date)[0]))
+        row = cursor.fetchone()
+        return int(row[0]) if row else None
+    finally:
+        cursor.close()
+
+
+# --- Holds ---
+
+def place_hold(conn, journey_id, travel_date, seats, hold_seconds=DEFAULT_HOLD_SECONDS,
+               default_capacity=DEFAULT_SEAT_CAPACITY):
+    """Takes seats and records a hold; commits. Returns (hold_token, expires_at). Raises SeatsUnavailable."""
+    if seats < 1:
+        raise ValueError(f"Cannot hold {seats} seat(s)")
+    token = secrets.token_hex(16)
+    expires_at = datetime.now().replace(microsecond=0) + timedelta(seconds=hold_seconds)
+    try:
+        take_seats(conn, journey_id, travel_date, seats, default_capacity)
+        cursor = conn.cursor()
+        try:
+            cursor.execute(
+                "INSERT INTO seat_holds (hold_token, journey_id, travel_date, seats, expires_at)"
+                " VALUES (%s, %s, %s, %s, %s)",
+                (token, journey_id, _day_bounds(travel_date)[0], seats, expires_at))
+        finally:
+            cursor.close()
+        conn.commit()
+    except (SeatsUnavailable, mysql.connector.Error):
+        conn.rollback()
+        raise
+    return token, expires_at
+
+
+def _delete_hold(cursor, token):
+    """Deletes the hold; returns (journey_id, travel_date, seats) if it was still live, else None."""
+    cursor.execute("SELECT journey_id, travel_date, seats FROM seat_holds WHERE hold_token = %s FOR UPDATE",
+                   (token,))
+    row = cursor.fetchone()
+    if row is None:
+        return None
+    cursor.execute("DELETE FROM seat_holds WHERE hold_token = %s", (token,))
+    return row if cursor.rowcount == 1 else None
+
+
+def claim_hold(conn, token, journey_id, travel_date, seats, default_capacity=DEFAULT_SEAT_CAPACITY):
+    """Turns a hold into taken seats inside the caller's booking transaction on conn.
+
+    If the hold is gone (expired and swept) or does not match the booking,
+    the seats are taken afresh; raises SeatsUnavailable if they are no longer there.
+    """
+    cursor = conn.cursor()
+    try:
+        held = _delete_hold(cursor, token) if token else None
+    finally:
+        cursor.close()
+    if held is not None:
+        held_journey, held_date, held_seats = held
+        if int(held_journey) == int(journey_id) and str(held_date)[:10] == str(travel_date)[:10] \
+                and int(held_seats) == int(seats):
+            return
+        return_seats(conn, held_journey, held_date, held_seats)
+    take_seats(conn, journey_id, travel_date, seats, default_capacity)
+
+
+def release_hold(conn, token):
+    """Gives a hold's seats back (journey abandoned or reselected); commits. Returns True if it was live."""
+    cursor = conn.cursor()
+    try:
+        held = _delete_hold(cursor, token)
+        if held is not None:
+            return_seats(conn, *held)
+        conn.commit()
+        return held is not None
+    except mysql.connector.Error:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+
+def release_expired_holds(conn, now=None, batch_size=SWEEP_BATCH_SIZE):
+    """Returns the seats of every expired hold, one committed batch at a time. Returns how many were released."""
+    now = now or datetime.now()
+    released = 0
+    cursor = conn.cursor()
+    try:
+        while True:
+            cursor.execute("SELECT hold_token FROM seat_holds WHERE expires_at <= %s ORDER BY expires_at LIMIT %s",
+                           (now, batch_size))
+            tokens = [token for (token,) in cursor.fetchall()]
+            conn.commit()  # end the read snapshot before taking row locks
+            if not tokens:
+                break
+            for token in tokens:
+                held = _delete_hold(cursor, token)
+                if held is not None:
+                    return_seats(conn, *held)
+                    released += 1
+            conn.commit()
+            if len(tokens) < batch_size:
+                break
+    except mysql.connector.Error:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+    return released
+
+
+class HoldSweeper(threading.Thread):
+    """Daemon thread that runs release_expired_holds() every ``interval`` seconds."""
+
+    def __init__(self, connect_func, interval=60):
+        super().__init__(name='seat-hold-sweeper', daemon=True)
+        self._connect_func = connect_func
+        self.interval = interval
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            try:
+                conn = self._connect_func()
+                try:
+                    released = release_expired_holds(conn)
+                finally:
+                    conn.close()
+                if released:
+                    print(f"Hold sweeper released {released} expired seat holds")
+            except mysql.connector.Error as err:
+                print(f"Hold sweeper error: {err}")
+
+    def stop(self):
+        self._stop_event.set()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Seat inventory maintenance")
+    sub = parser.add_subparsers(dest='command', required=True)
+    sub.add_parser('release-expired', help="return the seats of expired holds")
+    args = parser.parse_args()
+
+    from app import load_config
+    DB_CONFIG = load_config()['DB']
+    conn = mysql.connector.connect(**DB_CONFIG)
+    try:
+        if args.command == 'release-expired':
+            print(f"Released {release_expired_holds(conn)} expired holds")
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,370 @@
+"""Pluggable session backends for app.py.
+
+``SESSION_BACKEND`` selects where the session (login, ``selected_journey``
+between select_journey and payment, flash messages) lives:
+
+filesystem  Flask-Session pickle files (the original setup), plus a background
+            sweeper that deletes expired files
+cookie      Flask's signed cookie: nothing stored server-side; the payload is
+            compressed when that makes it smaller. Needs ``SECRET_KEY``.
+memory      per-process dict with expiry; fastest, but sessions are lost on
+            restart and not shared between workers or hosts
+redis       any server speaking the Redis protocol (``SESSION_REDIS_URL``);
+            shared across hosts, expiry handled by the server
+
+Server-side backends put only a random session id in the cookie and store
+the session as tagged JSON (tuples in flash messages survive the round trip).
+"""
+import os
+import secrets
+import socket
+import struct
+import threading
+import time
+from datetime import timedelta
+from urllib.parse import urlparse
+
+from flask.sessions import SessionInterface, SessionMixin, session_json_serializer
+from werkzeug.datastructures import CallbackDict
+
+SESSION_BACKENDS = ('filesystem', 'cookie', 'memory', 'redis')
+DEFAULT_SESSION_LIFETIME = timedelta(hours=12)
+
+
+# --- Stores ---
+
+class MemoryStore:
+    """Thread-safe dict of ``key -> (expires_at, value)``; expired keys are purged lazily."""
+
+    def __init__(self, purge_every=1000):
+        self._lock = threading.Lock()
+        self._data = {}
+        self._writes = 0
+        self._purge_every = purge_every
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= time.monotonic():
+                del self._data[key]
+                return None
+            return entry[1]
+
+    def set(self, key, value, ttl_seconds):
+        with self._lock:
+            self._data[key] = (time.monotonic() + ttl_seconds, value)
+            self._writes += 1
+            if self._writes % self._purge_every == 0:
+                self._purge()
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def _purge(self):
+        now = time.monotonic()
+        for key in [k for k, (expires_at, _) in self._data.items() if expires_at <= now]:
+            del self._data[key]
+
+    def __len__(self):
+        with self._lock:
+            return len(self._data)
+
+
+class RespError(Exception):
+    """Error reply from a Redis-protocol server."""
+
+
+class RedisStore:
+    """Minimal Redis-protocol (RESP) client: just GET, SET ... EX and DEL.
+
+    One socket per thread, so it is safe under threaded WSGI servers without
+    pulling in a client library. Works against Redis, Valkey, KeyDB or a local
+    stand-in.
+    """
+
+    def __init__(self, url='redis://localhost:6379/0', key_prefix='session:', socket_timeout=2.0):
+        parsed = urlparse(url)
+        self.host = parsed.hostname or 'localhost'
+        self.port = parsed.port or 6379
+        self.password = parsed.password
+        self.db = int(parsed.path.lstrip('/') or 0)
+        self.key_prefix = key_prefix
+        self.socket_timeout = socket_timeout
+        self._local = threading.local()
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            sock = socket.create_connection((self.host, self.port), timeout=self.socket_timeout)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            conn = (sock, sock.makefile('rb'))
+            self._local.conn = conn
+            if self.password:
+                self._roundtrip(conn, 'AUTH', self.password)
+            if self.db:
+                self._roundtrip(conn, 'SELECT', str(self.db))
+        return conn
+
+    def _reset(self):
+        conn = getattr(self._local, 'conn', None)
+        self._local.conn = None
+        if conn is not None:
+            try:
+                conn[1].close()
+                conn[0].close()
+            except OSError:
+                pass
+
+    @staticmethod
+    def _encode(*args):
+        out = [b'*%d\r\n' % len(args)]
+        for arg in args:
+            if isinstance(arg, str):
+                arg = arg.encode()
+            out.append(b'$%d\r\n%s\r\n' % (len(arg), arg))
+        return b''.join(out)
+
+    @staticmethod
+    def _read_reply(reader):
+        line = reader.readline()
+        if not line:
+            raise ConnectionError("Connection closed by server")
+        kind, payload = line[:1], line[1:-2]
+        if kind == b'+':
+            return payload
+        if kind == b'-':
+            raise RespError(payload.decode())
+        if kind == b':':
+            return int(payload)
+        if kind == b'$':
+            length = int(payload)
+            if length == -1:
+                return None
+            data = reader.read(length + 2)
+            return data[:-2]
+        if kind == b'*':
+            count = int(payload)
+            return None if count == -1 else [RedisStore._read_reply(reader) for _ in range(count)]
+        raise RespError(f"Unexpected reply: {line!r}")
+
+    def _roundtrip(self, conn, *args):
+        conn[0].sendall(self._encode(*args))
+        return self._read_reply(conn[1])
+
+    def execute(self, *args):
+        """Sends one command, reconnecting once if the connection went stale."""
+        for attempt in (1, 2):
+            try:
+                return self._roundtrip(self._connection(), *args)
+            except (ConnectionError, OSError):
+                self._reset()
+                if attempt == 2:
+                    raise
+
+    def get(self, key):
+        return self.execute('GET', self.key_prefix + key)
+
+    def set(self, key, value, ttl_seconds):
+        self.execute('SET', self.key_prefix + key, value, 'EX', str(max(1, int(ttl_seconds))))
+
+    def delete(self, key):
+        self.execute('DEL', self.key_prefix + key)
+
+
+# --- Session interface for the server-side stores ---
+
+class ServerSideSession(CallbackDict, SessionMixin):
+    def __init__(self, initial=None, sid=None, new=False):
+        def on_update(self):
+            self.modified = True
+        CallbackDict.__init__(self, initial, on_update)
+        self.sid = sid
+        self.new = new
+        self.modified = False
+
+
+class StoreSessionInterface(SessionInterface):
+    """Keeps sessions in a MemoryStore/RedisStore under a random id held in the cookie."""
+
+    serializer = session_json_serializer
+    session_class = ServerSideSession
+
+    def __init__(self, store, lifetime=DEFAULT_SESSION_LIFETIME):
+        self.store = store
+        self.lifetime = lifetime
+
+    @staticmethod
+    def _new_sid():
+        return secrets.token_urlsafe(32)
+
+    def open_session(self, app, request):
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if sid:
+            raw = self.store.get(sid)
+            if raw is not None:
+                try:
+                    data = self.serializer.loads(raw.decode() if isinstance(raw, bytes) else raw)
+                    return self.session_class(data, sid=sid)
+                except ValueError:
+                    pass
+        return self.session_class(sid=self._new_sid(), new=True)
+
+    def save_session(self, app, session, response):
+        cookie_name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        if not session:
+            if session.modified and not session.new:
+                self.store.delete(session.sid)
+                response.delete_cookie(cookie_name, domain=domain, path=path)
+            return
+        if not (session.modified or session.new or self.should_set_cookie(app, session)):
+            return
+        # Sessions only touched by reads are not rewritten
+        if session.modified or session.new:
+            ttl = self.lifetime.total_seconds()
+            self.store.set(session.sid, self.serializer.dumps(dict(session)), ttl)
+        response.set_cookie(cookie_name, session.sid,
+                            expires=self.get_expiration_time(app, session),
+                            httponly=self.get_cookie_httponly(app),
+                            domain=domain, path=path,
+                            secure=self.get_cookie_secure(app),
+                            samesite=self.get_cookie_samesite(app))
+
+
+# --- Expired file sweeper for the filesystem backend ---
+
+def sweep_expired_session_files(directory, max_age_seconds, now=None):
+    """Deletes expired Flask-Session/cachelib files in ``directory``. Returns how many were removed.
+
+    A file is expired when its cachelib expiry header has passed or, for files
+    without one, when it has not been written for ``max_age_seconds``.
+    """
+    now = now or time.time()
+    removed = 0
+    try:
+        names = os.listdir(directory)
+    except FileNotFoundError:
+        return 0
+    for name in names:
+        if name.startswith('__wz_cache'): # cachelib's entry counter
+            continue
+        path = os.path.join(directory, name)
+        try:
+            with open(path, 'rb') as f:
+                header = f.read(4)
+            expires_at = struct.unpack('I', header)[0] if len(header) == 4 else 0
+            if expires_at:
+                expired = expires_at < now
+            else:
+                expired = now - os.path.getmtime(path) > max_age_seconds
+            if expired:
+                os.remove(path)
+                removed += 1
+        except (FileNotFoundError, IsADirectoryError, PermissionError):
+            continue
+    return removed
+
+
+class SessionFileSweeper(threading.Thread):
+    """Daemon thread that runs sweep_expired_session_files() every ``interval`` seconds."""
+
+    def __init__(self, directory, max_age_seconds, interval=600):
+        super().__init__(name='session-file-sweeper', daemon=True)
+        self.directory = directory
+        self.max_age_seconds = max_age_seconds
+        self.interval = interval
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            try:
+                removed = sweep_expired_session_files(self.directory, self.max_age_seconds)
+                if removed:
+                    print(f"Session sweeper removed {removed} expired session files")
+            except OSError as err:
+                print(f"Session sweeper error: {err}")
+
+    def stop(self):
+        self._stop_event.set()
+
+
+# --- Wiring ---
+
+class PerProcessSessionInterface(SessionInterface):
+    """Creates the real session interface with ``build()`` on first use in each process.
+
+    A pre-fork server imports the app in its master and forks the workers: a
+    sweeper thread started there would not run in any of them, and a Redis
+    socket opened there would be shared by all of them.
+    """
+
+    def __init__(self, build):
+        self._build = build
+        self._lock = threading.Lock()
+        self._pid = None
+        self._interface = None
+
+    @property
+    def interface(self):
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._interface = self._build()
+                    self._pid = os.getpid()
+        return self._interface
+
+    def open_session(self, app, request):
+        return self.interface.open_session(app, request)
+
+    def save_session(self, app, session, response):
+        return self.interface.save_session(app, session, response)
+
+    def make_null_session(self, app):
+        return self.interface.make_null_session(app)
+
+    def is_null_session(self, obj):
+        return self.interface.is_null_session(obj)
+
+
+def init_session(app):
+    """Installs the session backend named by app.config['SESSION_BACKEND'] (default 'filesystem').
+
+    Each process builds the backend when it first opens a session.
+    """
+    backend = app.config.setdefault('SESSION_BACKEND', 'filesystem')
+    if backend not in SESSION_BACKENDS:
+        raise ValueError(f"Unknown SESSION_BACKEND {backend!r}; expected one of {', '.join(SESSION_BACKENDS)}")
+    app.session_interface = PerProcessSessionInterface(lambda: build_session_interface(app, backend))
+    return app.session_interface
+
+
+def build_session_interface(app, backend):
+    """A new session interface for ``backend``, starting its sweeper thread if it has one."""
+    lifetime = app.config.get('SESSION_LIFETIME', DEFAULT_SESSION_LIFETIME) # memory/redis expiry
+    if backend == 'filesystem':
+        from flask_session import Session
+        app.config.setdefault('SESSION_TYPE', 'filesystem')
+        # What Session(app) would install, without replacing app.session_interface
+        interface = Session()._get_interface(app)
+        # Flask-Session stamps each file with PERMANENT_SESSION_LIFETIME; files are never removed otherwise
+        directory = app.config.get('SESSION_FILE_DIR') or os.path.join(os.getcwd(), 'flask_session')
+        interval = app.config.get('SESSION_SWEEP_INTERVAL', 600)
+        if interval:
+            max_age = app.config['PERMANENT_SESSION_LIFETIME'].total_seconds()
+            sweeper = SessionFileSweeper(directory, max_age, interval)
+            sweeper.start()
+            app.extensions['session_sweeper'] = sweeper
+        return interface
+    if backend == 'cookie':
+        # Flask's default: itsdangerous-signed, zlib-compressed when that is smaller
+        from flask.sessions import SecureCookieSessionInterface
+        return SecureCookieSessionInterface()
+    if backend == 'memory':
+        return StoreSessionInterface(MemoryStore(), lifetime)
+    store = RedisStore(app.config.get('SESSION_REDIS_URL', 'redis://localhost:6379/0'),
+                       key_prefix=app.config.get('SESSION_KEY_PREFIX', 'session:'))
+    return StoreSessionInterface(store, lifetime)
@@ -0,0 +1,350 @@
+"""SQLite stand-in for the MySQL database, for benchmarks and local runs.
+
+``connect(path)`` returns an object with the subset of the
+mysql.connector connection/cursor API that app.py uses: ``%s`` parameters,
+``cursor(dictionary=True)``, ``fetchone/fetchmany/fetchall``, ``commit``,
+``rollback``, ``ping``, ``is_connected``. The few MySQL-only bits of SQL the
+app issues (``INSERT IGNORE``, ``FOR UPDATE [SKIP LOCKED]``, ``ON
+DUPLICATE KEY UPDATE``, ``LEAST``, and ``SHOW REPLICA STATUS``, which never
+finds replication running) are rewritten, and SQLite errors are re-raised as
+``mysql.connector`` errors so the routes' existing
+``except mysql.connector.Error`` handling applies.
+
+``connect(path, latency=...)`` sleeps that many seconds in every
+``execute`` to stand in for the round trip to a database server, and
+``connect_async`` returns the same connection with the awaitable API of
+``mysql.connector.aio`` (the SQLite work itself runs inline; only the
+simulated round trip is awaited) for the async pool in asgi.py.
+
+It is a stand-in, not an emulator: use it to exercise the app without a
+MySQL server, and compare absolute numbers only between runs on the same
+backend.
+"""
+import asyncio
+import re
+import sqlite3
+import time
+from datetime import date, datetime
+from decimal import Decimal
+
+import mysql.connector
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    username VARCHAR(50) NOT NULL UNIQUE,
+    password_hash VARCHAR(255) NOT NULL,
+    email VARCHAR(100) NOT NULL UNIQUE,
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+);
+CREATE TABLE IF NOT EXISTS journeys (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    origin VARCHAR(100) NOT NULL,
+    destination VARCHAR(100) NOT NULL,
+    mode VARCHAR(50) NOT NULL,
+    price DECIMAL(10, 2) NOT NULL,
+    duration VARCHAR(50),
+    carbon_footprint VARCHAR(50),
+    description TEXT,
+    co2_kg DECIMAL(10, 3),
+    duration_minutes SMALLINT,
+    source VARCHAR(50),
+    external_ref VARCHAR(191),
+    seat_capacity SMALLINT,
+    UNIQUE (source, external_ref)
+);
+CREATE TABLE IF NOT EXISTS bookings (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL,
+    journey_id INTEGER NOT NULL,
+    passengers INTEGER NOT NULL DEFAULT 1,
+    total_price DECIMAL(10, 2) NOT NULL,
+    booking_date DATETIME,
+    booked_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    payment_method VARCHAR(50),
+    payment_status VARCHAR(20),
+    transaction_id VARCHAR(50) UNIQUE,
+    journey_type VARCHAR(10) NOT NULL DEFAULT 'one_way'
+);
+CREATE TABLE IF NOT EXISTS user_travel_stats (
+    user_id INTEGER PRIMARY KEY,
+    past_trips INTEGER NOT NULL DEFAULT 0,
+    past_co2_kg DECIMAL(14, 3) NOT NULL DEFAULT 0,
+    past_spend DECIMAL(14, 2) NOT NULL DEFAULT 0,
+    settled_through DATE NOT NULL,
+    updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+);
+CREATE TABLE IF NOT EXISTS dataset_versions (
+    name VARCHAR(50) PRIMARY KEY,
+    version INTEGER NOT NULL DEFAULT 0,
+    updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+);
+CREATE TABLE IF NOT EXISTS journey_inventory (
+    journey_id INTEGER NOT NULL,
+    travel_date DATE NOT NULL,
+    capacity INTEGER NOT NULL,
+    seats_left INTEGER NOT NULL,
+    PRIMARY KEY (journey_id, travel_date)
+);
+CREATE TABLE IF NOT EXISTS seat_holds (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    hold_token CHAR(32) NOT NULL UNIQUE,
+    journey_id INTEGER NOT NULL,
+    travel_date DATE NOT NULL,
+    seats INTEGER NOT NULL,
+    expires_at DATETIME NOT NULL
+);
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind VARCHAR(50) NOT NULL,
+    payload TEXT NOT NULL,
+    status VARCHAR(10) NOT NULL DEFAULT 'queued',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    run_at DATETIME NOT NULL,
+    created_at DATETIME NOT NULL,
+    last_error VARCHAR(500)
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_status_run_at ON jobs (status, run_at);
+CREATE INDEX IF NOT EXISTS idx_seat_holds_expires ON seat_holds (expires_at);
+CREATE INDEX IF NOT EXISTS idx_bookings_journey_date ON bookings (journey_id, booking_date);
+CREATE INDEX IF NOT EXISTS idx_journeys_route ON journeys (origin, destination, mode);
+CREATE INDEX IF NOT EXISTS idx_journeys_route_price ON journeys (origin, destination, price);
+CREATE INDEX IF NOT EXISTS idx_journeys_route_duration ON journeys (origin, destination, duration_minutes);
+CREATE INDEX IF NOT EXISTS idx_journeys_route_co2 ON journeys (origin, destination, co2_kg);
+CREATE INDEX IF NOT EXISTS idx_bookings_user_date ON bookings (user_id, booking_date);
+CREATE INDEX IF NOT EXISTS idx_bookings_txn_user ON bookings (transaction_id, user_id);
+"""
+
+
+def _convert_datetime(value):
+    text = value.decode()
+    for fmt in ('%Y-%m-%d %H:%M:%S.%f', '%Y-%m-%d %H:%M:%S', '%Y-%m-%d'):
+        try:
+            return datetime.strptime(text, fmt)
+        except ValueError:
+            continue
+    return text
+
+
+def _convert_date(value):
+    parsed = _convert_datetime(value)
+    return parsed.date() if isinstance(parsed, datetime) else parsed
+
+
+sqlite3.register_converter('DATETIME', _convert_datetime)
+sqlite3.register_converter('TIMESTAMP', _convert_datetime)
+sqlite3.register_converter('DATE', _convert_date)
+sqlite3.register_adapter(date, lambda d: d.isoformat())
+sqlite3.register_adapter(datetime, lambda d: d.isoformat(' '))
+sqlite3.register_adapter(Decimal, str)
+
+_REWRITES = [
+    (re.compile(r'%s'), '?'),
+    (re.compile(r'\bINSERT\s+IGNORE\b', re.I), 'INSERT OR IGNORE'),
+    (re.compile(r'\s+FOR\s+UPDATE(\s+SKIP\s+LOCKED)?\b', re.I), ''),
+    (re.compile(r'\bLEAST\(', re.I), 'MIN('),
+    (re.compile(r'^\s*SHOW\s+REPLICA\s+STATUS\s*$', re.I), 'SELECT NULL AS Seconds_Behind_Source WHERE 0'),
+]
+_ON_DUPLICATE_RE = re.compile(r'\bON\s+DUPLICATE\s+KEY\s+UPDATE\b', re.I)
+_VALUES_FUNC_RE = re.compile(r'\bVALUES\((\w+)\)', re.I)
+
+
+def translate(sql):
+    """Rewrites the MySQL-specific SQL used by the app into SQLite syntax."""
+    for pattern, replacement in _REWRITES:
+        sql = pattern.sub(replacement, sql)
+    match = _ON_DUPLICATE_RE.search(sql)
+    if match:
+        # Upserts: ON DUPLICATE KEY UPDATE col = VALUES(col) -> ON CONFLICT DO UPDATE SET col = excluded.col
+        sql = (sql[:match.start()] + 'ON CONFLICT DO UPDATE SET'
+               + _VALUES_FUNC_RE.sub(r'excluded.\1', sql[match.end():]))
+    return sql
+
+
+def _translate_error(err):
+    if isinstance(err, sqlite3.IntegrityError):
+        return mysql.connector.errors.IntegrityError(msg=str(err))
+    if isinstance(err, sqlite3.OperationalError):
+        return mysql.connector.errors.OperationalError(msg=str(err))
+    return mysql.connector.errors.DatabaseError(msg=str(err))
+
+
+class StandInCursor:
+    def __init__(self, conn, dictionary=False, latency=0.0):
+        self._cursor = conn.cursor()
+        self._dictionary = dictionary
+        self._latency = latency
+
+    def execute(self, operation, params=()):
+        if self._latency:
+            time.sleep(self._latency)
+        try:
+            self._cursor.execute(translate(operation), tuple(params or ()))
+        except sqlite3.Error as err:
+            raise _translate_error(err) from err
+
+    def executemany(self, operation, seq_params):
+        if self._latency:
+            time.sleep(self._latency)
+        try:
+            self._cursor.executemany(translate(operation), [tuple(p) for p in seq_params])
+        except sqlite3.Error as err:
+            raise _translate_error(err) from err
+
+    @property
+    def column_names(self):
+        return tuple(col[0] for col in self._cursor.description or ())
+
+    @property
+    def description(self):
+        return self._cursor.description
+
+    def _row(self, row):
+        if row is None or not self._dictionary:
+            return row
+        return dict(zip(self.column_names, row))
+
+    def fetchone(self):
+        return self._row(self._cursor.fetchone())
+
+    def fetchmany(self, size=1):
+        return [self._row(row) for row in self._cursor.fetchmany(size)]
+
+    def fetchall(self):
+        return [self._row(row) for row in self._cursor.fetchall()]
+
+    def __iter__(self):
+        return iter(self.fetchone, None)
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    @property
+    def lastrowid(self):
+        return self._cursor.lastrowid
+
+    def close(self):
+        self._cursor.close()
+
+
+class StandInConnection:
+    unread_result = False
+
+    def __init__(self, path, timeout=30.0, latency=0.0):
+        self.latency = latency
+        self._conn = sqlite3.connect(path, timeout=timeout, check_same_thread=False,
+                                     detect_types=sqlite3.PARSE_DECLTYPES)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._open = True
+
+    def cursor(self, dictionary=False, **kwargs):
+        return StandInCursor(self._conn, dictionary=dictionary, latency=self.latency)
+
+    @property
+    def in_transaction(self):
+        return self._conn.in_transaction
+
+    def commit(self):
+        self._conn.commit()
+
+    def rollback(self):
+        self._conn.rollback()
+
+    def ping(self, reconnect=False, **kwargs):
+        if not self._open:
+            raise mysql.connector.errors.InterfaceError(msg="Connection is closed")
+
+    def is_connected(self):
+        return self._open
+
+    def close(self):
+        if self._open:
+            self._open = False
+            self._conn.close()
+
+
+class AsyncStandInCursor:
+    """A StandInCursor whose execute and fetch calls are awaited; the simulated latency is an asyncio sleep."""
+
+    def __init__(self, cursor, latency):
+        self._cursor = cursor
+        self._latency = latency
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    async def execute(self, operation, params=()):
+        if self._latency:
+            await asyncio.sleep(self._latency)
+        self._cursor.execute(operation, params)
+
+    async def executemany(self, operation, seq_params):
+        if self._latency:
+            await asyncio.sleep(self._latency)
+        self._cursor.executemany(operation, seq_params)
+
+    async def fetchone(self):
+        return self._cursor.fetchone()
+
+    async def fetchmany(self, size=1):
+        return self._cursor.fetchmany(size)
+
+    async def fetchall(self):
+        return self._cursor.fetchall()
+
+    async def close(self):
+        self._cursor.close()
+
+
+class AsyncStandInConnection:
+    """StandInConnection with the awaitable API of mysql.connector.aio connections."""
+
+    def __init__(self, conn):
+        self._conn = conn
+
+    @property
+    def unread_result(self):
+        return self._conn.unread_result
+
+    @property
+    def in_transaction(self):
+        return self._conn.in_transaction
+
+    async def cursor(self, dictionary=False, **kwargs):
+        # Latency goes on the async wrapper only, so the SQLite work itself never sleeps
+        return AsyncStandInCursor(StandInCursor(self._conn._conn, dictionary=dictionary), self._conn.latency)
+
+    async def commit(self):
+        self._conn.commit()
+
+    async def rollback(self):
+        self._conn.rollback()
+
+    async def ping(self, reconnect=False, **kwargs):
+        self._conn.ping(reconnect)
+
+    async def is_connected(self):
+        return self._conn.is_connected()
+
+    async def close(self):
+        self._conn.close()
+
+
+def connect(path, latency=0.0):
+    return StandInConnection(path, latency=latency)
+
+
+async def connect_async(path, latency=0.0):
+    return AsyncStandInConnection(StandInConnection(path, latency=latency))
+
+
+def create_schema(path):
+    """Creates the app's tables (as of the current migrations) in a SQLite file."""
+    conn = sqlite3.connect(path)
+    try:
+        conn.executescript(SCHEMA)
+        conn.commit()
+    finally:
+        conn.close()
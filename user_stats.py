@@ -0,0 +1,215 @@
+"""Incrementally maintained per-user travel stats for /account.
+
+``user_travel_stats`` holds, per user, the totals over non-cancelled bookings
+dated before ``settled_through``:
+
+* payment, cancel_booking and modify_booking call ``record_booking_change()``
+  inside their own transaction, so a booking and its effect on the totals
+  commit together;
+* ``read_user_stats()`` moves ``settled_through`` forward to today by
+  aggregating only the bookings that became past since the last read (an
+  index range scan on ``bookings(user_id, booking_date)``), then returns the
+  stored totals.
+
+A missing row starts at ``settled_through = 1000-01-01``, so the first read
+for a user aggregates their history once. ``python user_stats.py rebuild``
+recomputes rows from scratch; ``python user_stats.py check`` only reports
+mismatches.
+"""
+import argparse
+from datetime import date, datetime
+
+import mysql.connector
+
+from journey_metrics import journey_co2_kg
+
+MONEY_SAVED_RATE = 0.10 # Simulated saving per pound spent, as shown on /account
+EPOCH = date(1000, 1, 1)
+
+
+def to_date(value):
+    """Normalises a DATE/DATETIME column or 'YYYY-MM-DD' string to a date."""
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    if value is None:
+        return EPOCH
+    try:
+        return datetime.strptime(str(value)[:10], '%Y-%m-%d').date()
+    except ValueError:
+        return EPOCH
+
+
+def _lock_stats_row(cursor, user_id):
+    """Ensures the user's row exists and locks it for this transaction.
+
+    Returns (past_trips, past_co2_kg, past_spend, settled_through) as of the lock.
+    """
+    cursor.execute("INSERT IGNORE INTO user_travel_stats (user_id, settled_through) VALUES (%s, %s)",
+                   (user_id, EPOCH))
+    cursor.execute(
+        "SELECT past_trips, past_co2_kg, past_spend, settled_through FROM user_travel_stats"
+        " WHERE user_id = %s FOR UPDATE", (user_id,))
+    trips, co2, spend, settled_through = cursor.fetchone()
+    return int(trips), float(co2), float(spend), to_date(settled_through)
+
+
+def record_booking_change(conn, user_id, old=None, new=None):
+    """Applies one booking's change to the user's totals, inside the caller's open transaction on conn.
+
+    ``old`` and ``new`` are the booking's contribution before and after the
+    write as ``(booking_date, co2_kg, total_price)``, or None when it does not
+    count (not yet booked, or cancelled). Bookings dated on or after
+    settled_through are picked up later by read_user_stats().
+    """
+    cursor = conn.cursor()
+    try:
+        settled_through = _lock_stats_row(cursor, user_id)[3]
+        trips = 0
+        co2 = 0.0
+        spend = 0.0
+        for contribution, sign in ((old, -1), (new, 1)):
+            if contribution is None:
+                continue
+            booking_date, co2_kg, total_price = contribution
+            if to_date(booking_date) < settled_through:
+                trips += sign
+                co2 += sign * float(co2_kg)
+                spend += sign * float(total_price)
+        if trips or co2 or spend:
+            cursor.execute(
+                "UPDATE user_travel_stats SET past_trips = past_trips + %s, past_co2_kg = past_co2_kg + %s,"
+                " past_spend = past_spend + %s WHERE user_id = %s",
+                (trips, round(co2, 3), round(spend, 2), user_id))
+    finally:
+        cursor.close()
+
+
+def _aggregate(cursor, user_id, start, end):
+    """Totals of the user's non-cancelled bookings with start <= booking_date < end."""
+    cursor.execute(
+        "SELECT COUNT(*), SUM(COALESCE(j.co2_kg, 0)), SUM(b.total_price),"
+        " SUM(CASE WHEN j.co2_kg IS NULL THEN 1 ELSE 0 END)"
+        " FROM bookings b JOIN journeys j ON b.journey_id = j.id"
+        " WHERE b.user_id = %s AND b.booking_date >= %s AND b.booking_date < %s"
+        " AND b.payment_status <> 'cancelled'",
+        (user_id, start, end))
+    trips, co2, spend, missing_co2 = cursor.fetchone()
+    co2 = float(co2 or 0)
+    if missing_co2:
+        # Rows the co2_kg backfill has not reached yet: parse their text column
+        cursor.execute(
+            "SELECT j.carbon_footprint FROM bookings b JOIN journeys j ON b.journey_id = j.id"
+            " WHERE b.user_id = %s AND b.booking_date >= %s AND b.booking_date < %s"
+            " AND b.payment_status <> 'cancelled' AND j.co2_kg IS NULL",
+            (user_id, start, end))
+        co2 += sum(journey_co2_kg({'carbon_footprint': cf}) for (cf,) in cursor.fetchall())
+    return int(trips or 0), co2, float(spend or 0)
+
+
+def _as_totals(row):
+    trips, co2, spend = row
+    return {
+        'past_trips': int(trips),
+        'total_co2_saved': round(float(co2), 2),
+        'total_money_saved': round(float(spend) * MONEY_SAVED_RATE, 2),
+    }
+
+
+def read_user_stats(conn, user_id, today=None):
+    """Returns the user's totals, rolling settled_through forward to today first if needed."""
+    today = today or date.today()
+    cursor = conn.cursor()
+    try:
+        cursor.execute(
+            "SELECT past_trips, past_co2_kg, past_spend, settled_through FROM user_travel_stats WHERE user_id = %s",
+            (user_id,))
+        row = cursor.fetchone()
+        if row is not None and to_date(row[3]) >= today:
+            return _as_totals(row[:3])
+
+        # Bookings have become past since the last read: fold them in under the row lock
+        trips, co2, spend, settled_through = _lock_stats_row(cursor, user_id)
+        if settled_through < today:
+            new_trips, new_co2, new_spend = _aggregate(cursor, user_id, settled_through, today)
+            trips, co2, spend = trips + new_trips, co2 + new_co2, spend + new_spend
+            cursor.execute(
+                "UPDATE user_travel_stats SET past_trips = %s, past_co2_kg = %s, past_spend = %s,"
+                " settled_through = %s WHERE user_id = %s",
+                (trips, round(co2, 3), round(spend, 2), today, user_id))
+        conn.commit()
+        return _as_totals((trips, co2, spend))
+    except mysql.connector.Error:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+
+# --- Rebuild / check ---
+
+def rebuild(conn, user_ids=None, check_only=False, today=None):
+    """Recomputes stats from bookings for the given users (default: every user with bookings).
+
+    Returns the list of user ids whose stored totals did not match.
+    """
+    today = today or date.today()
+    cursor = conn.cursor()
+    mismatched = []
+    try:
+        if user_ids is None:
+            cursor.execute("SELECT DISTINCT user_id FROM bookings UNION SELECT user_id FROM user_travel_stats")
+            user_ids = sorted(user_id for (user_id,) in cursor.fetchall())
+        for user_id in user_ids:
+            expected = _aggregate(cursor, user_id, EPOCH, today)
+            cursor.execute(
+                "SELECT past_trips, past_co2_kg, past_spend, settled_through FROM user_travel_stats WHERE user_id = %s",
+                (user_id,))
+            row = cursor.fetchone()
+            if row is not None and to_date(row[3]) == today:
+                stored = (int(row[0]), float(row[1]), float(row[2]))
+                if stored[0] != expected[0] or abs(stored[1] - expected[1]) > 0.01 or abs(stored[2] - expected[2]) > 0.01:
+                    mismatched.append(user_id)
+                    print(f"user {user_id}: stored {stored} != recomputed {expected}")
+            elif row is not None:
+                # Not settled through today: compare what the next read would produce
+                pending = _aggregate(cursor, user_id, to_date(row[3]), today)
+                projected = (int(row[0]) + pending[0], float(row[1]) + pending[1], float(row[2]) + pending[2])
+                if projected[0] != expected[0] or abs(projected[1] - expected[1]) > 0.01 or abs(projected[2] - expected[2]) > 0.01:
+                    mismatched.append(user_id)
+                    print(f"user {user_id}: stored {projected} != recomputed {expected}")
+            if check_only:
+                continue
+            cursor.execute(
+                "REPLACE INTO user_travel_stats (user_id, past_trips, past_co2_kg, past_spend, settled_through)"
+                " VALUES (%s, %s, %s, %s, %s)",
+                (user_id, expected[0], round(expected[1], 3), round(expected[2], 2), today))
+            conn.commit()
+    finally:
+        cursor.close()
+    return mismatched
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild or check per-user travel stats")
+    sub = parser.add_subparsers(dest='command', required=True)
+    for name, help_text in (('rebuild', "recompute stats from bookings"), ('check', "report mismatches only")):
+        cmd = sub.add_parser(name, help=help_text)
+        cmd.add_argument('--user-id', type=int, action='append', help="limit to these users (repeatable)")
+    args = parser.parse_args()
+
+    from app import load_config
+    DB_CONFIG = load_config()['DB']
+    conn = mysql.connector.connect(**DB_CONFIG)
+    try:
+        mismatched = rebuild(conn, args.user_id, check_only=args.command == 'check')
+    finally:
+        conn.close()
+    print(f"{len(mismatched)} user(s) with mismatched stats")
+    if args.command == 'check' and mismatched:
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()